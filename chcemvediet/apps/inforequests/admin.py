@@ -5,7 +5,7 @@ from django.contrib import admin
 from poleno.utils.misc import decorate
 from poleno.utils.admin import simple_list_filter_factory, admin_obj_format
 
-from .models import Inforequest, InforequestDraft, InforequestEmail, Branch, Action
+from .models import Inforequest, InforequestDraft, InforequestEmail, Branch, Action, DeadlineEvent
 
 
 @admin.register(Inforequest, site=admin.site)
@@ -55,6 +55,7 @@ class InforequestAdmin(admin.ModelAdmin):
             u'-id',
             ]
     exclude = [
+            u'unique_email_key',
             ]
     readonly_fields = [
             ]
@@ -255,6 +256,9 @@ class ActionAdmin(admin.ModelAdmin):
     exclude = [
             ]
     readonly_fields = [
+            u'deadline_type',
+            u'deadline_date',
+            u'snooze_date',
             ]
     raw_id_fields = [
             u'branch',
@@ -268,3 +272,43 @@ class ActionAdmin(admin.ModelAdmin):
         queryset = queryset.select_related(u'branch')
         queryset = queryset.select_related(u'email')
         return queryset
+
+@admin.register(DeadlineEvent, site=admin.site)
+class DeadlineEventAdmin(admin.ModelAdmin):
+    date_hierarchy = u'due_date'
+    list_display = [
+            u'id',
+            decorate(
+                lambda o: admin_obj_format(o.branch),
+                short_description=u'Branch',
+                admin_order_field=u'branch',
+                ),
+            u'kind',
+            u'due_date',
+            ]
+    list_filter = [
+            u'kind',
+            u'due_date',
+            ]
+    search_fields = [
+            u'=id',
+            u'=branch__id',
+            ]
+    ordering = [
+            u'due_date',
+            u'id',
+            ]
+    exclude = [
+            ]
+    readonly_fields = [
+            ]
+    raw_id_fields = [
+            u'branch',
+            ]
+    inlines = [
+            ]
+
+    def get_queryset(self, request):
+        queryset = super(DeadlineEventAdmin, self).get_queryset(request)
+        queryset = queryset.select_related(u'branch')
+        return queryset
@@ -1,44 +1,52 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import datetime
 import traceback
+import collections
 
 from django.db import transaction
+from django.db.models import Q, F, Max
 from django.conf import settings
 
-from poleno.cron import cron_job, cron_logger
+from poleno.cron import cron_job, cron_logger, cron_dispatch, cron_count
 from poleno.workdays import workdays
 from poleno.utils.translation import translation
-from poleno.utils.date import local_date, local_today
+from poleno.utils.date import local_date, local_today, local_datetime_from_local
 from poleno.utils.misc import nop
 
-from .models import Inforequest, Branch, Action
+from .models import Inforequest, InforequestEmail, Branch, DeadlineEvent
+from .models.deadline import Deadline
 
 
-@cron_job(run_at_times=settings.CRON_USER_INTERACTION_TIMES)
-@transaction.atomic
-def undecided_email_reminder():
+# Number of inforequests loaded at once together with their related objects.
+CHUNK_SIZE = 100
+
+def _send_undecided_email_reminder(inforequest):
+    inforequest.send_undecided_email_reminder()
+    cron_logger.info(u'Sent undecided email reminder: {}'.format(inforequest))
+
+@cron_job(run_at_times=settings.CRON_USER_INTERACTION_TIMES,
+        shards=settings.CRON_INFOREQUEST_SHARDS)
+def undecided_email_reminder(shard):
     with translation(settings.LANGUAGE_CODE):
-        inforequests = (Inforequest.objects
+        # The newest undecided email is at least 5 WD old iff it was processed before the cutoff,
+        # the beginning of the day 5 WD before today. We send no more reminders if the last
+        # reminder was sent after the newest undecided email was processed.
+        cutoff = local_datetime_from_local(
+                workdays.advance(local_today(), -5) + datetime.timedelta(days=1))
+        filtered = (Inforequest.objects
                 .not_closed()
-                .with_undecided_email()
-                .prefetch_related(Inforequest.prefetch_newest_undecided_email())
+                .apply(shard.filter)
+                .filter(inforequestemail__type=InforequestEmail.TYPES.UNDECIDED)
+                .annotate(newest_undecided_email_processed=Max(
+                    u'inforequestemail__email__processed'))
+                .filter(newest_undecided_email_processed__lt=cutoff)
+                .filter(Q(last_undecided_email_reminder__isnull=True)
+                    | Q(last_undecided_email_reminder__lte=F(u'newest_undecided_email_processed')))
+                .values_list(u'pk', flat=True)
                 )
-
-        filtered = []
-        for inforequest in inforequests:
-            try:
-                email = inforequest.newest_undecided_email
-                last = inforequest.last_undecided_email_reminder
-                if last and last > email.processed:
-                    continue
-                days = workdays.between(local_date(email.processed), local_today())
-                if days < 5:
-                    continue
-                filtered.append(inforequest)
-            except Exception:
-                msg = u'Checking if undecided email reminder should be sent failed: {}\n{}'
-                trace = unicode(traceback.format_exc(), u'utf-8')
-                cron_logger.error(msg.format(inforequest, trace))
+        filtered = list(filtered)
+        cron_count(examined=len(filtered))
 
         if not filtered:
             return
@@ -49,191 +57,165 @@ def undecided_email_reminder():
                 .prefetch_related(Inforequest.prefetch_main_branch(None,
                     Branch.objects.select_related(u'historicalobligee')))
                 .prefetch_related(Inforequest.prefetch_newest_undecided_email())
-                .filter(pk__in=(o.pk for o in filtered))
+                .filter(pk__in=filtered)
                 )
-        for inforequest in filtered:
-            try:
-                with transaction.atomic():
-                    inforequest.send_undecided_email_reminder()
-                    cron_logger.info(u'Sent undecided email reminder: {}'.format(inforequest))
-            except Exception:
-                msg = u'Sending undecided email reminder failed: {}\n{}'
-                trace = unicode(traceback.format_exc(), u'utf-8')
-                cron_logger.error(msg.format(inforequest, trace))
-
-@cron_job(run_at_times=settings.CRON_USER_INTERACTION_TIMES)
-@transaction.atomic
-def obligee_deadline_reminder():
+        for chunk in filtered.chunks(CHUNK_SIZE):
+            cron_dispatch(chunk, _send_undecided_email_reminder,
+                    u'Sending undecided email reminder')
+
+def _close_inforequest(inforequest):
+    for branch in inforequest.branches:
+        branch.add_expiration_if_expired()
+    inforequest.closed = True
+    inforequest.save(update_fields=[u'closed'])
+    DeadlineEvent.objects.filter(branch__inforequest=inforequest).delete()
+    cron_logger.info(u'Closed inforequest: {}'.format(inforequest))
+
+def _add_expiration(branch):
+    # Saving the expiration action reschedules the events
+    branch.add_expiration_if_expired()
+    cron_logger.info(u'Added expiration action: {}'.format(branch))
+
+def _send_obligee_deadline_reminder(branch):
+    # Saving ``last_deadline_reminder`` reschedules the event
+    branch.inforequest.send_obligee_deadline_reminder(branch.last_action)
+    cron_logger.info(u'Sent obligee deadline reminder: {}'.format(branch.last_action))
+
+def _send_applicant_deadline_reminder(branch):
+    # Saving ``last_deadline_reminder`` removes the event
+    branch.inforequest.send_applicant_deadline_reminder(branch.last_action)
+    cron_logger.info(u'Sent applicant deadline reminder: {}'.format(branch.last_action))
+
+def _is_closable(inforequest):
+    for branch in inforequest.branches:
+        action = branch.last_action
+        if action.deadline and action.deadline.snooze_calendar_days_behind < 100:
+            return False
+    # Every branch that has a deadline have been missed for at least 100 CD.
+    return True
+
+def _is_expirable(action):
+    if not action.has_obligee_deadline_snooze_missed:
+        return False
+    # The last action obligee deadline was missed more than 8 calendar days ago. The applicant
+    # may snooze for at most 8 calendar days. So it's safe to add expiration now. The expiration
+    # action has 15 calendar days deadline of which about half is still left.
+    return action.deadline.calendar_days_behind > 8
+
+def _needs_obligee_deadline_reminder(action):
+    if not action.has_obligee_deadline_snooze_missed:
+        return False
+    # The last reminder was sent after the applicant snoozed for the last time iff the snooze was
+    # missed before the reminder was sent. We don't want to send any more reminders if the last
+    # reminder was sent after the last snooze.
+    last = action.last_deadline_reminder
+    if last and action.deadline.is_snooze_missed_at(local_date(last)):
+        return False
+    return True
+
+def _needs_applicant_deadline_reminder(action):
+    if not action.has_applicant_deadline:
+        return False
+    # The reminder is sent 2 CD before the deadline is missed.
+    if action.deadline.calendar_days_remaining > 2:
+        return False
+    # Applicant may not snooze his deadlines, so we send at most one applicant deadline reminder
+    # for the action.
+    if action.last_deadline_reminder:
+        return False
+    return True
+
+@cron_job(run_at_times=settings.CRON_USER_INTERACTION_TIMES,
+        shards=settings.CRON_INFOREQUEST_SHARDS)
+def deadline_sweep(shard):
+    u"""
+    Loads open inforequests with due deadline events together with their branches and last
+    actions in chunks and evaluates closures, expirations, obligee deadline reminders and
+    applicant deadline reminders against every chunk. Only then the work collected for the chunk
+    is done, every item in its own transaction. Closing an inforequest takes precedence over any
+    other work on it and adding an expiration over reminders for the branch. Reminders and
+    expirations wait while the inforequest has undecided emails. Inforequests may be split into
+    shards processed by multiple nodes.
+    """
     with translation(settings.LANGUAGE_CODE):
-        inforequests = (Inforequest.objects
+        events = (DeadlineEvent.objects
+                .filter(due_date__lte=local_today())
                 .not_closed()
-                .without_undecided_email()
-                .prefetch_related(Inforequest.prefetch_branches())
-                .prefetch_related(Branch.prefetch_last_action(u'branches'))
                 )
-
-        filtered = []
-        for inforequest in inforequests:
-            for branch in inforequest.branches:
-                action = branch.last_action
-                try:
-                    if not action.has_obligee_deadline_snooze_missed:
-                        continue
-                    # The last reminder was sent after the applicant snoozed for the last time iff
-                    # the snooze was missed before the reminder was sent. We don't want to send any
-                    # more reminders if the last reminder was sent after the last snooze.
-                    last = action.last_deadline_reminder
-                    last_date = local_date(last) if last else None
-                    if last and action.deadline.is_snooze_missed_at(last_date):
-                        continue
-                    filtered.append(branch)
-                except Exception:
-                    msg = u'Checking if obligee deadline reminder should be sent failed: {}\n{}'
-                    trace = unicode(traceback.format_exc(), u'utf-8')
-                    cron_logger.error(msg.format(action, trace))
-
-        if not filtered:
-            return
-
-        filtered = (Branch.objects
-                .select_related(u'inforequest__applicant')
-                .select_related(u'historicalobligee')
-                .prefetch_related(Branch.prefetch_last_action())
-                .filter(pk__in=(o.pk for o in filtered))
-                )
-        for branch in filtered:
-            try:
-                with transaction.atomic():
-                    branch.inforequest.send_obligee_deadline_reminder(branch.last_action)
-                    msg = u'Sent obligee deadline reminder: {}'
-                    cron_logger.info(msg.format(branch.last_action))
-            except Exception:
-                msg = u'Sending obligee deadline reminder failed: {}\n{}'
-                trace = unicode(traceback.format_exc(), u'utf-8')
-                cron_logger.error(msg.format(branch.last_action, trace))
-
-@cron_job(run_at_times=settings.CRON_USER_INTERACTION_TIMES)
-@transaction.atomic
-def applicant_deadline_reminder():
-    with translation(settings.LANGUAGE_CODE):
         inforequests = (Inforequest.objects
-                .not_closed()
-                .without_undecided_email()
-                .prefetch_related(Inforequest.prefetch_branches())
+                .apply(shard.filter)
+                .filter(pk__in=events.values(u'branch__inforequest'))
+                .select_related(u'applicant')
+                .select_undecided_emails_count()
+                .prefetch_related(Inforequest.prefetch_branches(None,
+                    Branch.objects.select_related(u'historicalobligee')))
                 .prefetch_related(Branch.prefetch_last_action(u'branches'))
                 )
 
-        filtered = []
-        for inforequest in inforequests:
-            for branch in inforequest.branches:
-                action = branch.last_action
+        calendar = workdays.Workdays()
+
+        # Inforequests are loaded and processed in chunks to keep the memory bounded.
+        for chunk in inforequests.chunks(CHUNK_SIZE):
+            cron_count(examined=len(chunk))
+            due = collections.defaultdict(set)
+            chunk_events = events.filter(branch__inforequest__in=chunk)
+            for branch_pk, kind in chunk_events.values_list(u'branch', u'kind'):
+                due[branch_pk].add(kind)
+
+            closures = []
+            expirations = []
+            obligee_reminders = []
+            applicant_reminders = []
+            outdated = []
+            for inforequest in chunk:
                 try:
-                    if not action.has_applicant_deadline:
+                    # Deadline dates of last actions of all branches are computed with the shared
+                    # workday calendar before they are checked below.
+                    Deadline.prefetch_dates([b.last_action for b in inforequest.branches], calendar)
+                    kinds = set(k for b in inforequest.branches for k in due[b.pk])
+                    if DeadlineEvent.KINDS.CLOSURE in kinds:
+                        if _is_closable(inforequest):
+                            closures.append(inforequest)
+                            continue
+                        # Closure events of all branches are due at the latest closure date of
+                        # the branches. So some of them must be outdated.
+                        outdated.append(inforequest)
+                    if inforequest.undecided_emails_count:
                         continue
-                    # The reminder is sent 2 CD before the deadline is missed.
-                    if action.deadline.calendar_days_remaining > 2:
-                        continue
-                    # Applicant may not snooze his deadlines, so we send at most one applicant
-                    # deadline reminder for the action.
-                    if action.last_deadline_reminder:
-                        continue
-                    filtered.append(branch)
+                    for branch in inforequest.branches:
+                        kinds = due[branch.pk]
+                        action = branch.last_action
+                        if DeadlineEvent.KINDS.EXPIRATION in kinds:
+                            if _is_expirable(action):
+                                expirations.append(branch)
+                                continue
+                            outdated.append(inforequest)
+                        if DeadlineEvent.KINDS.OBLIGEE_REMINDER in kinds:
+                            if _needs_obligee_deadline_reminder(action):
+                                obligee_reminders.append(branch)
+                            else:
+                                outdated.append(inforequest)
+                        if DeadlineEvent.KINDS.APPLICANT_REMINDER in kinds:
+                            if _needs_applicant_deadline_reminder(action):
+                                applicant_reminders.append(branch)
+                            else:
+                                outdated.append(inforequest)
                 except Exception:
-                    msg = u'Checking if applicant deadline reminder should be sent failed: {}\n{}'
+                    msg = u'Checking inforequest deadlines failed: {}\n{}'
                     trace = unicode(traceback.format_exc(), u'utf-8')
-                    cron_logger.error(msg.format(action, trace))
+                    cron_logger.error(msg.format(inforequest, trace))
 
-        if not filtered:
-            return
-
-        filtered = (Branch.objects
-                .select_related(u'inforequest__applicant')
-                .prefetch_related(Branch.prefetch_last_action())
-                .filter(pk__in=(o.pk for o in filtered))
-                )
-        for branch in filtered:
-            try:
-                with transaction.atomic():
-                    branch.inforequest.send_applicant_deadline_reminder(branch.last_action)
-                    msg = u'Sent applicant deadline reminder: {}'
-                    cron_logger.info(msg.format(branch.last_action))
-            except Exception:
-                msg = u'Sending applicant deadline reminder failed: {}\n{}'
-                trace = unicode(traceback.format_exc(), u'utf-8')
-                cron_logger.error(msg.format(branch.last_action, trace))
-
-@cron_job(run_at_times=settings.CRON_IMPORTANT_MAINTENANCE_TIMES)
-@transaction.atomic
-def close_inforequests():
-    inforequests = (Inforequest.objects
-            .not_closed()
-            .prefetch_related(Inforequest.prefetch_branches())
-            .prefetch_related(Branch.prefetch_last_action(u'branches'))
-            )
-
-    filtered = []
-    for inforequest in inforequests:
-        try:
-            for branch in inforequest.branches:
-                action = branch.last_action
-                if action.deadline and action.deadline.snooze_calendar_days_behind < 100:
-                    break
-            else:
-                # Every branch that has a deadline have been missed for at least 100 WD.
-                filtered.append(inforequest)
-        except Exception:
-            msg = u'Checking if inforequest should be closed failed: {}\n{}'
-            trace = unicode(traceback.format_exc(), u'utf-8')
-            cron_logger.error(msg.format(inforequest, trace))
-
-    for inforequest in filtered:
-        try:
-            with transaction.atomic():
-                for branch in inforequest.branches:
-                    branch.add_expiration_if_expired()
-                inforequest.closed = True
-                inforequest.save(update_fields=[u'closed'])
-                cron_logger.info(u'Closed inforequest: {}'.format(inforequest))
-        except Exception:
-            msg = u'Closing inforequest failed: {}\n{}'
-            trace = unicode(traceback.format_exc(), u'utf-8')
-            cron_logger.error(msg.format(inforequest, trace))
-
-@cron_job(run_at_times=settings.CRON_IMPORTANT_MAINTENANCE_TIMES)
-@transaction.atomic
-def add_expirations():
-    inforequests = (Inforequest.objects
-            .not_closed()
-            .without_undecided_email()
-            .prefetch_related(Inforequest.prefetch_branches())
-            .prefetch_related(Branch.prefetch_last_action(u'branches'))
-            )
-
-    filtered = []
-    for inforequest in inforequests:
-        for branch in inforequest.branches:
-            try:
-                action = branch.last_action
-                if not action.has_obligee_deadline_snooze_missed:
-                    continue
-                if action.deadline.calendar_days_behind <= 8:
-                    continue
-                # The last action obligee deadline was missed more than 8 calendar days ago. The
-                # applicant may snooze for at most 8 calendar days. So it's safe to add expiration
-                # now. The expiration action has 15 calendar days deadline of which about half is
-                # still left.
-                filtered.append(branch)
-            except Exception:
-                msg = u'Checking if expiration action should be added failed: {}\n{}'
-                trace = unicode(traceback.format_exc(), u'utf-8')
-                cron_logger.error(msg.format(branch, trace))
-
-    for branch in filtered:
-        try:
             with transaction.atomic():
-                branch.add_expiration_if_expired()
-                cron_logger.info(u'Added expiration action: {}'.format(branch))
-        except Exception:
-            msg = u'Adding expiration action failed: {}\n{}'
-            trace = unicode(traceback.format_exc(), u'utf-8')
-            cron_logger.error(msg.format(branch, trace))
+                for inforequest in set(outdated):
+                    DeadlineEvent.schedule(inforequest)
+
+            # Not in a transaction, as the work may be dispatched to multiple threads with their
+            # own database connections.
+            cron_dispatch(closures, _close_inforequest,
+                    u'Closing inforequest')
+            cron_dispatch(expirations, _add_expiration,
+                    u'Adding expiration action')
+            cron_dispatch(obligee_reminders, _send_obligee_deadline_reminder,
+                    u'Sending obligee deadline reminder')
+            cron_dispatch(applicant_reminders, _send_applicant_deadline_reminder,
+                    u'Sending applicant deadline reminder')
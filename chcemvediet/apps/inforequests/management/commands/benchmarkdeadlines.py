@@ -0,0 +1,166 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import random
+import datetime
+import timeit
+from optparse import make_option
+from dateutil.easter import easter
+
+from django.core.management.base import NoArgsCommand, CommandError
+
+from poleno.workdays import workdays
+from poleno.utils.date import local_today
+from poleno.utils.misc import Bunch, squeeze
+
+from chcemvediet.apps.inforequests.models.deadline import Deadline
+
+
+class Command(NoArgsCommand):
+    help = squeeze(u"""
+            Benchmarks ``poleno.workdays`` functions and ``Deadline`` evaluation on random
+            deadlines of 1 to 60 workdays concentrated around year boundaries and Easter. Prints
+            throughput numbers and fails if any result differs from the reference implementation.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--samples', action=u'store', type=u'int', dest=u'samples', default=10000,
+            help=u'Number of random samples to evaluate. Default: 10000'),
+        make_option(u'--repeat', action=u'store', type=u'int', dest=u'repeat', default=3,
+            help=u'Number of timed runs; the best one is reported. Default: 3'),
+        make_option(u'--seed', action=u'store', type=u'int', dest=u'seed', default=0,
+            help=u'Random seed, so the runs are comparable. Default: 0'),
+        )
+
+    def random_day(self, rnd, today):
+        u"""
+        Returns a random day within two years from ``today``. Two thirds of days are near a year
+        boundary or near Easter, as these are the periods with the most holidays.
+        """
+        year = today.year + rnd.randint(-2, 2)
+        region = rnd.randint(0, 2)
+        if region == 0:
+            center = datetime.date(year, 1, 1)
+        elif region == 1:
+            center = easter(year)
+        else:
+            center = datetime.date(year, 7, 1)
+            return center + datetime.timedelta(days=rnd.randint(-182, 182))
+        return center + datetime.timedelta(days=rnd.randint(-30, 30))
+
+    def samples(self, count, seed):
+        rnd = random.Random(seed)
+        today = local_today()
+        res = []
+        for i in range(count):
+            day = self.random_day(rnd, today)
+            res.append(Bunch(
+                    day=day,
+                    other=day + datetime.timedelta(days=rnd.randint(-90, 90)),
+                    delta=rnd.randint(1, 60) * rnd.choice([1, 1, 1, -1]),
+                    deadline=(
+                        rnd.choice([Deadline.TYPES.OBLIGEE_DEADLINE,
+                            Deadline.TYPES.APPLICANT_DEADLINE]),
+                        day,
+                        rnd.randint(1, 60),
+                        rnd.choice([Deadline.UNITS.CALENDAR_DAYS, Deadline.UNITS.WORKDAYS]),
+                        rnd.choice([None, day + datetime.timedelta(days=rnd.randint(0, 80))]),
+                        ),
+                    at=self.random_day(rnd, today),
+                    ))
+        return res
+
+    def evaluate_deadline(self, deadline):
+        return (
+                deadline.deadline_date,
+                deadline.snooze_date,
+                deadline.calendar_days_remaining,
+                deadline.workdays_remaining,
+                deadline.snooze_calendar_days_remaining,
+                deadline.snooze_workdays_remaining,
+                deadline.is_deadline_missed,
+                deadline.is_snooze_missed,
+                )
+
+    def evaluate_reference(self, args, at, holiday_set):
+        type, base_date, value, unit, snooze = args
+        if unit == Deadline.UNITS.CALENDAR_DAYS:
+            deadline_date = base_date + datetime.timedelta(days=value)
+        else:
+            deadline_date = workdays._advance(base_date, value, holiday_set)
+        snooze_date = max(snooze or deadline_date, deadline_date)
+        snooze_date = min(snooze_date, deadline_date + datetime.timedelta(days=8))
+        return (
+                deadline_date,
+                snooze_date,
+                (deadline_date - at).days,
+                workdays._between(at, deadline_date, holiday_set),
+                (snooze_date - at).days,
+                workdays._between(at, snooze_date, holiday_set),
+                deadline_date < at,
+                snooze_date < at,
+                )
+
+    def make_deadline(self, args, at):
+        deadline = Deadline(*args)
+        deadline._today = at
+        return deadline
+
+    def timed(self, name, func, count, repeat):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        rate = count / best if best else float(u'inf')
+        self.stdout.write(u'{:<24} {:>8} calls {:>10.4f} s {:>12.0f} calls/s'.format(
+                name, count, best, rate))
+        return func()
+
+    def compare(self, name, samples, results, expected):
+        for sample, result, reference in zip(samples, results, expected):
+            if result != reference:
+                raise CommandError(u'{} diverges from the reference for {}: {} != {}'.format(
+                        name, sample, result, reference))
+
+    def handle_noargs(self, **options):
+        count = options[u'samples']
+        repeat = options[u'repeat']
+        holiday_set = workdays.Workdays().holiday_set
+        samples = self.samples(count, options[u'seed'])
+
+        ref_between = self.timed(u'reference between', lambda: [
+                workdays._between(s.day, s.other, holiday_set) for s in samples], count, repeat)
+        res_between = self.timed(u'between', lambda: [
+                workdays.between(s.day, s.other) for s in samples], count, repeat)
+        calendar = workdays.Workdays()
+        res_bound_between = self.timed(u'Workdays.between', lambda: [
+                calendar.between(s.day, s.other) for s in samples], count, repeat)
+        self.compare(u'between', samples, res_between, ref_between)
+        self.compare(u'Workdays.between', samples, res_bound_between, ref_between)
+
+        ref_advance = self.timed(u'reference advance', lambda: [
+                workdays._advance(s.day, s.delta, holiday_set) for s in samples], count, repeat)
+        res_advance = self.timed(u'advance', lambda: [
+                workdays.advance(s.day, s.delta) for s in samples], count, repeat)
+        res_bound_advance = self.timed(u'Workdays.advance', lambda: [
+                calendar.advance(s.day, s.delta) for s in samples], count, repeat)
+        self.compare(u'advance', samples, res_advance, ref_advance)
+        self.compare(u'Workdays.advance', samples, res_bound_advance, ref_advance)
+
+        ref_deadline = self.timed(u'reference deadline', lambda: [
+                self.evaluate_reference(s.deadline, s.at, holiday_set) for s in samples],
+                count, repeat)
+        res_deadline = self.timed(u'Deadline', lambda: [
+                self.evaluate_deadline(self.make_deadline(s.deadline, s.at)) for s in samples],
+                count, repeat)
+        self.compare(u'Deadline', samples, res_deadline, ref_deadline)
+
+        # ``evaluate_many()`` evaluates all deadlines at the same date
+        at = local_today()
+        ref_many = [self.evaluate_reference(s.deadline, at, holiday_set) for s in samples]
+        res_many = self.timed(u'Deadline.evaluate_many', lambda: [
+                (r.deadline_date, r.snooze_date, r.calendar_days_remaining, r.workdays_remaining,
+                    r.snooze_calendar_days_remaining, r.snooze_workdays_remaining,
+                    r.is_deadline_missed, r.is_snooze_missed)
+                for r in Deadline.evaluate_many(
+                    [Bunch(deadline=self.make_deadline(s.deadline, at)) for s in samples], at)],
+                count, repeat)
+        self.compare(u'Deadline.evaluate_many', samples, res_many, ref_many)
+
+        self.stdout.write(u'All results match the reference implementation.')
@@ -0,0 +1,97 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import random
+import timeit
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import models, transaction
+
+from poleno.utils.date import local_today
+from poleno.utils.misc import squeeze
+
+from chcemvediet.apps.inforequests.models import Inforequest
+
+
+class Rollback(Exception):
+    pass
+
+class Command(NoArgsCommand):
+    help = squeeze(u"""
+            Benchmarks looking up inforequests of received emails by their unique email addresses.
+            Creates the given number of inforequests in a transaction that is rolled back at the
+            end, so the database is left intact. Compares case insensitive ``iexact`` lookups with
+            lookups by ``unique_email_key`` and fails if they find different inforequests.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--inforequests', action=u'store', type=u'int', dest=u'inforequests',
+            default=1000000,
+            help=u'Number of inforequests to create. Default: 1000000'),
+        make_option(u'--lookups', action=u'store', type=u'int', dest=u'lookups', default=100,
+            help=u'Number of addresses to look up. Default: 100'),
+        make_option(u'--repeat', action=u'store', type=u'int', dest=u'repeat', default=3,
+            help=u'Number of timed runs; the best one is reported. Default: 3'),
+        make_option(u'--seed', action=u'store', type=u'int', dest=u'seed', default=0,
+            help=u'Random seed, so the runs are comparable. Default: 0'),
+        )
+
+    def address(self, i):
+        return settings.INFOREQUEST_UNIQUE_EMAIL.format(token=u'bench{}'.format(i))
+
+    def create_inforequests(self, count, chunk_size=10000):
+        applicant = User.objects.create_user(username=u'benchmarkrouting')
+        today = local_today()
+        for first in range(0, count, chunk_size):
+            # ``Inforequest.save()`` generates random addresses one by one and forbids bulk
+            # create. We need known addresses and fast inserts, so we bypass it.
+            models.QuerySet(Inforequest).bulk_create([Inforequest(
+                    applicant=applicant,
+                    unique_email=self.address(i),
+                    unique_email_key=self.address(i).lower(),
+                    submission_date=today,
+                    ) for i in range(first, min(first + chunk_size, count))])
+
+    def addresses(self, count, lookups, seed):
+        u"""
+        Returns ``lookups`` random addresses in random case. Every tenth address is unknown.
+        """
+        rnd = random.Random(seed)
+        res = []
+        for i in range(lookups):
+            address = self.address(rnd.randrange(count) if i % 10 else count + i)
+            res.append(u''.join(c.upper() if rnd.random() < 0.5 else c for c in address))
+        return res
+
+    def timed(self, name, func, count, repeat):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        self.stdout.write(u'{:<28} {:>6} lookups {:>10.4f} s {:>10.3f} ms/lookup'.format(
+                name, count, best, 1000.0 * best / count if count else 0))
+        return func()
+
+    def benchmark(self, addresses, repeat):
+        count = len(addresses)
+        res_iexact = self.timed(u'unique_email__iexact', lambda: set(
+                i.pk for a in addresses
+                for i in Inforequest.objects.filter(unique_email__iexact=a)), count, repeat)
+        res_key = self.timed(u'unique_email_key', lambda: set(
+                i.pk for a in addresses
+                for i in Inforequest.objects.with_unique_emails([a])), count, repeat)
+        res_batch = self.timed(u'unique_email_key, batch', lambda: set(
+                i.pk for i in Inforequest.objects.with_unique_emails(addresses)), count, repeat)
+        if res_key != res_iexact or res_batch != res_iexact:
+            raise CommandError(u'Lookups by unique_email_key found different inforequests.')
+
+    def handle_noargs(self, **options):
+        count = options[u'inforequests']
+        addresses = self.addresses(count, options[u'lookups'], options[u'seed'])
+        try:
+            with transaction.atomic():
+                self.stdout.write(u'Creating {} inforequests...'.format(count))
+                self.create_inforequests(count)
+                self.benchmark(addresses, options[u'repeat'])
+                raise Rollback
+        except Rollback:
+            pass
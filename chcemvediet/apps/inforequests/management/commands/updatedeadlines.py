@@ -0,0 +1,65 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from poleno.utils.misc import squeeze
+
+from chcemvediet.apps.inforequests.models import Inforequest, Branch, Action, DeadlineEvent
+
+
+class Command(NoArgsCommand):
+    help = squeeze(u"""
+            Recomputes materialized deadline fields of all actions and reschedules deadline events
+            of all open inforequests. The fields and the events are backfilled by migrations, use
+            it to fix them if the data check reports they are invalid.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--dry-run', action=u'store_true', dest=u'dry_run', default=False,
+            help=u'Only report invalid materialized deadlines and events, do not fix them.'),
+        )
+
+    def handle_noargs(self, **options):
+        dry_run = options[u'dry_run']
+
+        checked = 0
+        updated = 0
+        for action in Action.objects.select_related(u'branch').order_by_pk().iterator():
+            checked += 1
+            expected = [getattr(action, f) for f in Action.DEADLINE_FIELDS]
+            action.update_deadline_fields()
+            if expected == [getattr(action, f) for f in Action.DEADLINE_FIELDS]:
+                continue
+            updated += 1
+            if not dry_run:
+                with transaction.atomic():
+                    action.save(update_fields=list(Action.DEADLINE_FIELDS))
+
+        self.stdout.write(u'Checked {} actions, {} {} invalid materialized deadlines.'.format(
+                checked, u'found' if dry_run else u'fixed', updated))
+
+        inforequests = (Inforequest.objects
+                .not_closed()
+                .prefetch_related(Inforequest.prefetch_branches())
+                .prefetch_related(Branch.prefetch_last_action(u'branches'))
+                .prefetch_related(u'branches__deadlineevent_set')
+                .order_by_pk()
+                )
+        checked = 0
+        updated = 0
+        for inforequest in inforequests.chunked(100):
+            checked += 1
+            expected = DeadlineEvent.expected_for(inforequest.branches)
+            if all(expected[b] == {e.kind: e.due_date for e in b.deadlineevent_set.all()}
+                    for b in inforequest.branches):
+                continue
+            updated += 1
+            if not dry_run:
+                with transaction.atomic():
+                    DeadlineEvent.schedule(inforequest)
+
+        self.stdout.write(u'Checked {} inforequests, {} {} invalid deadline events.'.format(
+                checked, u'found' if dry_run else u'fixed', updated))
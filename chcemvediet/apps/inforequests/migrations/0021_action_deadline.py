@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0020_inforequestdraft_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='action',
+            name='deadline_date',
+            field=models.DateField(help_text='Materialized ``Action.deadline.deadline_date``.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='deadline_type',
+            field=models.SmallIntegerField(help_text='Materialized type of ``Action.deadline``. 1 for obligee deadlines, 2 for applicant deadlines and NULL if the action has no deadline. Used to select actions with missed deadlines in the database.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='action',
+            name='snooze_date',
+            field=models.DateField(help_text='Materialized ``Action.deadline.snooze_date``.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='action',
+            index_together=set([('branch', 'created', 'id'), ('created', 'id'), ('deadline_type', 'snooze_date'), ('deadline_type', 'deadline_date')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import poleno.utils.misc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0021_action_deadline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadlineEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.SmallIntegerField(help_text='The cron job the event is for: "Obligee Deadline Reminder" for ``cron.obligee_deadline_reminder``, "Applicant Deadline Reminder" for ``cron.applicant_deadline_reminder``, "Expiration" for ``cron.add_expirations`` and "Closure" for ``cron.close_inforequests``.', choices=[(1, 'Obligee Deadline Reminder'), (2, 'Applicant Deadline Reminder'), (3, 'Expiration'), (4, 'Closure')])),
+                ('due_date', models.DateField(help_text='The first date the cron job should process the branch. Computed from materialized deadline of the branch last action.')),
+                ('branch', models.ForeignKey(to='inforequests.Branch', db_index=False)),
+            ],
+            options={
+            },
+            bases=(poleno.utils.misc.FormatMixin, models.Model),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deadlineevent',
+            unique_together=set([('branch', 'kind')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='deadlineevent',
+            index_together=set([('kind', 'due_date')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0022_deadlineevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deadlineevent',
+            name='due_date',
+            field=models.DateField(help_text='The first date ``cron.deadline_sweep`` should evaluate the rule set for the branch. Computed from materialized deadline of the branch last action.'),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='deadlineevent',
+            name='kind',
+            field=models.SmallIntegerField(help_text='The rule set of ``cron.deadline_sweep`` the event is for: "Obligee Deadline Reminder", "Applicant Deadline Reminder", "Expiration" or "Closure".', choices=[(1, 'Obligee Deadline Reminder'), (2, 'Applicant Deadline Reminder'), (3, 'Expiration'), (4, 'Closure')]),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0023_deadlineevent_help_texts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inforequest',
+            name='unique_email_key',
+            field=models.CharField(default='', help_text="Lower case ``unique_email`` used to look up inforequests of received emails. Email addresses are case insensitive, but case insensitive lookups can't use the unique index on ``unique_email``.", max_length=255),
+            preserve_default=False,
+        ),
+    ]
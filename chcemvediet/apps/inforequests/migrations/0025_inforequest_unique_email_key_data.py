@@ -0,0 +1,29 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def forward(apps, schema_editor):
+    # A single update query, as there may be too many inforequests to update them one by one.
+    Inforequest = apps.get_model(u'inforequests', u'Inforequest')
+    schema_editor.execute(u'UPDATE {table} SET {key} = LOWER({email})'.format(
+            table=schema_editor.quote_name(Inforequest._meta.db_table),
+            key=schema_editor.quote_name(u'unique_email_key'),
+            email=schema_editor.quote_name(u'unique_email'),
+            ))
+
+def backward(apps, schema_editor):
+    # The column is dropped by the previous migration.
+    pass
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0024_inforequest_unique_email_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
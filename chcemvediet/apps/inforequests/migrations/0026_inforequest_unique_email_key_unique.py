@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0025_inforequest_unique_email_key_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inforequest',
+            name='unique_email_key',
+            field=models.CharField(help_text="Lower case ``unique_email`` used to look up inforequests of received emails. Email addresses are case insensitive, but case insensitive lookups can't use the unique index on ``unique_email``.", unique=True, max_length=255),
+            preserve_default=True,
+        ),
+    ]
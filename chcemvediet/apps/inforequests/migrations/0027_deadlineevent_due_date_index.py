@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0026_inforequest_unique_email_key_unique'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='deadlineevent',
+            index_together=set([]),
+        ),
+        migrations.AlterField(
+            model_name='deadlineevent',
+            name='due_date',
+            field=models.DateField(help_text='The first date ``cron.deadline_sweep`` should evaluate the rule set for the branch. Computed from materialized deadline of the branch last action.', db_index=True),
+            preserve_default=True,
+        ),
+    ]
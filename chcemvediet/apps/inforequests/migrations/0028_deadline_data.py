@@ -0,0 +1,38 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def forward(apps, schema_editor):
+    # Deadlines are computed by model methods historical models do not have, so we use the
+    # current models. They match the schema, as this is the last migration touching the tables.
+    # Actions are updated by queries, so saving them does not reschedule deadline events of
+    # their inforequests over and over again.
+    from chcemvediet.apps.inforequests.models import Inforequest, Action, DeadlineEvent
+
+    actions = Action.objects.select_related(u'branch')
+    for action in actions.chunked(100):
+        action.update_deadline_fields()
+        Action.objects.filter(pk=action.pk).update(
+                **{f: getattr(action, f) for f in Action.DEADLINE_FIELDS})
+
+    # The deadline sweep looks only at due events, so open inforequests have no reminders,
+    # expirations nor closures until their events are scheduled.
+    for inforequest in Inforequest.objects.not_closed().chunked(100):
+        DeadlineEvent.schedule(inforequest)
+
+def backward(apps, schema_editor):
+    # The columns and the table are dropped by the previous migrations.
+    pass
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inforequests', '0027_deadlineevent_due_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, backward),
+    ]
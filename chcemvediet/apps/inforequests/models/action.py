@@ -3,7 +3,7 @@
 from email.utils import formataddr
 
 from django.core.mail import EmailMessage
-from django.db import models
+from django.db import models, connection
 from django.db.models import Prefetch, Q, F
 from django.utils.translation import ugettext_lazy as _
 from django.utils.functional import cached_property
@@ -72,9 +72,37 @@ class ActionQuerySet(QuerySet):
     def order_by_created(self):
         return self.order_by(u'created', u'pk')
     def before(self, other):
+        if other.pk is None:
+            # Unsaved action will get a greater ``pk`` than any existing action
+            return self.filter(created__lte=other.created)
         return self.filter(Q(created__lt=other.created) | Q(created=other.created, pk__lt=other.pk))
     def after(self, other):
         return self.filter(Q(created__gt=other.created) | Q(created=other.created, pk__gt=other.pk))
+    def last_in_branch(self):
+        u"""
+        Filters only the last action of every branch.
+        """
+        quote_name = connection.ops.quote_name
+        return self.extra(where=[
+            u'{action}.{pk} = ('
+                u'SELECT p.{pk} '
+                u'FROM {action} p '
+                u'WHERE p.{branch} = {action}.{branch} '
+                u'ORDER BY p.{created} DESC, p.{pk} DESC '
+                u'LIMIT 1'
+            u')'.format(
+                action = quote_name(Action._meta.db_table),
+                pk = quote_name(Action._meta.pk.column),
+                branch = quote_name(Action._meta.get_field(u'branch').column),
+                created = quote_name(Action._meta.get_field(u'created').column),
+                )
+            ])
+
+    # Materialized deadlines
+    def with_obligee_deadline(self):
+        return self.filter(deadline_type=Deadline.TYPES.OBLIGEE_DEADLINE)
+    def with_applicant_deadline(self):
+        return self.filter(deadline_type=Deadline.TYPES.APPLICANT_DEADLINE)
 
 class Action(FormatMixin, models.Model):
     # NOT NULL
@@ -256,9 +284,22 @@ class Action(FormatMixin, models.Model):
                 that the obligee did not provide any reason.
                 """))
 
-    # May be NULL; Used by ``cron.obligee_deadline_reminder`` and ``cron.applicant_deadline_reminder``
+    # May be NULL; Used by ``cron.deadline_sweep``
     last_deadline_reminder = models.DateTimeField(blank=True, null=True)
 
+    # NULL for actions without deadline; NOT NULL otherwise; Read-only; Automaticly computed in
+    # save() whenever any field the deadline depends on is saved.
+    deadline_type = models.SmallIntegerField(blank=True, null=True,
+            help_text=squeeze(u"""
+                Materialized type of ``Action.deadline``. 1 for obligee deadlines, 2 for applicant
+                deadlines and NULL if the action has no deadline. Used to select actions with
+                missed deadlines in the database.
+                """))
+    deadline_date = models.DateField(blank=True, null=True,
+            help_text=u'Materialized ``Action.deadline.deadline_date``.')
+    snooze_date = models.DateField(blank=True, null=True,
+            help_text=u'Materialized ``Action.deadline.snooze_date``.')
+
     # Backward relations:
     #
     #  -- advanced_to_set: by Branch.advanced_by
@@ -274,15 +315,40 @@ class Action(FormatMixin, models.Model):
     #     May raise DoesNotExist
 
     # Indexes:
-    #  -- branch:      ForeignKey
-    #  -- email:       OneToOneField
-    #  -- created, id: index_together
+    #  -- branch:                      ForeignKey
+    #  -- email:                       OneToOneField
+    #  -- created, id:                 index_together
+    #  -- branch, created, id:         index_together
+    #  -- deadline_type, deadline_date: index_together
+    #  -- deadline_type, snooze_date:   index_together
 
     objects = ActionQuerySet.as_manager()
 
+    # Fields ``Action.deadline`` depends on. Materialized deadline is recomputed whenever any of
+    # them is saved.
+    DEADLINE_DEPENDENCIES = [
+            u'branch',
+            u'type',
+            u'created',
+            u'sent_date',
+            u'delivered_date',
+            u'legal_date',
+            u'extension',
+            u'snooze',
+            u'disclosure_level',
+            ]
+    DEADLINE_FIELDS = [
+            u'deadline_type',
+            u'deadline_date',
+            u'snooze_date',
+            ]
+
     class Meta:
         index_together = [
                 [u'created', u'id'],
+                [u'branch', u'created', u'id'],
+                [u'deadline_type', u'deadline_date'],
+                [u'deadline_type', u'snooze_date'],
                 ]
 
     @staticmethod
@@ -468,6 +534,52 @@ class Action(FormatMixin, models.Model):
 
         return action
 
+    def update_deadline_fields(self):
+        u"""
+        Recomputes materialized deadline fields from ``Action.deadline``. Does not save them.
+        """
+        self.__dict__.pop(u'previous_action', None)
+        self.__dict__.pop(u'deadline', None)
+        deadline = self.deadline
+        if deadline is None:
+            self.deadline_type = None
+            self.deadline_date = None
+            self.snooze_date = None
+        else:
+            self.deadline_type = deadline.type
+            self.deadline_date = deadline.deadline_date
+            self.snooze_date = deadline.snooze_date
+
+    @decorate(prevent_bulk_create=True)
+    def save(self, *args, **kwargs):
+        # The caller's ``update_fields`` may be any iterable, so we don't modify it in place.
+        update_fields = kwargs.get(u'update_fields', None)
+        if update_fields is not None:
+            update_fields = kwargs[u'update_fields'] = list(update_fields)
+        update_deadline = update_fields is None or any(f in update_fields
+                for f in self.DEADLINE_DEPENDENCIES + self.DEADLINE_FIELDS)
+
+        # Recompute materialized deadline if saving any field it depends on
+        if update_deadline:
+            self.update_deadline_fields()
+            if update_fields is not None:
+                kwargs[u'update_fields'] = update_fields + [f for f in self.DEADLINE_FIELDS
+                        if f not in update_fields]
+
+        super(Action, self).save(*args, **kwargs)
+
+        # Confirmations and extensions inherit their deadlines from their previous actions
+        if update_deadline:
+            following = self.branch.action_set.order_by_created().after(self).first()
+            if following and following.type in [self.TYPES.CONFIRMATION, self.TYPES.EXTENSION]:
+                following.save(update_fields=list(self.DEADLINE_FIELDS))
+
+        # Reschedule deadline events if the branch last action may have changed. Closure events
+        # of other branches of the inforequest may depend on it as well.
+        if update_deadline or (update_fields is not None
+                and u'last_deadline_reminder' in update_fields):
+            DeadlineEvent.schedule(self.branch.inforequest)
+
     def get_extended_type_display(self):
         u"""
         Return a bit more verbose action type description. It is not based only on the action type.
@@ -539,7 +651,41 @@ def datachecks(superficial, autofix):
     for issue in issues:
         yield datacheck.Error(issue + u'.')
 
+@datacheck.register
+def deadline_datachecks(superficial, autofix):
+    u"""
+    Checks that materialized deadline fields of every ``Action`` match ``Action.deadline``.
+    Superficial check checks only the last actions of open inforequests.
+    """
+    actions = (Action.objects
+            .select_related(u'branch')
+            .order_by_pk()
+            )
+    if superficial:
+        actions = actions.last_in_branch().filter(branch__inforequest__closed=False)
+
+    issues = []
+    for action in actions:
+        expected = [getattr(action, f) for f in Action.DEADLINE_FIELDS]
+        action.update_deadline_fields()
+        computed = [getattr(action, f) for f in Action.DEADLINE_FIELDS]
+        if expected == computed:
+            continue
+        issues.append(u'{} has materialized deadline ({}) but its deadline is ({})'.format(
+                action, u', '.join(format(v) for v in expected),
+                u', '.join(format(v) for v in computed)))
+        if autofix:
+            action.save(update_fields=list(Action.DEADLINE_FIELDS))
+
+    if superficial and issues:
+        if len(issues) > 5:
+            issues[5:] = [u'More actions have invalid materialized deadlines']
+        issues = [u'; '.join(issues)]
+    for issue in issues:
+        yield datacheck.Error(issue + u'.', autofixable=True)
+
 # Must be after ``Action`` to break cyclic dependency
 from .deadline import Deadline
+from .deadlineevent import DeadlineEvent
 from .branch import Branch
 from .inforequestemail import InforequestEmail
@@ -1,6 +1,6 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
-from django.db import models, connection
+from django.db import models
 from django.db.models import Q, F, Prefetch
 from django.utils.functional import cached_property
 
@@ -130,21 +130,7 @@ class Branch(FormatMixin, models.Model):
         """
         if queryset is None:
             queryset = Action.objects.get_queryset()
-        quote_name = connection.ops.quote_name
-        queryset = queryset.extra(where=[
-            u'{action}.{pk} = ('
-                u'SELECT p.{pk} '
-                u'FROM {action} p '
-                u'WHERE p.{branch} = {action}.{branch} '
-                u'ORDER BY p.{created} DESC, p.{pk} DESC '
-                u'LIMIT 1'
-            u')'.format(
-                action = quote_name(Action._meta.db_table),
-                pk = quote_name(Action._meta.pk.column),
-                branch = quote_name(Action._meta.get_field(u'branch').column),
-                created = quote_name(Action._meta.get_field(u'created').column),
-                )
-            ])
+        queryset = queryset.last_in_branch()
         return Prefetch(join_lookup(path, u'action_set'), queryset, to_attr=u'_last_action')
 
     @cached_property
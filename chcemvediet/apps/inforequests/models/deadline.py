@@ -29,6 +29,59 @@ class Deadline(FormatMixin, object):
         self._snooze = snooze
         self._today = local_today()
 
+    @staticmethod
+    def prefetch_dates(actions, calendar=None):
+        u"""
+        Computes deadline and snooze dates of deadlines of ``actions`` with one shared workday
+        calendar and caches them on the deadlines, so their properties don't compute them again.
+        Pass the same ``calendar`` to multiple calls to share it among them. Actions that are
+        None or have no deadline are skipped.
+        """
+        if calendar is None:
+            calendar = workdays.Workdays()
+        for action in actions:
+            deadline = action.deadline if action is not None else None
+            if deadline is not None:
+                deadline_date = deadline._deadline_date_with(calendar)
+                deadline.__dict__[u'deadline_date'] = deadline_date
+                deadline.__dict__[u'snooze_date'] = deadline._snooze_date_for(deadline_date)
+
+    @staticmethod
+    def evaluate_many(actions, at=None):
+        u"""
+        Evaluates deadlines of many actions at once at date ``at``, today by default. Deadline and
+        snooze dates of all the actions are computed in a single pass with one shared workday
+        calendar, so we don't pay the calendar lookup for every action. The actions should be
+        prefetched with everything their deadlines depend on. Returns a list of ``Bunch`` objects
+        with deadline properties evaluated at ``at`` in the same order as ``actions``. The item is
+        None if the action has no deadline.
+        """
+        if at is None:
+            at = local_today()
+        calendar = workdays.Workdays()
+
+        res = []
+        for action in actions:
+            deadline = action.deadline
+            if deadline is None:
+                res.append(None)
+                continue
+            deadline_date = deadline._deadline_date_with(calendar)
+            snooze_date = deadline._snooze_date_for(deadline_date)
+            res.append(Bunch(
+                    action=action,
+                    deadline=deadline,
+                    deadline_date=deadline_date,
+                    snooze_date=snooze_date,
+                    calendar_days_remaining=(deadline_date - at).days,
+                    workdays_remaining=calendar.between(at, deadline_date),
+                    snooze_calendar_days_remaining=(snooze_date - at).days,
+                    snooze_workdays_remaining=calendar.between(at, snooze_date),
+                    is_deadline_missed=(deadline_date < at),
+                    is_snooze_missed=(snooze_date < at),
+                    ))
+        return res
+
     @property
     def is_obligee_deadline(self):
         return self.type == self.TYPES.OBLIGEE_DEADLINE
@@ -45,12 +98,16 @@ class Deadline(FormatMixin, object):
     def is_in_workdays(self):
         return self.unit == self.UNITS.WORKDAYS
 
-    @cached_property
-    def deadline_date(self):
+    def _deadline_date_with(self, calendar):
+        # ``calendar`` is ``workdays`` module or its ``Workdays`` instance.
         if self.is_in_calendar_days:
             return self.base_date + datetime.timedelta(days=self.value)
         else:
-            return workdays.advance(self.base_date, self.value)
+            return calendar.advance(self.base_date, self.value)
+
+    @cached_property
+    def deadline_date(self):
+        return self._deadline_date_with(workdays)
 
     @cached_property
     def calendar_days_passed(self):
@@ -101,12 +158,15 @@ class Deadline(FormatMixin, object):
     def is_deadline_missed_at(self, at):
         return self.deadline_date < at
 
+    def _snooze_date_for(self, deadline_date):
+        res = self._snooze or deadline_date
+        res = max(res, deadline_date)
+        res = min(res, deadline_date + datetime.timedelta(days=8))
+        return res
+
     @cached_property
     def snooze_date(self):
-        res = self._snooze or self.deadline_date
-        res = max(res, self.deadline_date)
-        res = min(res, self.deadline_date + datetime.timedelta(days=8))
-        return res
+        return self._snooze_date_for(self.deadline_date)
 
     @cached_property
     def is_snoozed(self):
@@ -0,0 +1,195 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.db import models
+
+from poleno import datacheck
+from poleno.utils.models import FieldChoices, QuerySet
+from poleno.utils.date import local_date, local_today
+from poleno.utils.misc import squeeze, FormatMixin
+
+
+class DeadlineEventQuerySet(QuerySet):
+    def due(self, kind, at=None):
+        at = at or local_today()
+        return self.filter(kind=kind, due_date__lte=at)
+    def not_closed(self):
+        return self.filter(branch__inforequest__closed=False)
+    def without_undecided_email(self):
+        return self.exclude(
+                branch__inforequest__inforequestemail__type=InforequestEmail.TYPES.UNDECIDED)
+    def order_by_pk(self):
+        return self.order_by(u'pk')
+    def order_by_due_date(self):
+        return self.order_by(u'due_date', u'pk')
+
+class DeadlineEvent(FormatMixin, models.Model):
+    # May NOT be NULL; Index is prefix of [branch, kind] unique index
+    branch = models.ForeignKey(u'Branch', db_index=False)
+
+    # May NOT be NULL
+    KINDS = FieldChoices(
+            (u'OBLIGEE_REMINDER',   1, u'Obligee Deadline Reminder'),
+            (u'APPLICANT_REMINDER', 2, u'Applicant Deadline Reminder'),
+            (u'EXPIRATION',         3, u'Expiration'),
+            (u'CLOSURE',            4, u'Closure'),
+            )
+    kind = models.SmallIntegerField(choices=KINDS._choices,
+            help_text=squeeze(u"""
+                The rule set of ``cron.deadline_sweep`` the event is for: "Obligee Deadline
+                Reminder", "Applicant Deadline Reminder", "Expiration" or "Closure".
+                """))
+
+    # May NOT be NULL; Indexed alone as the sweep looks up due events of all kinds at once
+    due_date = models.DateField(db_index=True,
+            help_text=squeeze(u"""
+                The first date ``cron.deadline_sweep`` should evaluate the rule set for the
+                branch. Computed from materialized deadline of the branch last action.
+                """))
+
+    # Backward relations added to other models:
+    #
+    #  -- Branch.deadlineevent_set
+    #     May be empty; Contains at most one event of every kind.
+
+    # Indexes:
+    #  -- branch, kind: unique_together
+    #  -- due_date:     index
+
+    objects = DeadlineEventQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [
+                [u'branch', u'kind'],
+                ]
+
+    @staticmethod
+    def closure_date_for(action):
+        u"""
+        Returns the date since which the branch with last action ``action`` does not prevent its
+        inforequest from being closed. Depends on materialized deadline fields of ``action``.
+        """
+        if action.deadline_type is None:
+            # Branches without deadline do not prevent the inforequest from being closed.
+            return local_date(action.created)
+        return action.snooze_date + datetime.timedelta(days=100)
+
+    @staticmethod
+    def expected_for(branches):
+        u"""
+        Returns a dict mapping ``branches`` to dicts mapping event kinds to due dates of events the
+        branches should have given their last actions. ``branches`` must be all branches of one
+        open inforequest. The dates match the conditions checked by ``cron.deadline_sweep``.
+        Depends on materialized deadline fields of the last actions, which may be prefetched with
+        ``Branch.prefetch_last_action()``.
+        """
+        res = {}
+        closure_date = None
+        for branch in branches:
+            action = branch.last_action
+            res[branch] = expected = {}
+            if action is None:
+                continue
+            if action.deadline_type == Deadline.TYPES.OBLIGEE_DEADLINE:
+                # We don't send any more reminders if the last reminder was sent after the last
+                # snooze. See ``cron.deadline_sweep``.
+                last = action.last_deadline_reminder
+                if not last or local_date(last) <= action.snooze_date:
+                    expected[DeadlineEvent.KINDS.OBLIGEE_REMINDER] = (
+                            action.snooze_date + datetime.timedelta(days=1))
+                expected[DeadlineEvent.KINDS.EXPIRATION] = max(
+                        action.snooze_date + datetime.timedelta(days=1),
+                        action.deadline_date + datetime.timedelta(days=9))
+            elif action.deadline_type == Deadline.TYPES.APPLICANT_DEADLINE:
+                # At most one applicant deadline reminder is sent for the action.
+                if not action.last_deadline_reminder:
+                    expected[DeadlineEvent.KINDS.APPLICANT_REMINDER] = (
+                            action.deadline_date - datetime.timedelta(days=2))
+            date = DeadlineEvent.closure_date_for(action)
+            if closure_date is None or date > closure_date:
+                closure_date = date
+
+        # The inforequest may be closed only if none of its branches prevents it, so closure
+        # events of all its branches are due at the latest closure date of the branches.
+        for branch, expected in res.items():
+            if branch.last_action is not None:
+                expected[DeadlineEvent.KINDS.CLOSURE] = closure_date
+        return res
+
+    @staticmethod
+    def schedule(inforequest):
+        u"""
+        Enqueues, reschedules or removes events of all branches of ``inforequest`` to match their
+        current last actions. Branches of closed inforequests have no events. Returns True if any
+        event was changed.
+        """
+        branches = list(inforequest.branch_set
+                .prefetch_related(Branch.prefetch_last_action())
+                .prefetch_related(u'deadlineevent_set')
+                .order_by_pk()
+                )
+        if inforequest.closed:
+            expected = {b: {} for b in branches}
+        else:
+            expected = DeadlineEvent.expected_for(branches)
+
+        changed = False
+        for branch in branches:
+            branch_expected = expected[branch]
+            for event in branch.deadlineevent_set.all():
+                due_date = branch_expected.pop(event.kind, None)
+                if due_date is None:
+                    event.delete()
+                    changed = True
+                elif due_date != event.due_date:
+                    event.due_date = due_date
+                    event.save(update_fields=[u'due_date'])
+                    changed = True
+            for kind, due_date in branch_expected.items():
+                DeadlineEvent.objects.create(branch=branch, kind=kind, due_date=due_date)
+                changed = True
+        return changed
+
+    def __unicode__(self):
+        return format(self.pk)
+
+@datacheck.register
+def datachecks(superficial, autofix):
+    u"""
+    Checks that every branch of open inforequests has events matching its last action.
+    """
+    inforequests = (Inforequest.objects
+            .not_closed()
+            .prefetch_related(Inforequest.prefetch_branches())
+            .prefetch_related(Branch.prefetch_last_action(u'branches'))
+            .prefetch_related(u'branches__deadlineevent_set')
+            .order_by_pk()
+            )
+
+    issues = []
+    for inforequest in inforequests.chunked(100):
+        expected = DeadlineEvent.expected_for(inforequest.branches)
+        invalid = False
+        for branch in inforequest.branches:
+            found = {e.kind: e.due_date for e in branch.deadlineevent_set.all()}
+            if expected[branch] == found:
+                continue
+            issues.append(u'{} has deadline events {} but should have {}'.format(
+                    branch, found, expected[branch]))
+            invalid = True
+        if invalid and autofix:
+            DeadlineEvent.schedule(inforequest)
+
+    if superficial and issues:
+        if len(issues) > 5:
+            issues[5:] = [u'More branches have invalid deadline events']
+        issues = [u'; '.join(issues)]
+    for issue in issues:
+        yield datacheck.Error(issue + u'.', autofixable=True)
+
+# Must be after ``DeadlineEvent`` to break cyclic dependency
+from .deadline import Deadline
+from .inforequestemail import InforequestEmail
+from .branch import Branch
+from .inforequest import Inforequest
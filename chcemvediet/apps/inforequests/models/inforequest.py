@@ -22,6 +22,12 @@ class InforequestQuerySet(QuerySet):
         return self.filter(applicant=user)
     def closed(self):
         return self.filter(closed=True)
+    def with_unique_emails(self, addresses):
+        u"""
+        Inforequests with any of ``addresses`` as their ``unique_email``. The addresses are matched
+        case insensitive using the unique index on ``unique_email_key``.
+        """
+        return self.filter(unique_email_key__in=[a.lower() for a in addresses])
     def not_closed(self):
         return self.filter(closed=False)
     def with_undecided_email(self):
@@ -88,6 +94,15 @@ class Inforequest(FormatMixin, models.Model):
                 tell them to send their response to a different email address.
                 """))
 
+    # May NOT be empty; Unique; Read-only; Automaticly computed in save() together with
+    # ``unique_email``.
+    unique_email_key = models.CharField(max_length=255, unique=True,
+            help_text=squeeze(u"""
+                Lower case ``unique_email`` used to look up inforequests of received emails. Email
+                addresses are case insensitive, but case insensitive lookups can't use the unique
+                index on ``unique_email``.
+                """))
+
     # Should NOT be empty
     subject = models.CharField(blank=True, max_length=255,
             help_text=squeeze(u"""
@@ -134,6 +149,7 @@ class Inforequest(FormatMixin, models.Model):
     # Indexes:
     #  -- applicant: ForeignKey
     #  -- unique_email: unique
+    #  -- unique_email_key: unique
     #  -- submission_date, id: index_together
 
     objects = InforequestQuerySet.as_manager()
@@ -477,6 +493,7 @@ class Inforequest(FormatMixin, models.Model):
             while True:
                 token = random_readable_string(length)
                 self.unique_email = settings.INFOREQUEST_UNIQUE_EMAIL.format(token=token)
+                self.unique_email_key = self.unique_email.lower()
                 try:
                     with transaction.atomic():
                         super(Inforequest, self).save(*args, **kwargs)
@@ -485,6 +502,7 @@ class Inforequest(FormatMixin, models.Model):
                     if length <= 10:
                         continue
                     self.unique_email = None
+                    self.unique_email_key = None
                     raise # Give up
                 return # object is already saved
 
@@ -493,22 +511,31 @@ class Inforequest(FormatMixin, models.Model):
     def get_absolute_url(self, anchor=u''):
         return reverse(u'inforequests:detail', kwargs=dict(inforequest=self)) + anchor
 
-    def _send_notification(self, template, anchor, dictionary):
+    def _render_notification(self, template, anchor, dictionary):
         dictionary.update({
                 u'inforequest': self,
                 u'url': complete_url(self.get_absolute_url(anchor)),
                 })
-        msg = render_mail(template,
+        return render_mail(template,
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 to=[self.applicant.email],
                 dictionary=dictionary)
-        msg.send()
 
-    def send_received_email_notification(self, email):
-        self._send_notification(u'inforequests/mails/received_email_notification', u'', {
+    def _send_notification(self, template, anchor, dictionary):
+        self._render_notification(template, anchor, dictionary).send()
+
+    def render_received_email_notification(self, email):
+        u"""
+        Returns the notification without sending it, so notifications for multiple received
+        emails may be sent at once.
+        """
+        return self._render_notification(u'inforequests/mails/received_email_notification', u'', {
                 u'email': email,
                 })
 
+    def send_received_email_notification(self, email):
+        self.render_received_email_notification(email).send()
+
     def send_undecided_email_reminder(self):
         self._send_notification(u'inforequests/mails/undecided_email_reminder', u'', {
                 })
@@ -1,45 +1,56 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
-import operator
-
 from django.dispatch import receiver
-from django.db.models import Q
 from django.db.models.signals import post_delete
 from django.conf import settings
+from django.core.mail import get_connection
 from django.contrib.sessions.models import Session
 
 from poleno.attachments.models import Attachment
-from poleno.mail.signals import message_received
+from poleno.mail.signals import messages_received
 from poleno.utils.translation import translation
 
 from .models import Inforequest, InforequestEmail
 
 
-@receiver(message_received)
-def assign_email_on_message_received(sender, message, **kwargs):
-    if message.received_for:
-        q = Q(unique_email__iexact=message.received_for)
-    elif message.recipients:
-        q = (Q(unique_email__iexact=r.mail) for r in message.recipients)
-        q = reduce(operator.or_, q)
-    else:
+@receiver(messages_received)
+def assign_emails_on_messages_received(sender, messages, **kwargs):
+    u"""
+    Assigns received ``messages`` to inforequests they were sent to and notifies applicants of
+    open inforequests. Inforequests of all the messages are looked up with a single query. A
+    message matching no inforequest or matching multiple inforequests is not assigned.
+    """
+    addresses = {}
+    for message in messages:
+        if message.received_for:
+            mails = [message.received_for]
+        else:
+            mails = [r.mail for r in message.recipients]
+        addresses[message] = set(m.lower() for m in mails)
+
+    lookup = set.union(set(), *addresses.values())
+    if not lookup:
         return
+    inforequests = {i.unique_email_key: i for i in
+            Inforequest.objects.with_unique_emails(lookup).select_related(u'applicant')}
 
-    try:
-        inforequest = Inforequest.objects.get(q)
-    except (Inforequest.DoesNotExist, Inforequest.MultipleObjectsReturned):
-        return
+    assigned = []
+    for message in messages:
+        matched = set(inforequests[m] for m in addresses[message] if m in inforequests)
+        if len(matched) == 1:
+            assigned.append((message, matched.pop()))
 
-    inforequestemail = InforequestEmail(
+    InforequestEmail.objects.bulk_create(InforequestEmail(
             inforequest=inforequest,
             email=message,
             type=InforequestEmail.TYPES.UNDECIDED,
-            )
-    inforequestemail.save()
+            ) for message, inforequest in assigned)
 
-    if not inforequest.closed:
-        with translation(settings.LANGUAGE_CODE):
-            inforequest.send_received_email_notification(message)
+    with translation(settings.LANGUAGE_CODE):
+        notifications = [inforequest.render_received_email_notification(message)
+                for message, inforequest in assigned if not inforequest.closed]
+    if notifications:
+        get_connection().send_messages(notifications)
 
 @receiver(post_delete, sender=Session)
 def delete_attachments_on_session_post_delete(sender, instance, **kwargs):
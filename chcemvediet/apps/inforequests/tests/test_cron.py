@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 import mock
 import datetime
+import itertools
+import contextlib
 
 from django.core.management import call_command
 from django.test import TestCase
@@ -9,12 +11,13 @@ from django.test import TestCase
 from poleno.mail.models import Message, Recipient
 from poleno.timewarp import timewarp
 from poleno.cron.test import mock_cron_jobs
-from poleno.utils.date import local_datetime_from_local, utc_datetime_from_local
+from poleno.utils.date import naive_date, local_datetime_from_local, utc_datetime_from_local
 from poleno.utils.test import created_instances
 
 from . import InforequestsTestCaseMixin
-from ..cron import undecided_email_reminder, obligee_deadline_reminder, applicant_deadline_reminder, close_inforequests
-from ..models import Inforequest, Action
+from .. import cron
+from ..cron import undecided_email_reminder, deadline_sweep
+from ..models import Inforequest, Branch, Action, DeadlineEvent
 
 class CronTestCaseMixin(TestCase):
 
@@ -48,7 +51,7 @@ class UndecidedEmailReminderCronJobTest(CronTestCaseMixin, InforequestsTestCaseM
     """
 
     def _call_cron_job(self):
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.workdays.between', side_effect=lambda a,b: (b-a).days):
+        with mock.patch(u'chcemvediet.apps.inforequests.cron.workdays.advance', side_effect=lambda d,n: d+datetime.timedelta(days=n)):
             with created_instances(Message.objects) as message_set:
                 undecided_email_reminder().do()
         return message_set
@@ -194,9 +197,9 @@ class UndecidedEmailReminderCronJobTest(CronTestCaseMixin, InforequestsTestCaseM
                 message_set = self._call_cron_job()
         self.assertEqual(message_set.count(), 2)
         self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Checking if undecided email reminder should be sent failed: <Inforequest: %s>' % inforequests[1].pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sent undecided email reminder: <Inforequest: %s>' % inforequests[0].pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent undecided email reminder: <Inforequest: %s>' % inforequests[2].pk)
+        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Checking if undecided email reminder should be sent failed: <Inforequest: \[%s\]' % inforequests[1].pk)
+        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sent undecided email reminder: <Inforequest: \[%s\]' % inforequests[0].pk)
+        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent undecided email reminder: <Inforequest: \[%s\]' % inforequests[2].pk)
 
     def test_inforequest_is_skipped_if_exception_raised_while_sending_reminder(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
@@ -210,31 +213,61 @@ class UndecidedEmailReminderCronJobTest(CronTestCaseMixin, InforequestsTestCaseM
 
         self.assertEqual(message_set.count(), 2)
         self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Sent undecided email reminder: <Inforequest: %s>' % inforequests[0].pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sending undecided email reminder failed: <Inforequest: %s>' % inforequests[1].pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent undecided email reminder: <Inforequest: %s>' % inforequests[2].pk)
+        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Sent undecided email reminder: <Inforequest: \[%s\]' % inforequests[0].pk)
+        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sending undecided email reminder failed: <Inforequest: \[%s\]' % inforequests[1].pk)
+        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent undecided email reminder: <Inforequest: \[%s\]' % inforequests[2].pk)
 
-class ObligeeDeadlineReminderCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin, TestCase):
+class DeadlineSweepCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin, TestCase):
     u"""
-    Tests ``obligee_deadline_reminder()`` cron job.
+    Tests ``deadline_sweep()`` cron job. Tests obligee deadline reminders, applicant deadline
+    reminders, expirations and closures, and the precedence between them.
     """
 
     def _call_cron_job(self):
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.workdays.between', side_effect=lambda a,b: (b-a).days):
-            with created_instances(Message.objects) as message_set:
-                obligee_deadline_reminder().do()
+        with created_instances(Message.objects) as message_set:
+            deadline_sweep().do()
         return message_set
 
+    def _delivered(self, date, **kwargs):
+        kwargs.update(legal_date=naive_date(date), delivered_date=naive_date(date))
+        return kwargs
+
+    @contextlib.contextmanager
+    def _fail_at_call(self, name, failing_call):
+        u"""
+        Patches ``name`` function of ``cron`` module to raise an exception on its ``failing_call``
+        call and to call the original function otherwise. Patches ``cron_logger`` as well.
+        """
+        original = getattr(cron, name)
+        counter = itertools.count()
+        def side_effect(*args):
+            if next(counter) == failing_call:
+                raise Exception(u'Testing exception')
+            return original(*args)
+        logger = mock.Mock()
+        with mock.patch.object(cron, name, side_effect=side_effect):
+            with mock.patch(u'poleno.cron.cron_logger', logger):
+                with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger', logger):
+                    yield logger
+
+    def _logged(self, logger):
+        # Summaries of ``cron_dispatch`` are not interesting
+        return [c[1][0] for c in logger.mock_calls if u' items, ' not in c[1][0]]
+
 
     def test_times_job_is_run_at(self):
-        self.assert_times_job_is_run_at(u'chcemvediet.apps.inforequests.cron.obligee_deadline_reminder')
+        self.assert_times_job_is_run_at(u'chcemvediet.apps.inforequests.cron.deadline_sweep')
+
+    # Obligee deadline reminders
 
     def test_obligee_deadline_reminder(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         user = self._create_user(email=u'smith@example.com')
-        inforequest, _, _ = self._create_inforequest_scenario(user)
+        inforequest, _, _ = self._create_inforequest_scenario(user,
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         with self.settings(DEFAULT_FROM_EMAIL=u'info@example.com'):
             with self.assertTemplateUsed(u'inforequests/mails/obligee_deadline_reminder_message.txt'):
                 message_set = self._call_cron_job()
@@ -245,190 +278,158 @@ class ObligeeDeadlineReminderCronJobTest(CronTestCaseMixin, InforequestsTestCase
 
     def test_obligee_deadline_reminder_with_multiple_inforequests(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        scenarios = [self._create_inforequest_scenario() for i in range(4)]
+        scenarios = [self._create_inforequest_scenario((u'request', self._delivered(u'2010-10-05')))
+                for i in range(4)]
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertEqual(message_set.count(), 4)
 
     def test_obligee_deadline_reminder_with_inforequest_with_multiple_branches(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario((u'advancement', [], [], []))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                # deadlines of advanced requests are missed at 2010-10-22
+                (u'advancement', [], [], []),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-25 10:33:00'))
         message_set = self._call_cron_job()
         self.assertEqual(message_set.count(), 3)
 
     def test_last_action_last_deadline_reminder_is_updated_if_remider_is_sent(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         last = utc_datetime_from_local(u'2010-10-10 17:00:00')
-        inforequest, _, (request,) = self._create_inforequest_scenario((u'request', dict(last_deadline_reminder=last)))
+        inforequest, _, (request,) = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05', last_deadline_reminder=last)))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
 
         request = Action.objects.get(pk=request.pk)
-        self.assertAlmostEqual(request.last_deadline_reminder, local_datetime_from_local(u'2010-11-20 10:33:00'), delta=datetime.timedelta(seconds=10))
+        self.assertAlmostEqual(request.last_deadline_reminder, local_datetime_from_local(u'2010-10-20 10:33:00'), delta=datetime.timedelta(seconds=10))
 
     def test_last_action_last_deadline_reminder_is_not_updated_if_remider_is_not_sent(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-11-10 17:00:00')
-        inforequest, _, (request,) = self._create_inforequest_scenario((u'request', dict(last_deadline_reminder=last)))
+        last = utc_datetime_from_local(u'2010-10-18 17:00:00')
+        inforequest, _, (request,) = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05', last_deadline_reminder=last)))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
 
         request = Action.objects.get(pk=request.pk)
         self.assertEqual(request.last_deadline_reminder, last)
 
-    def test_reminder_is_not_sent_for_inforequest_with_undecided_email(self):
+    def test_obligee_deadline_reminder_is_not_sent_for_inforequest_with_undecided_email(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario()
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')))
         email = self._create_inforequest_email(inforequest=inforequest)
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_not_sent_for_closed_inforequest_without_undecided_email(self):
+    def test_obligee_deadline_reminder_is_not_sent_for_closed_inforequest(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(dict(closed=True))
+        inforequest, _, _ = self._create_inforequest_scenario(dict(closed=True),
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_for_not_closed_inforequest_without_undecided_email(self):
+    def test_obligee_deadline_reminder_is_not_sent_if_last_action_does_not_have_obligee_deadline(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario()
-
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
-        self.assertTrue(message_set.exists())
-
-    def test_reminder_is_not_sent_if_last_action_does_not_have_obligee_deadline(self):
-        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(u'clarification_request')
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
+        with mock.patch(u'chcemvediet.apps.inforequests.cron._send_applicant_deadline_reminder'):
+            message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_not_sent_if_last_action_deadline_is_not_missed(self):
+    def test_obligee_deadline_reminder_is_not_sent_if_last_action_deadline_is_not_missed(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         inforequest, _, _ = self._create_inforequest_scenario(
-                u'clarification_request',
-                # deadline is missed at 2010-10-11
-                (u'clarification_response', dict(deadline=5)),
-                )
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-10 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-15 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_if_last_action_has_missed_obligee_deadline(self):
+    def test_obligee_deadline_reminder_is_sent_if_last_action_has_missed_obligee_deadline(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         inforequest, _, _ = self._create_inforequest_scenario(
-                u'clarification_request',
-                # deadline is missed at 2010-10-11
-                (u'clarification_response', dict(deadline=5)),
-                )
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-11 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-16 10:33:00'))
         message_set = self._call_cron_job()
         self.assertTrue(message_set.exists())
 
-    def test_reminder_is_not_sent_if_last_action_deadline_was_already_missed_when_last_reminder_was_sent(self):
+    def test_obligee_deadline_reminder_is_not_sent_if_deadline_was_already_missed_when_last_reminder_was_sent(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-10-11 10:33:00')
+        last = utc_datetime_from_local(u'2010-10-16 10:33:00')
         inforequest, _, _ = self._create_inforequest_scenario(
-                u'clarification_request',
-                # deadline is missed at 2010-10-11
-                (u'clarification_response', dict(deadline=5, last_deadline_reminder=last)),
-                )
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05', last_deadline_reminder=last)))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_if_last_action_deadline_was_not_missed_yet_when_last_reminder_was_sent(self):
+    def test_obligee_deadline_reminder_is_sent_if_deadline_was_not_missed_yet_when_last_reminder_was_sent(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-10-10 10:33:00')
+        last = utc_datetime_from_local(u'2010-10-15 10:33:00')
         inforequest, _, _ = self._create_inforequest_scenario(
-                u'clarification_request',
-                # deadline is missed at 2010-10-11
-                (u'clarification_response', dict(deadline=5, last_deadline_reminder=last)),
-                )
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05', last_deadline_reminder=last)))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertTrue(message_set.exists())
 
-    def test_reminder_is_sent_if_last_action_deadline_was_already_missed_when_last_reminder_was_sent_but_it_was_extended_later(self):
+    def test_obligee_deadline_reminder_is_sent_if_deadline_was_already_missed_when_last_reminder_was_sent_but_it_was_snoozed_later(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-10-12 10:33:00')
+        last = utc_datetime_from_local(u'2010-10-16 10:33:00')
         inforequest, _, _ = self._create_inforequest_scenario(
-                u'clarification_request',
-                # deadline was missed at 2010-10-11, but then it was extended by 3 days; it will be
-                # missed at 2010-10-14 again.
-                (u'clarification_response', dict(deadline=5, extension=3, last_deadline_reminder=last)),
-                )
+                # deadline was missed at 2010-10-16, but then it was snoozed by 3 days; it will be
+                # missed at 2010-10-19 again.
+                (u'request', self._delivered(u'2010-10-05', last_deadline_reminder=last,
+                    snooze=naive_date(u'2010-10-18'))))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertTrue(message_set.exists())
 
-    def test_branch_is_skipped_if_exception_raised_while_checking_it(self):
-        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, actions = self._create_inforequest_scenario((u'advancement', [], [], []))
-        _, (_, ((_, (action1,)), (_, (action2,)), (_, (action3,)))) = actions
-
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, Exception, None, None, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                message_set = self._call_cron_job()
-        self.assertEqual(message_set.count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Checking if obligee deadline reminder should be sent failed: <Action: %s>' % action2.pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sent obligee deadline reminder: <Action: %s>' % action1.pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent obligee deadline reminder: <Action: %s>' % action3.pk)
-
-    def test_branch_is_skipped_if_exception_raised_while_sending_reminder(self):
+    def test_obligee_deadline_reminder_event_is_rescheduled_after_reminder_is_sent(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, actions = self._create_inforequest_scenario((u'advancement', [], [], []))
-        _, (_, ((_, (action1,)), (_, (action2,)), (_, (action3,)))) = actions
-
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, None, None, None, Exception, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                message_set = self._call_cron_job()
-        self.assertEqual(message_set.count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Sent obligee deadline reminder: <Action: %s>' % action1.pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sending obligee deadline reminder failed: <Action: %s>' % action2.pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent obligee deadline reminder: <Action: %s>' % action3.pk)
-
-class ApplicantDeadlineReminderCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin, TestCase):
-    u"""
-    Tests ``applicant_deadline_reminder()`` cron job.
-    """
-
-    def _call_cron_job(self):
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.workdays.between', side_effect=lambda a,b: (b-a).days):
-            with created_instances(Message.objects) as message_set:
-                applicant_deadline_reminder().do()
-        return message_set
+        _, branch, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')))
 
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
+        self._call_cron_job()
+        message_set = self._call_cron_job()
+        self.assertFalse(message_set.exists())
+        self.assertFalse(branch.deadlineevent_set.filter(
+                kind=DeadlineEvent.KINDS.OBLIGEE_REMINDER).exists())
 
-    def test_times_job_is_run_at(self):
-        self.assert_times_job_is_run_at(u'chcemvediet.apps.inforequests.cron.applicant_deadline_reminder')
+    # Applicant deadline reminders
 
     def test_applicant_deadline_reminder(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         user = self._create_user(email=u'smith@example.com')
-        inforequest, _, _ = self._create_inforequest_scenario(user, u'clarification_request')
+        inforequest, _, _ = self._create_inforequest_scenario(user,
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         with self.settings(DEFAULT_FROM_EMAIL=u'info@example.com'):
             with self.assertTemplateUsed(u'inforequests/mails/applicant_deadline_reminder_message.txt'):
                 message_set = self._call_cron_job()
@@ -439,187 +440,218 @@ class ApplicantDeadlineReminderCronJobTest(CronTestCaseMixin, InforequestsTestCa
 
     def test_applicant_deadline_reminder_with_multiple_inforequests(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        scenarios = [self._create_inforequest_scenario(u'clarification_request') for i in range(4)]
+        scenarios = [self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                ) for i in range(4)]
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertEqual(message_set.count(), 4)
 
     def test_applicant_deadline_reminder_with_inforequest_with_multiple_branches(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario((u'advancement',
-            [u'clarification_request'], [u'clarification_request'], [u'clarification_request']))
+        clarification_request = (u'clarification_request', self._delivered(u'2010-10-06'))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'advancement',
+                    [clarification_request], [clarification_request], [clarification_request]),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertEqual(message_set.count(), 3)
 
-    def test_last_action_last_deadline_reminder_is_updated_if_remider_is_sent(self):
+    def test_applicant_deadline_reminder_updates_last_action_last_deadline_reminder(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         inforequest, _, (_, clarification_request) = self._create_inforequest_scenario(
-                (u'clarification_request', dict(last_deadline_reminder=None)))
-
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
-
-        clarification_request = Action.objects.get(pk=clarification_request.pk)
-        self.assertAlmostEqual(clarification_request.last_deadline_reminder, local_datetime_from_local(u'2010-11-20 10:33:00'), delta=datetime.timedelta(seconds=10))
-
-    def test_last_action_last_deadline_reminder_is_not_updated_if_remider_is_not_sent(self):
-        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, (_, clarification_request) = self._create_inforequest_scenario(
-                (u'clarification_request', dict(last_deadline_reminder=None)))
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-06 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
 
         clarification_request = Action.objects.get(pk=clarification_request.pk)
-        self.assertIsNone(clarification_request.last_deadline_reminder)
+        self.assertAlmostEqual(clarification_request.last_deadline_reminder, local_datetime_from_local(u'2010-10-20 10:33:00'), delta=datetime.timedelta(seconds=10))
 
-    def test_reminder_is_not_sent_for_inforequest_with_undecided_email(self):
+    def test_applicant_deadline_reminder_is_not_sent_for_inforequest_with_undecided_email(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(u'clarification_request')
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
         email = self._create_inforequest_email(inforequest=inforequest)
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_not_sent_for_closed_inforequest_without_undecided_email(self):
+    def test_applicant_deadline_reminder_is_not_sent_for_closed_inforequest(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(dict(closed=True), u'clarification_request')
+        inforequest, _, _ = self._create_inforequest_scenario(dict(closed=True),
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_for_not_closed_inforequest_without_undecided_email(self):
+    def test_applicant_deadline_reminder_is_not_sent_if_last_action_deadline_will_be_missed_in_more_than_2_days(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(u'clarification_request')
-
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
-        self.assertTrue(message_set.exists())
-
-    def test_reminder_is_not_sent_if_last_action_does_not_have_applicant_deadline(self):
-        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario(u'clarification_request', u'clarification_response')
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                # deadline is missed at 2010-10-14
+                (u'clarification_request', self._delivered(u'2010-10-06')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-10 10:33:00'))
         message_set = self._call_cron_job()
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_not_sent_if_last_action_deadline_will_be_missed_in_more_than_2_days(self):
+    def test_applicant_deadline_reminder_is_sent_if_last_action_deadline_will_be_missed_in_2_days(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         inforequest, _, _ = self._create_inforequest_scenario(
-                # deadline is missed at 2010-10-11
-                (u'clarification_request', dict(deadline=5)),
+                (u'request', self._delivered(u'2010-10-05')),
+                # deadline is missed at 2010-10-14
+                (u'clarification_request', self._delivered(u'2010-10-06')),
                 )
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-07 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-11 10:33:00'))
         message_set = self._call_cron_job()
-        self.assertFalse(message_set.exists())
+        self.assertTrue(message_set.exists())
 
-    def test_reminder_is_sent_if_last_action_applicant_deadline_will_be_missed_in_2_days(self):
+    def test_applicant_deadline_reminder_is_not_sent_twice_for_one_action(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        last = utc_datetime_from_local(u'2010-10-11 10:33:00')
         inforequest, _, _ = self._create_inforequest_scenario(
-                # deadline is missed at 2010-10-11
-                (u'clarification_request', dict(deadline=5)),
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06', last_deadline_reminder=last)),
                 )
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-08 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
-        self.assertTrue(message_set.exists())
+        self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_if_last_action_applicant_deadline_is_already_missed(self):
+    def test_applicant_deadline_reminder_is_sent_for_last_action_even_if_it_was_sent_for_previous_actions(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        last = utc_datetime_from_local(u'2010-10-11 10:33:00')
         inforequest, _, _ = self._create_inforequest_scenario(
-                # deadline is missed at 2010-10-11
-                (u'clarification_request', dict(deadline=5)),
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'clarification_request', self._delivered(u'2010-10-06', last_deadline_reminder=last)),
+                (u'clarification_response', self._delivered(u'2010-10-12')),
+                (u'clarification_request', self._delivered(u'2010-10-13')),
                 )
 
-        timewarp.jump(local_datetime_from_local(u'2010-10-11 10:33:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
         message_set = self._call_cron_job()
         self.assertTrue(message_set.exists())
 
-    def test_reminder_is_not_sent_twice_for_one_action(self):
+    # Expirations
+
+    def test_expiration_is_added_if_obligee_deadline_was_missed_more_than_8_days_ago(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-10-11 10:33:00')
-        inforequest, _, _ = self._create_inforequest_scenario((u'clarification_request', dict(last_deadline_reminder=last)))
+        _, branch, _ = self._create_inforequest_scenario(
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
+        timewarp.jump(local_datetime_from_local(u'2010-10-24 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            message_set = self._call_cron_job()
+        self.assertEqual(action_set.get().type, Action.TYPES.EXPIRATION)
+        # Adding the expiration takes precedence over the obligee deadline reminder
         self.assertFalse(message_set.exists())
 
-    def test_reminder_is_sent_for_last_action_even_if_it_was_sent_for_previous_actions(self):
+    def test_expiration_is_not_added_if_obligee_deadline_was_missed_at_most_8_days_ago(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        last = utc_datetime_from_local(u'2010-10-11 10:33:00')
-        inforequest, _, _ = self._create_inforequest_scenario(
-                (u'clarification_request', dict(last_deadline_reminder=last)),
-                u'clarification_response',
-                (u'clarification_request', dict(last_deadline_reminder=None)),
-                )
+        _, branch, _ = self._create_inforequest_scenario(
+                # deadline is missed at 2010-10-16
+                (u'request', self._delivered(u'2010-10-05')))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        message_set = self._call_cron_job()
-        self.assertTrue(message_set.exists())
+        timewarp.jump(local_datetime_from_local(u'2010-10-23 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            self._call_cron_job()
+        self.assertFalse(action_set.exists())
 
-    def test_branch_is_skipped_if_exception_raised_while_checking_it(self):
+    def test_expiration_is_not_added_if_snooze_is_not_missed(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, actions = self._create_inforequest_scenario((u'advancement', [u'clarification_request'], [u'clarification_request'], [u'clarification_request']))
-        _, (_, ((_, (_, action1)), (_, (_, action2)), (_, (_, action3)))) = actions
+        _, branch, _ = self._create_inforequest_scenario(
+                # deadline is missed at 2010-10-16, snooze at 2010-10-24
+                (u'request', self._delivered(u'2010-10-05', snooze=naive_date(u'2010-10-23'))))
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, Exception, None, None, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                message_set = self._call_cron_job()
-        self.assertEqual(message_set.count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Checking if applicant deadline reminder should be sent failed: <Action: %s>' % action2.pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sent applicant deadline reminder: <Action: %s>' % action1.pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent applicant deadline reminder: <Action: %s>' % action3.pk)
+        timewarp.jump(local_datetime_from_local(u'2010-10-23 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            self._call_cron_job()
+        self.assertFalse(action_set.exists())
 
-    def test_branch_is_skipped_if_exception_raised_while_sending_reminder(self):
+    def test_appeal_expiration_is_added_for_appeal(self):
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        inforequest, _, actions = self._create_inforequest_scenario((u'advancement', [u'clarification_request'], [u'clarification_request'], [u'clarification_request']))
-        _, (_, ((_, (_, action1)), (_, (_, action2)), (_, (_, action3)))) = actions
+        _, branch, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'refusal', self._delivered(u'2010-10-06')),
+                # deadline is missed at 2010-10-22
+                (u'appeal', self._delivered(u'2010-10-07')),
+                )
 
-        timewarp.jump(local_datetime_from_local(u'2010-11-20 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, None, None, None, Exception, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                message_set = self._call_cron_job()
-        self.assertEqual(message_set.count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Sent applicant deadline reminder: <Action: %s>' % action1.pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Sending applicant deadline reminder failed: <Action: %s>' % action2.pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Sent applicant deadline reminder: <Action: %s>' % action3.pk)
+        timewarp.jump(local_datetime_from_local(u'2010-11-01 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            self._call_cron_job()
+        self.assertEqual(action_set.get().type, Action.TYPES.APPEAL_EXPIRATION)
 
-class CloseInforequestsCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin, TestCase):
-    u"""
-    Tests ``close_inforequests()`` cron job.
-    """
+    def test_expiration_is_not_added_for_inforequest_with_undecided_email(self):
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        inforequest, branch, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')))
+        email = self._create_inforequest_email(inforequest=inforequest)
 
-    def _call_cron_job(self):
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.workdays.between', side_effect=lambda a,b: (b-a).days):
-            close_inforequests().do()
+        timewarp.jump(local_datetime_from_local(u'2010-10-24 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            self._call_cron_job()
+        self.assertFalse(action_set.exists())
 
+    def test_expirations_are_added_for_inforequest_with_multiple_branches(self):
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        _, branch, actions = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                # deadlines of advanced requests are missed at 2010-10-22
+                (u'advancement',
+                    [u'advanced_request'],
+                    [u'advanced_request', (u'clarification_request', self._delivered(u'2010-10-06'))],
+                    [u'advanced_request', (u'confirmation', dict(legal_date=naive_date(u'2010-10-06')))],
+                    ))
+        _, (_, [(branch1, _), (branch2, _), (branch3, _)]) = actions
 
-    def test_times_job_is_run_at(self):
-        self.assert_times_job_is_run_at(u'chcemvediet.apps.inforequests.cron.close_inforequests')
+        timewarp.jump(local_datetime_from_local(u'2010-11-01 10:33:00'))
+        with created_instances(branch.action_set) as action_set:
+            with created_instances(branch1.action_set) as action_set1:
+                with created_instances(branch2.action_set) as action_set2:
+                    with created_instances(branch3.action_set) as action_set3:
+                        with mock.patch(u'chcemvediet.apps.inforequests.cron._send_applicant_deadline_reminder'):
+                            self._call_cron_job()
+        self.assertFalse(action_set.exists())
+        self.assertTrue(action_set1.exists())
+        self.assertFalse(action_set2.exists())
+        self.assertTrue(action_set3.exists())
 
-    def test_close_inforequests(self):
+    # Closures
+
+    def test_inforequest_is_closed(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario()
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-05')))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
         self.assertTrue(inforequest.closed)
+        self.assertFalse(DeadlineEvent.objects.filter(branch__inforequest=inforequest).exists())
 
-    def test_close_inforequests_with_multiple_inforequests(self):
+    def test_inforequest_is_closed_with_multiple_inforequests(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        scenarios = [self._create_inforequest_scenario() for i in range(5)]
+        scenarios = [self._create_inforequest_scenario((u'request', self._delivered(u'2010-03-05')))
+                for i in range(5)]
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         self._call_cron_job()
@@ -628,62 +660,49 @@ class CloseInforequestsCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin,
             inforequest = Inforequest.objects.get(pk=inforequest.pk)
             self.assertTrue(inforequest.closed)
 
-    def test_expiration_added_if_last_action_has_obligee_deadline(self):
+    def test_expiration_is_added_when_closing_inforequest_if_last_action_has_obligee_deadline(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        _, branch, _ = self._create_inforequest_scenario()
+        _, branch, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-05')))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         with created_instances(branch.action_set) as action_set:
-            self._call_cron_job()
-        action = action_set.get()
-
-        self.assertEqual(action.type, Action.TYPES.EXPIRATION)
+            message_set = self._call_cron_job()
+        self.assertEqual(action_set.get().type, Action.TYPES.EXPIRATION)
+        # Closing the inforequest takes precedence over reminders
+        self.assertFalse(message_set.exists())
 
-    def test_expiration_not_added_if_last_action_does_not_have_obligee_deadline(self):
+    def test_expiration_is_not_added_when_closing_inforequest_if_last_action_does_not_have_obligee_deadline(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        _, branch, _ = self._create_inforequest_scenario(u'disclosure')
+        _, branch, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-05')),
+                (u'disclosure', self._delivered(u'2010-03-06',
+                    disclosure_level=Action.DISCLOSURE_LEVELS.FULL)),
+                )
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         with created_instances(branch.action_set) as action_set:
             self._call_cron_job()
         self.assertFalse(action_set.exists())
 
-    def test_expiration_not_added_if_inforequest_is_already_closed(self):
+    def test_closed_inforequest_is_not_processed(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        _, branch, _ = self._create_inforequest_scenario(dict(closed=True))
+        _, branch, _ = self._create_inforequest_scenario(dict(closed=True),
+                (u'request', self._delivered(u'2010-03-05')))
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
         with created_instances(branch.action_set) as action_set:
             self._call_cron_job()
         self.assertFalse(action_set.exists())
 
-    def test_expirations_added_for_inforequest_with_multiple_branches(self):
-        timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        _, branch, actions = self._create_inforequest_scenario((u'advancement',
-                [u'confirmation'],
-                [u'clarification_request'],
-                [u'clarification_request', u'clarification_response'],
-                ))
-        _, (_, [(branch1, _), (branch2, _), (branch3, _)]) = actions
-
-        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        with created_instances(branch.action_set) as action_set:
-            with created_instances(branch1.action_set) as action_set1:
-                with created_instances(branch2.action_set) as action_set2:
-                    with created_instances(branch3.action_set) as action_set3:
-                        self._call_cron_job()
-        self.assertFalse(action_set.exists())
-        self.assertTrue(action_set1.exists())
-        self.assertFalse(action_set2.exists())
-        self.assertTrue(action_set3.exists())
-
     def test_inforequest_is_not_closed_if_last_action_deadline_was_missed_less_than_100_days_ago(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario((u'request', dict(deadline=10)))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01', snooze=naive_date(u'2010-03-19'))))
 
-        # Request deadline was missed at 2010-03-11. 100 days after missing the deadline will pass
-        # at 2010-06-19.
-        timewarp.jump(local_datetime_from_local(u'2010-06-18 10:33:00'))
+        # Request snooze was missed at 2010-03-20. 100 days after the snooze will pass at
+        # 2010-06-27.
+        timewarp.jump(local_datetime_from_local(u'2010-06-26 10:33:00'))
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
@@ -691,73 +710,187 @@ class CloseInforequestsCronJobTest(CronTestCaseMixin, InforequestsTestCaseMixin,
 
     def test_inforequest_is_closed_if_last_action_deadline_was_missed_at_least_100_days_ago(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
-        inforequest, _, _ = self._create_inforequest_scenario((u'request', dict(deadline=10)))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01', snooze=naive_date(u'2010-03-19'))))
 
-        # Request deadline was missed at 2010-03-11. 100 days after missing the deadline will pass
-        # at 2010-06-19.
-        timewarp.jump(local_datetime_from_local(u'2010-06-19 10:33:00'))
+        # Request snooze was missed at 2010-03-20. 100 days after the snooze will pass at
+        # 2010-06-27.
+        timewarp.jump(local_datetime_from_local(u'2010-06-27 10:33:00'))
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
         self.assertTrue(inforequest.closed)
 
     def test_inforequest_is_closed_if_last_action_has_no_deadline(self):
-        inforequest, _, _ = self._create_inforequest_scenario(u'refusal', u'appeal', u'affirmation')
+        timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01')),
+                (u'refusal', self._delivered(u'2010-03-02')),
+                (u'appeal', self._delivered(u'2010-03-03')),
+                (u'affirmation', self._delivered(u'2010-03-04')),
+                )
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
         self.assertTrue(inforequest.closed)
 
     def test_inforequest_is_not_closed_if_at_least_one_branch_prevents_it(self):
-        inforequest, _, _ = self._create_inforequest_scenario((u'advancement',
-                [u'refusal', u'appeal', u'affirmation'],
-                [(u'disclosure', dict(disclosure_level=Action.DISCLOSURE_LEVELS.PARTIAL))],
-                [u'refusal', u'appeal', u'reversion'],
-                ))
+        timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01')),
+                (u'advancement',
+                    [u'advanced_request', (u'refusal', self._delivered(u'2010-03-03')),
+                        (u'appeal', self._delivered(u'2010-03-04')),
+                        (u'affirmation', self._delivered(u'2010-03-05'))],
+                    [u'advanced_request', (u'disclosure', self._delivered(u'2010-03-03',
+                        disclosure_level=Action.DISCLOSURE_LEVELS.PARTIAL))],
+                    ))
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
         self.assertFalse(inforequest.closed)
 
     def test_inforequest_is_closed_if_no_branch_prevents_it(self):
-        inforequest, _, _ = self._create_inforequest_scenario((u'advancement',
-                [u'refusal', u'appeal', u'affirmation'],
-                [(u'disclosure', dict(disclosure_level=Action.DISCLOSURE_LEVELS.FULL))],
-                [u'refusal', u'appeal', u'reversion'],
-                ))
+        timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
+        inforequest, _, _ = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01')),
+                (u'advancement',
+                    [u'advanced_request', (u'refusal', self._delivered(u'2010-03-03')),
+                        (u'appeal', self._delivered(u'2010-03-04')),
+                        (u'affirmation', self._delivered(u'2010-03-05'))],
+                    [u'advanced_request', (u'disclosure', self._delivered(u'2010-03-03',
+                        disclosure_level=Action.DISCLOSURE_LEVELS.FULL))],
+                    ))
         self._call_cron_job()
 
         inforequest = Inforequest.objects.get(pk=inforequest.pk)
         self.assertTrue(inforequest.closed)
 
+    def test_outdated_closure_events_of_blocked_inforequest_are_rescheduled(self):
+        timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
+        inforequest, branch, actions = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01')),
+                (u'advancement', [u'advanced_request']),
+                )
+        _, (_, [(branch1, _)]) = actions
+        DeadlineEvent.objects.filter(kind=DeadlineEvent.KINDS.CLOSURE).update(
+                due_date=naive_date(u'2010-03-01'))
+
+        timewarp.jump(local_datetime_from_local(u'2010-06-01 10:33:00'))
+        self._call_cron_job()
+
+        # The inforequest is not closed and its closure events are not deleted, but rescheduled
+        # to the closure date of the advanced branch.
+        inforequest = Inforequest.objects.get(pk=inforequest.pk)
+        self.assertFalse(inforequest.closed)
+        branch1 = Branch.objects.get(pk=branch1.pk)
+        expected = DeadlineEvent.closure_date_for(branch1.last_action)
+        self.assertGreater(expected, naive_date(u'2010-06-01'))
+        for b in [branch, branch1]:
+            event = b.deadlineevent_set.get(kind=DeadlineEvent.KINDS.CLOSURE)
+            self.assertEqual(event.due_date, expected)
+
+    def test_outdated_closure_event_is_rescheduled(self):
+        timewarp.jump(local_datetime_from_local(u'2010-03-01 10:33:00'))
+        inforequest, branch, (request,) = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-03-01')))
+        branch.deadlineevent_set.filter(kind=DeadlineEvent.KINDS.CLOSURE).update(
+                due_date=naive_date(u'2010-03-01'))
+
+        timewarp.jump(local_datetime_from_local(u'2010-03-15 10:33:00'))
+        self._call_cron_job()
+
+        inforequest = Inforequest.objects.get(pk=inforequest.pk)
+        self.assertFalse(inforequest.closed)
+        event = branch.deadlineevent_set.get(kind=DeadlineEvent.KINDS.CLOSURE)
+        self.assertEqual(event.due_date, DeadlineEvent.closure_date_for(request))
+
+    # Failures
+
     def test_inforequest_is_skipped_if_exception_raised_while_checking_it(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        scenarios = [self._create_inforequest_scenario() for i in range(3)]
+        scenarios = [self._create_inforequest_scenario((u'request', self._delivered(u'2010-03-05')))
+                for i in range(3)]
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, Exception, None, None, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                with created_instances(Action.objects) as action_set:
-                    self._call_cron_job()
+        with self._fail_at_call(u'_is_closable', 1) as logger:
+            with created_instances(Action.objects) as action_set:
+                self._call_cron_job()
         self.assertEqual(action_set.count(), 2)
         self.assertEqual(Inforequest.objects.closed().count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Checking if inforequest should be closed failed: <Inforequest: %s>' % scenarios[1][0].pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Closed inforequest: <Inforequest: %s>' % scenarios[0][0].pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Closed inforequest: <Inforequest: %s>' % scenarios[2][0].pk)
+        logged = self._logged(logger)
+        self.assertEqual(len(logged), 3)
+        self.assertRegexpMatches(logged[0], u'Checking inforequest deadlines failed: <Inforequest: \[%s\]' % scenarios[1][0].pk)
+        self.assertRegexpMatches(logged[1], u'Closed inforequest: <Inforequest: \[%s\]' % scenarios[0][0].pk)
+        self.assertRegexpMatches(logged[2], u'Closed inforequest: <Inforequest: \[%s\]' % scenarios[2][0].pk)
 
-    def test_inforequest_is_skipped_if_exception_raised_while_closing_id(self):
+    def test_inforequest_with_branch_without_actions_does_not_block_other_inforequests(self):
         timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
-        scenarios = [self._create_inforequest_scenario() for i in range(3)]
+        scenarios = [self._create_inforequest_scenario((u'request', self._delivered(u'2010-03-05')))
+                for i in range(3)]
+        self._create_branch(inforequest=scenarios[1][0])
 
         timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
-        with mock.patch(u'chcemvediet.apps.inforequests.cron.nop', side_effect=[None, None, None, None, Exception, None]):
-            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger') as logger:
-                with created_instances(Action.objects) as action_set:
-                    self._call_cron_job()
+        logger = mock.Mock()
+        with mock.patch(u'poleno.cron.cron_logger', logger):
+            with mock.patch(u'chcemvediet.apps.inforequests.cron.cron_logger', logger):
+                self._call_cron_job()
+        self.assertItemsEqual(Inforequest.objects.closed(), [scenarios[0][0], scenarios[2][0]])
+        logged = self._logged(logger)
+        self.assertEqual(len(logged), 3)
+        self.assertRegexpMatches(logged[0], u'Checking inforequest deadlines failed: <Inforequest: \[%s\]' % scenarios[1][0].pk)
+
+    def test_inforequest_is_skipped_if_exception_raised_while_closing_it(self):
+        timewarp.jump(local_datetime_from_local(u'2010-03-05 10:33:00'))
+        scenarios = [self._create_inforequest_scenario((u'request', self._delivered(u'2010-03-05')))
+                for i in range(3)]
+
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        with self._fail_at_call(u'_close_inforequest', 1) as logger:
+            with created_instances(Action.objects) as action_set:
+                self._call_cron_job()
         self.assertEqual(action_set.count(), 2)
         self.assertEqual(Inforequest.objects.closed().count(), 2)
-        self.assertEqual(len(logger.mock_calls), 3)
-        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Closed inforequest: <Inforequest: %s>' % scenarios[0][0].pk)
-        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Closing inforequest failed: <Inforequest: %s>' % scenarios[1][0].pk)
-        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Closed inforequest: <Inforequest: %s>' % scenarios[2][0].pk)
+        logged = self._logged(logger)
+        self.assertEqual(len(logged), 3)
+        self.assertRegexpMatches(logged[0], u'Closed inforequest: <Inforequest: \[%s\]' % scenarios[0][0].pk)
+        self.assertRegexpMatches(logged[1], u'Closing inforequest failed: <Inforequest: \[%s\]' % scenarios[1][0].pk)
+        self.assertRegexpMatches(logged[2], u'Closed inforequest: <Inforequest: \[%s\]' % scenarios[2][0].pk)
+
+    def test_branch_is_skipped_if_exception_raised_while_sending_obligee_deadline_reminder(self):
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        inforequest, _, actions = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'advancement', [], [], []),
+                )
+        _, (_, ((_, (action1,)), (_, (action2,)), (_, (action3,)))) = actions
+
+        timewarp.jump(local_datetime_from_local(u'2010-10-25 10:33:00'))
+        with self._fail_at_call(u'_send_obligee_deadline_reminder', 1) as logger:
+            message_set = self._call_cron_job()
+        self.assertEqual(message_set.count(), 2)
+        logged = self._logged(logger)
+        self.assertEqual(len(logged), 3)
+        self.assertRegexpMatches(logged[0], u'Sent obligee deadline reminder: <Action: \[%s\]' % action1.pk)
+        self.assertRegexpMatches(logged[1], u'Sending obligee deadline reminder failed: <Branch: %s>' % action2.branch.pk)
+        self.assertRegexpMatches(logged[2], u'Sent obligee deadline reminder: <Action: \[%s\]' % action3.pk)
+
+    def test_branch_is_skipped_if_exception_raised_while_sending_applicant_deadline_reminder(self):
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        clarification_request = (u'clarification_request', self._delivered(u'2010-10-06'))
+        inforequest, _, actions = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'advancement',
+                    [clarification_request], [clarification_request], [clarification_request]),
+                )
+        _, (_, ((_, (_, action1)), (_, (_, action2)), (_, (_, action3)))) = actions
+
+        timewarp.jump(local_datetime_from_local(u'2010-10-20 10:33:00'))
+        with self._fail_at_call(u'_send_applicant_deadline_reminder', 1) as logger:
+            message_set = self._call_cron_job()
+        self.assertEqual(message_set.count(), 2)
+        logged = self._logged(logger)
+        self.assertEqual(len(logged), 3)
+        self.assertRegexpMatches(logged[0], u'Sent applicant deadline reminder: <Action: \[%s\]' % action1.pk)
+        self.assertRegexpMatches(logged[1], u'Sending applicant deadline reminder failed: <Branch: %s>' % action2.branch.pk)
+        self.assertRegexpMatches(logged[2], u'Sent applicant deadline reminder: <Action: \[%s\]' % action3.pk)
@@ -737,3 +737,45 @@ class ActionTest(InforequestsTestCaseMixin, TestCase):
             actions.append(self._create_action(branch=branch, effective_date=naive_date(date)))
         result = Action.objects.order_by_effective_date()
         self.assertEqual(list(result), sorted(actions, key=lambda a: (a.effective_date, a.pk)))
+
+class ActionDeadlineFieldsTest(InforequestsTestCaseMixin, TestCase):
+    u"""
+    Tests recomputing materialized deadline fields in ``Action.save()``.
+    """
+
+    def _create_request(self):
+        _, _, (request,) = self._create_inforequest_scenario((u'request', dict(
+                legal_date=naive_date(u'2010-10-05'), delivered_date=naive_date(u'2010-10-05'))))
+        return request
+
+    def test_deadline_fields_are_saved_with_update_fields_tuple(self):
+        request = self._create_request()
+        request.delivered_date = naive_date(u'2010-10-12')
+        update_fields = (u'delivered_date',)
+        request.save(update_fields=update_fields)
+        self.assertEqual(update_fields, (u'delivered_date',))
+        saved = Action.objects.get(pk=request.pk)
+        self.assertEqual(saved.delivered_date, naive_date(u'2010-10-12'))
+        self.assertEqual(saved.deadline_date, saved.deadline.deadline_date)
+
+    def test_update_fields_list_is_not_modified(self):
+        request = self._create_request()
+        request.delivered_date = naive_date(u'2010-10-12')
+        update_fields = [u'delivered_date']
+        request.save(update_fields=update_fields)
+        self.assertEqual(update_fields, [u'delivered_date'])
+        self.assertEqual(Action.objects.get(pk=request.pk).deadline_date,
+                request.deadline.deadline_date)
+
+    def test_saving_last_deadline_reminder_reschedules_deadline_events(self):
+        request = self._create_request()
+        request.last_deadline_reminder = local_datetime_from_local(u'2010-10-20 10:33:00')
+        with mock.patch(u'chcemvediet.apps.inforequests.models.action.DeadlineEvent.schedule') as schedule:
+            request.save(update_fields=(u'last_deadline_reminder',))
+        self.assertEqual(schedule.call_count, 1)
+
+    def test_saving_other_fields_does_not_reschedule_deadline_events(self):
+        request = self._create_request()
+        with mock.patch(u'chcemvediet.apps.inforequests.models.action.DeadlineEvent.schedule') as schedule:
+            request.save(update_fields=(u'subject',))
+        self.assertFalse(schedule.called)
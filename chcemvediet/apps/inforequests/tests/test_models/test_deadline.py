@@ -0,0 +1,138 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import mock
+import datetime
+
+from django.test import TestCase
+
+from poleno.timewarp import timewarp
+from poleno.workdays import workdays
+from poleno.utils.date import local_datetime_from_local, naive_date
+from poleno.utils.misc import Bunch
+
+from .. import InforequestsTestCaseMixin
+from ...models import Action
+from ...models.deadline import Deadline
+
+class DeadlinePrefetchDatesTest(InforequestsTestCaseMixin, TestCase):
+    u"""
+    Tests ``Deadline.prefetch_dates()`` static method.
+    """
+
+    def _deadline(self):
+        return Deadline(Deadline.TYPES.OBLIGEE_DEADLINE, naive_date(u'2010-12-31'), 8,
+                Deadline.UNITS.WORKDAYS, naive_date(u'2011-01-20'))
+
+
+    def test_dates_are_cached_on_deadlines(self):
+        deadline = self._deadline()
+        fresh = self._deadline()
+        expected = (fresh.deadline_date, fresh.snooze_date)
+        Deadline.prefetch_dates([Bunch(deadline=deadline)])
+        with mock.patch(u'chcemvediet.apps.inforequests.models.deadline.workdays.advance') as advance:
+            self.assertEqual((deadline.deadline_date, deadline.snooze_date), expected)
+        self.assertFalse(advance.called)
+
+    def test_actions_without_deadline_are_skipped(self):
+        deadline = self._deadline()
+        Deadline.prefetch_dates([None, Bunch(deadline=None), Bunch(deadline=deadline)])
+        self.assertIn(u'deadline_date', deadline.__dict__)
+
+    def test_given_calendar_is_used(self):
+        deadline = self._deadline()
+        calendar = mock.Mock(wraps=workdays.Workdays())
+        with mock.patch(u'chcemvediet.apps.inforequests.models.deadline.workdays.Workdays') as cls:
+            Deadline.prefetch_dates([Bunch(deadline=deadline)], calendar)
+        self.assertFalse(cls.called)
+        calendar.advance.assert_called_once_with(naive_date(u'2010-12-31'), 8)
+
+class DeadlineEvaluateManyTest(InforequestsTestCaseMixin, TestCase):
+    u"""
+    Tests ``Deadline.evaluate_many()`` static method against properties of single deadlines.
+    """
+
+    def _deadlines(self):
+        res = []
+        for base_date in [u'2010-12-20', u'2010-12-31', u'2011-04-20']:
+            for value in [0, 1, 8, 15, 40]:
+                for unit in [Deadline.UNITS.CALENDAR_DAYS, Deadline.UNITS.WORKDAYS]:
+                    for snooze in [None, 3, 20]:
+                        base = naive_date(base_date)
+                        snooze = base + datetime.timedelta(days=value+snooze) if snooze else None
+                        res.append(Deadline(Deadline.TYPES.OBLIGEE_DEADLINE, base, value, unit,
+                                snooze))
+        return res
+
+    def _delivered(self, date, **kwargs):
+        kwargs.update(legal_date=naive_date(date), delivered_date=naive_date(date))
+        return kwargs
+
+    def _assertMatchesProperties(self, res, deadline, at):
+        self.assertEqual(res.deadline_date, deadline.deadline_date)
+        self.assertEqual(res.snooze_date, deadline.snooze_date)
+        self.assertEqual(res.calendar_days_remaining, deadline.calendar_days_remaining_at(at))
+        self.assertEqual(res.workdays_remaining, deadline.workdays_remaining_at(at))
+        self.assertEqual(res.snooze_calendar_days_remaining,
+                deadline.snooze_calendar_days_remaining_at(at))
+        self.assertEqual(res.snooze_workdays_remaining, deadline.snooze_workdays_remaining_at(at))
+        self.assertEqual(res.is_deadline_missed, deadline.is_deadline_missed_at(at))
+        self.assertEqual(res.is_snooze_missed, deadline.is_snooze_missed_at(at))
+
+
+    def test_results_match_single_deadline_properties(self):
+        deadlines = self._deadlines()
+        for at in [u'2010-12-25', u'2011-01-15', u'2011-05-30']:
+            at = naive_date(at)
+            actions = [Bunch(deadline=d) for d in deadlines]
+            res = Deadline.evaluate_many(actions, at)
+            self.assertEqual(len(res), len(deadlines))
+            for r, action in zip(res, actions):
+                self.assertIs(r.action, action)
+                self.assertIs(r.deadline, action.deadline)
+                # Fresh deadline computes its dates without ``evaluate_many()``
+                fresh = Deadline(action.deadline.type, action.deadline.base_date,
+                        action.deadline.value, action.deadline.unit, action.deadline._snooze)
+                self._assertMatchesProperties(r, fresh, at)
+
+    def test_evaluated_at_today_by_default(self):
+        timewarp.jump(local_datetime_from_local(u'2011-01-15 10:33:00'))
+        deadline = Deadline(Deadline.TYPES.APPLICANT_DEADLINE, naive_date(u'2010-12-31'), 15,
+                Deadline.UNITS.WORKDAYS, None)
+        res = Deadline.evaluate_many([Bunch(deadline=deadline)])
+        self.assertIs(res[0].deadline, deadline)
+        self._assertMatchesProperties(res[0], deadline, naive_date(u'2011-01-15'))
+        self.assertEqual(res[0].calendar_days_remaining, deadline.calendar_days_remaining)
+        self.assertEqual(res[0].workdays_remaining, deadline.workdays_remaining)
+
+    def test_actions_without_deadline(self):
+        deadline = Deadline(Deadline.TYPES.OBLIGEE_DEADLINE, naive_date(u'2010-12-31'), 8,
+                Deadline.UNITS.WORKDAYS, None)
+        res = Deadline.evaluate_many([Bunch(deadline=None), Bunch(deadline=deadline),
+                Bunch(deadline=None)], naive_date(u'2011-01-15'))
+        self.assertIsNone(res[0])
+        self.assertEqual(res[1].deadline, deadline)
+        self.assertIsNone(res[2])
+
+    def test_workday_calendar_is_looked_up_only_once(self):
+        actions = [Bunch(deadline=d) for d in self._deadlines()]
+        with mock.patch(u'chcemvediet.apps.inforequests.models.deadline.workdays.Workdays',
+                wraps=workdays.Workdays) as calendar:
+            Deadline.evaluate_many(actions, naive_date(u'2011-01-15'))
+        calendar.assert_called_once_with()
+
+    def test_action_deadlines(self):
+        inforequest, branch, actions = self._create_inforequest_scenario(
+                (u'request', self._delivered(u'2010-10-05')),
+                (u'confirmation', self._delivered(u'2010-10-08')),
+                (u'extension', self._delivered(u'2010-10-12', extension=4)),
+                (u'refusal', self._delivered(u'2010-10-20')),
+                )
+        actions = list(Action.objects.filter(branch=branch).order_by_pk())
+        at = naive_date(u'2010-11-10')
+        res = Deadline.evaluate_many(actions, at)
+        for r, action in zip(res, actions):
+            if action.deadline is None:
+                self.assertIsNone(r)
+            else:
+                self.assertIs(r.deadline, action.deadline)
+                self._assertMatchesProperties(r, Action.objects.get(pk=action.pk).deadline, at)
@@ -121,6 +121,22 @@ class InforequestTest(InforequestsTestCaseMixin, TestCase):
         with self.assertRaisesMessage(AssertionError, u'Inforequest.unique_email is read-only'):
             inforequest = self._create_inforequest(unique_email=u'something@example.com')
 
+    def test_unique_email_key_field_is_lower_case_unique_email(self):
+        with self.settings(INFOREQUEST_UNIQUE_EMAIL=u'{token}@eXAMplE.coM'):
+            with mock.patch(u'chcemvediet.apps.inforequests.models.inforequest.random_readable_string', return_value=u'aAAa'):
+                inforequest = self._create_inforequest()
+        self.assertEqual(inforequest.unique_email, u'aAAa@eXAMplE.coM')
+        self.assertEqual(inforequest.unique_email_key, u'aaaa@example.com')
+
+    def test_unique_email_field_handling_case_insensitive_collisions(self):
+        with self.settings(INFOREQUEST_UNIQUE_EMAIL=u'{token}@example.com'):
+            with mock.patch(u'chcemvediet.apps.inforequests.models.inforequest.random_readable_string') as mock_random:
+                mock_random.side_effect = [u'bbbb', u'BbBb', u'cccc']
+                inforequest1 = self._create_inforequest()
+                inforequest2 = self._create_inforequest()
+                self.assertEqual(inforequest1.unique_email, u'bbbb@example.com')
+                self.assertEqual(inforequest2.unique_email, u'cccc@example.com')
+
     def test_submission_date_field_is_autogenerated_when_creating_new_instance(self):
         timewarp.jump(local_datetime_from_local(u'2014-10-05 10:33:00'))
         inforequest = self._create_inforequest()
@@ -1005,6 +1021,14 @@ class InforequestTest(InforequestsTestCaseMixin, TestCase):
         result = Inforequest.objects.not_closed()
         self.assertItemsEqual(result, [inforequest2, inforequest4])
 
+    def test_with_unique_emails_query_method(self):
+        inforequest1 = self._create_inforequest()
+        inforequest2 = self._create_inforequest()
+        inforequest3 = self._create_inforequest()
+        result = Inforequest.objects.with_unique_emails(
+                [inforequest1.unique_email.upper(), inforequest3.unique_email, u'other@example.com'])
+        self.assertItemsEqual(result, [inforequest1, inforequest3])
+
     def test_with_and_without_undecided_email_query_methods(self):
         inforequest1, _, _ = self._create_inforequest_scenario(u'confirmation', u'extension')
         inforequest2, _, _ = self._create_inforequest_scenario(u'refusal')
@@ -5,20 +5,37 @@ import mock
 from django.test import TestCase
 
 from poleno.mail.models import Message, Recipient
-from poleno.mail.signals import message_received
+from poleno.mail.signals import messages_received
 from poleno.utils.test import created_instances
 
 from . import InforequestsTestCaseMixin
-from ..signals import assign_email_on_message_received
+from ..signals import assign_emails_on_messages_received
 from ..models import InforequestEmail
 
-class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
+class AssignEmailsOnMessagesReceivedTest(InforequestsTestCaseMixin, TestCase):
     u"""
-    Tests ``assign_email_on_message_received()`` event receiver.
+    Tests ``assign_emails_on_messages_received()`` event receiver.
     """
 
     def test_event_receiver_is_registered(self):
-        self.assertIn(assign_email_on_message_received, message_received._live_receivers(sender=None))
+        self.assertIn(assign_emails_on_messages_received, messages_received._live_receivers(sender=None))
+
+    def test_multiple_messages_are_assigned_at_once(self):
+        inforequest1 = self._create_inforequest()
+        inforequest2 = self._create_inforequest()
+        msg1 = self._create_message(received_for=inforequest1.unique_email)
+        msg2 = self._create_message(received_for=inforequest2.unique_email)
+        msg3 = self._create_message(received_for=inforequest1.unique_email)
+        msg4 = self._create_message(received_for=u'invalid@mail.com')
+
+        with created_instances(InforequestEmail.objects) as rel_set:
+            assign_emails_on_messages_received(sender=None, messages=[msg1, msg2, msg3, msg4])
+        self.assertEqual(rel_set.count(), 3)
+
+        self.assertItemsEqual(msg1.inforequest_set.all(), [inforequest1])
+        self.assertItemsEqual(msg2.inforequest_set.all(), [inforequest2])
+        self.assertItemsEqual(msg3.inforequest_set.all(), [inforequest1])
+        self.assertItemsEqual(msg4.inforequest_set.all(), [])
 
     def test_received_message_is_assigned_and_marked_undecided(self):
         inforequest = self._create_inforequest()
@@ -26,7 +43,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         self._create_recipient(message=msg, mail=inforequest.unique_email)
 
         with created_instances(InforequestEmail.objects) as rel_set:
-            assign_email_on_message_received(sender=None, message=msg)
+            assign_emails_on_messages_received(sender=None, messages=[msg])
         rel = rel_set.get()
 
         self.assertEqual(rel.inforequest, inforequest)
@@ -40,7 +57,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         self._create_recipient(message=msg, mail=u'invalid@mail.com')
 
         with created_instances(InforequestEmail.objects) as rel_set:
-            assign_email_on_message_received(sender=None, message=msg)
+            assign_emails_on_messages_received(sender=None, messages=[msg])
         self.assertFalse(rel_set.exists())
 
         self.assertItemsEqual(msg.inforequest_set.all(), [])
@@ -53,7 +70,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         self._create_recipient(message=msg, mail=inforequest2.unique_email)
 
         with created_instances(InforequestEmail.objects) as rel_set:
-            assign_email_on_message_received(sender=None, message=msg)
+            assign_emails_on_messages_received(sender=None, messages=[msg])
         self.assertFalse(rel_set.exists())
 
         self.assertItemsEqual(msg.inforequest_set.all(), [])
@@ -63,7 +80,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(omit=[u'received_for'])
 
         with created_instances(InforequestEmail.objects) as rel_set:
-            assign_email_on_message_received(sender=None, message=msg)
+            assign_emails_on_messages_received(sender=None, messages=[msg])
         self.assertFalse(rel_set.exists())
 
         self.assertItemsEqual(msg.inforequest_set.all(), [])
@@ -73,7 +90,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(omit=[u'received_for'])
         self._create_recipient(message=msg, mail=inforequest.unique_email, type=Recipient.TYPES.TO)
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -82,7 +99,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(omit=[u'received_for'])
         self._create_recipient(message=msg, mail=inforequest.unique_email, type=Recipient.TYPES.CC)
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -91,7 +108,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(omit=[u'received_for'])
         self._create_recipient(message=msg, mail=inforequest.unique_email, type=Recipient.TYPES.BCC)
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -99,7 +116,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         inforequest = self._create_inforequest()
         msg = self._create_message(received_for=inforequest.unique_email)
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -109,7 +126,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(received_for=inforequest1.unique_email)
         self._create_recipient(message=msg, mail=inforequest2.unique_email)
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest1])
 
@@ -119,7 +136,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         self._create_recipient(message=msg, mail=inforequest.unique_email)
         self._create_recipient(message=msg, mail=u'other@example.com')
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -130,7 +147,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(omit=[u'received_for'])
         self._create_recipient(message=msg, mail=u'AaAA@ExampLE.com')
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -140,7 +157,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
                 inforequest = self._create_inforequest()
         msg = self._create_message(received_for=u'AaAA@ExampLE.com')
 
-        assign_email_on_message_received(sender=None, message=msg)
+        assign_emails_on_messages_received(sender=None, messages=[msg])
 
         self.assertItemsEqual(msg.inforequest_set.all(), [inforequest])
 
@@ -151,7 +168,7 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
 
         with self.settings(DEFAULT_FROM_EMAIL=u'info@example.com'):
             with created_instances(Message.objects) as message_set:
-                assign_email_on_message_received(sender=None, message=msg)
+                assign_emails_on_messages_received(sender=None, messages=[msg])
         notification = message_set.get()
 
         self.assertEqual(notification.type, Message.TYPES.OUTBOUND)
@@ -165,5 +182,5 @@ class AssignEmailOnMessageReceivedTest(InforequestsTestCaseMixin, TestCase):
         msg = self._create_message(received_for=inforequest.unique_email)
 
         with created_instances(Message.objects) as message_set:
-            assign_email_on_message_received(sender=None, message=msg)
+            assign_emails_on_messages_received(sender=None, messages=[msg])
         self.assertFalse(message_set.exists())
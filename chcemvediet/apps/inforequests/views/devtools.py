@@ -12,7 +12,7 @@ from django.contrib import messages
 from poleno.mail.models import Message, Recipient
 from poleno.utils.urls import reverse
 from poleno.utils.views import login_required
-from chcemvediet.apps.inforequests.models import Inforequest, Action
+from chcemvediet.apps.inforequests.models import Inforequest, Action, DeadlineEvent
 
 
 @require_http_methods([u'POST'])
@@ -64,6 +64,7 @@ def devtools_undo_last_action(request, inforequest_pk):
         messages.error(request, u'Nothing deleted, the branch contains only an advanced request.')
     else:
         branch.last_action.delete()
+        DeadlineEvent.schedule(inforequest)
         messages.success(request, u'The last action, {0}, of branch {1} to {2} was deleted.'.format(
             branch.last_action.get_type_display(), branch.pk, branch.historicalobligee.name))
 
@@ -99,6 +100,10 @@ def devtools_push_history(request, inforequest_pk):
                 legal_date=F(u'legal_date') - delta,
                 last_deadline_reminder=F(u'last_deadline_reminder') - delta,
                 )
+        # Materialized deadlines and deadline events depend on the pushed dates
+        actions = Action.objects.filter(branch__inforequest=inforequest).order_by_created()
+        for action in actions:
+            action.save(update_fields=list(Action.DEADLINE_FIELDS))
         messages.success(request,
                 u'The inforequest was pushed in history by {} days.'.format(days))
     else:
@@ -2,17 +2,20 @@
 # -*- coding: utf-8 -*-
 import datetime
 
-from django.db import transaction
 from django.conf import settings
 
-from poleno.cron import cron_job
+from poleno.attachments.models import Attachment
+from poleno.cron import cron_job, cron_delete
 from poleno.utils.date import utc_now
 
 from .models import WizardDraft
 
 
+def _delete_attachments(drafts):
+    return Attachment.objects.attached_to(drafts).delete_keeping_files()
+
 @cron_job(run_at_times=settings.CRON_UNIMPORTANT_MAINTENANCE_TIMES)
-@transaction.atomic
 def delete_old_drafts():
     threshold = utc_now() - datetime.timedelta(days=15)
-    WizardDraft.objects.filter(modified__lt=threshold).delete()
+    cron_delete(WizardDraft.objects.filter(modified__lt=threshold), u'Deleting old wizard draft',
+            before_delete=_delete_attachments, after_delete=Attachment.delete_files)
@@ -4,16 +4,25 @@ import os
 from email.utils import formataddr
 
 from django.core.mail import EmailMessage
-from django.core.management import call_command
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.contrib.sessions.models import Session
 
-from poleno.cron import cron_job, cron_logger
+from poleno.attachments.models import Attachment
+from poleno.cron import cron_job, cron_logger, cron_delete
+from poleno.utils.date import utc_now
 
 
+def _delete_session_attachments(sessions):
+    return Attachment.objects.attached_to(sessions).delete_keeping_files()
+
 @cron_job(run_at_times=settings.CRON_UNIMPORTANT_MAINTENANCE_TIMES)
 def clear_expired_sessions():
-    call_command(u'clearsessions')
+    # Deleted sessions don't emit ``post_delete`` signals, so their attachments must be deleted
+    # explicitly. See ``delete_attachments_on_session_post_delete``.
+    expired = Session.objects.filter(expire_date__lt=utc_now())
+    cron_delete(expired, u'Clearing expired session',
+            before_delete=_delete_session_attachments, after_delete=Attachment.delete_files)
     cron_logger.info(u'Cleared expired sessions.')
 
 @cron_job(run_every_mins=60)
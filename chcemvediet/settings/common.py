@@ -117,16 +117,24 @@ TEMPLATE_CONTEXT_PROCESSORS = (
 CRON_USER_INTERACTION_TIMES = [u'09:00', u'10:00', u'11:00', u'12:00', u'13:00', u'14:00']
 CRON_IMPORTANT_MAINTENANCE_TIMES = [u'02:00', u'03:00', u'04:00', u'05:00']
 CRON_UNIMPORTANT_MAINTENANCE_TIMES = [u'04:00']
+# Number of threads cron jobs use to dispatch their work, e.g. to send reminders. Every thread uses
+# its own database connection, so keep it 1 for SQLite.
+CRON_DISPATCH_WORKERS = 1
+# Number of cron jobs ``cronserver`` may run at the same time. Keep it 1 for SQLite as well.
+CRON_SCHEDULER_WORKERS = 1
+# Number of shards inforequest cron jobs are split into. Nodes running cron jobs split the shards
+# among themselves.
+CRON_INFOREQUEST_SHARDS = 1
+# Cron jobs hold leases, so they run on at most one node at a time. If the node crashes, its lease
+# expires after this number of seconds.
+CRON_LEASE_DURATION = 300
 CRON_CLASSES = (
     u'poleno.cron.cron.clear_old_cronlogs',
     u'poleno.datacheck.cron.datacheck',
     u'poleno.mail.cron.mail',
     u'chcemvediet.apps.wizards.cron.delete_old_drafts',
     u'chcemvediet.apps.inforequests.cron.undecided_email_reminder',
-    u'chcemvediet.apps.inforequests.cron.obligee_deadline_reminder',
-    u'chcemvediet.apps.inforequests.cron.applicant_deadline_reminder',
-    u'chcemvediet.apps.inforequests.cron.close_inforequests',
-    u'chcemvediet.apps.inforequests.cron.add_expirations',
+    u'chcemvediet.apps.inforequests.cron.deadline_sweep',
     u'chcemvediet.cron.clear_expired_sessions',
     u'chcemvediet.cron.send_admin_error_logs',
     )
@@ -2,3 +2,6 @@
 # -*- coding: utf-8 -*-
 
 EMAIL_OUTBOUND_TRANSPORT = u'poleno.mail.transports.mandrill.MandrillTransport'
+CRON_CLASSES += (
+    u'poleno.mail.transports.mandrill.cron.webhook',
+    )
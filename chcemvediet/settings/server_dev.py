@@ -21,6 +21,9 @@ DATABASES = {
         },
     }
 
+CRON_DISPATCH_WORKERS = 4
+CRON_SCHEDULER_WORKERS = 2
+
 INSTALLED_APPS += (
     u'poleno.timewarp',
     )
@@ -22,6 +22,9 @@ DATABASES = {
         },
     }
 
+CRON_DISPATCH_WORKERS = 4
+CRON_SCHEDULER_WORKERS = 2
+
 CACHES = {
     u'default': {
         u'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -30,6 +30,9 @@ DATABASES = {
         },
     }
 
+CRON_DISPATCH_WORKERS = 4
+CRON_SCHEDULER_WORKERS = 2
+
 CACHES = {
     u'default': {
         u'BACKEND': u'django.core.cache.backends.memcached.MemcachedCache',
@@ -1,10 +1,15 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import os
+from testfixtures import TempDirectory
+
+from django.core.files.base import ContentFile
 from django.contrib.auth.models import User
 from django.contrib.sessions.models import Session
 from django.test import TestCase
 from django.test.utils import override_settings
 
+from poleno.attachments.models import Attachment
 from poleno.timewarp import timewarp
 from poleno.utils.date import utc_datetime_from_local
 
@@ -19,13 +24,16 @@ class ClearExpiredSessionsCronjobTest(TestCase):
         super(ClearExpiredSessionsCronjobTest, self)._pre_setup()
         timewarp.enable()
         timewarp.reset()
+        self.tempdir = TempDirectory()
         self.settings_override = override_settings(
+            MEDIA_ROOT=self.tempdir.path,
             PASSWORD_HASHERS=(u'django.contrib.auth.hashers.MD5PasswordHasher',),
             )
         self.settings_override.enable()
 
     def _post_teardown(self):
         self.settings_override.disable()
+        self.tempdir.cleanup()
         timewarp.reset()
         super(ClearExpiredSessionsCronjobTest, self)._post_teardown()
 
@@ -48,3 +56,20 @@ class ClearExpiredSessionsCronjobTest(TestCase):
         self.assertTrue(Session.objects.exists())
         clear_expired_sessions().do()
         self.assertTrue(Session.objects.exists())
+
+    def test_attachments_of_expired_sessions_are_deleted(self):
+        timewarp.jump(utc_datetime_from_local(u'2014-10-01 09:30:00'))
+        old = Session.objects.create(session_key=u'old', session_data=u'',
+                expire_date=utc_datetime_from_local(u'2014-10-10 09:30:00'))
+        new = Session.objects.create(session_key=u'new', session_data=u'',
+                expire_date=utc_datetime_from_local(u'2014-10-20 09:30:00'))
+        old_attachment = Attachment.objects.create(generic_object=old, name=u'filename.txt',
+                content_type=u'text/plain', file=ContentFile(u'content', name=u'filename.txt'))
+        new_attachment = Attachment.objects.create(generic_object=new, name=u'filename.txt',
+                content_type=u'text/plain', file=ContentFile(u'content', name=u'filename.txt'))
+
+        timewarp.jump(utc_datetime_from_local(u'2014-10-16 09:30:00'))
+        clear_expired_sessions().do()
+        self.assertItemsEqual(Session.objects.all(), [new])
+        self.assertItemsEqual(Attachment.objects.all(), [new_attachment])
+        self.assertFalse(os.path.exists(old_attachment.file.path))
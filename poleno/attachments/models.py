@@ -42,6 +42,39 @@ class AttachmentQuerySet(QuerySet):
     def order_by_pk(self):
         return self.order_by(u'pk')
 
+    def delete_with_files(self):
+        u"""
+        Deletes the attachments with a single query together with their files. Unlike ``delete()``
+        it does not emit ``post_delete`` signal for every deleted attachment. Do not use it in
+        a transaction, as the files can't be restored if the transaction is rolled back. Use
+        ``delete_keeping_files()`` in the transaction and delete the files with
+        ``Attachment.delete_files()`` after it is committed instead.
+        """
+        Attachment.delete_files(self.delete_keeping_files())
+
+    def delete_keeping_files(self):
+        u"""
+        Deletes the attachments with a single query, but keeps their files. Returns names of the
+        files, so they may be deleted with ``Attachment.delete_files()`` later. Use it in
+        a transaction, so no attachments are added while they are being deleted.
+        """
+        names = list(self.values_list(u'file', flat=True))
+        if names:
+            self._raw_delete(self.db)
+        return [n for n in names if n]
+
+    def bulk_create_with_files(self, attachments):
+        u"""
+        Creates new attachments with a single query. ``Attachment.save()`` forbids bulk create,
+        because it generates the random file names and computes the sizes of new attachments.
+        This method does the same for every attachment first. The files are written to the
+        storage when the attachments are inserted. Unlike ``save()`` it does not emit
+        ``pre_save`` and ``post_save`` signals.
+        """
+        for attachment in attachments:
+            attachment._prepare_new()
+        super(QuerySet, self).bulk_create(attachments)
+
 class Attachment(FormatMixin, models.Model):
     # May NOT be NULL; Generic relation; Index is prefix of [generic_type, generic_id] index
     generic_type = models.ForeignKey(ContentType, db_index=False)
@@ -98,16 +131,29 @@ class Attachment(FormatMixin, models.Model):
         finally:
             self.file.close()
 
+    def _prepare_new(self):
+        self.file.name = random_string(10)
+        if self.created is None:
+            self.created = utc_now()
+        self.size = self.file.size
+
     @decorate(prevent_bulk_create=True)
     def save(self, *args, **kwargs):
         if self.pk is None: # Creating a new object
-            self.file.name = random_string(10)
-            if self.created is None:
-                self.created = utc_now()
-            self.size = self.file.size
+            self._prepare_new()
 
         super(Attachment, self).save(*args, **kwargs)
 
+    @classmethod
+    def delete_files(cls, names):
+        u"""
+        Deletes files with the given names from the attachment storage. See
+        ``AttachmentQuerySet.delete_keeping_files()``.
+        """
+        storage = cls._meta.get_field(u'file').storage
+        for name in names:
+            storage.delete(name)
+
     def clone(self, generic_object):
         u""" The returned copy is not saved. """
         return Attachment(
@@ -1,5 +1,6 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import os
 import random
 import datetime
 from testfixtures import TempDirectory
@@ -230,6 +231,52 @@ class AttachmentModelTest(TestCase):
         with self.assertRaisesMessage(TypeError, u'Expecting QuerySet, Model instance, or Model class.'):
             result = Attachment.objects.attached_to(None)
 
+    def test_delete_with_files_query_method(self):
+        obj1 = self._create_instance(generic_object=self.user)
+        obj2 = self._create_instance(generic_object=self.user2)
+        obj3 = self._create_instance(generic_object=self.user2)
+        path1, path2, path3 = obj1.file.path, obj2.file.path, obj3.file.path
+        Attachment.objects.attached_to(self.user2).delete_with_files()
+        self.assertItemsEqual(Attachment.objects.all(), [obj1])
+        self.assertTrue(os.path.exists(path1))
+        self.assertFalse(os.path.exists(path2))
+        self.assertFalse(os.path.exists(path3))
+
+    def test_delete_with_files_query_method_with_no_attachments(self):
+        obj = self._create_instance(generic_object=self.user)
+        Attachment.objects.attached_to(self.user2).delete_with_files()
+        self.assertItemsEqual(Attachment.objects.all(), [obj])
+
+    def test_delete_keeping_files_query_method(self):
+        obj1 = self._create_instance(generic_object=self.user)
+        obj2 = self._create_instance(generic_object=self.user2)
+        path1, path2 = obj1.file.path, obj2.file.path
+        names = Attachment.objects.attached_to(self.user2).delete_keeping_files()
+        self.assertEqual(names, [obj2.file.name])
+        self.assertItemsEqual(Attachment.objects.all(), [obj1])
+        self.assertTrue(os.path.exists(path2))
+        Attachment.delete_files(names)
+        self.assertTrue(os.path.exists(path1))
+        self.assertFalse(os.path.exists(path2))
+
+    def test_bulk_create_with_files_query_method(self):
+        objs = [Attachment(generic_object=self.user, name=u'file{}.txt'.format(i),
+                content_type=u'text/plain', file=ContentFile(u'content {}'.format(i)))
+                for i in range(3)]
+        with self.assertNumQueries(1):
+            Attachment.objects.bulk_create_with_files(objs)
+        result = Attachment.objects.attached_to(self.user).order_by(u'name')
+        self.assertEqual([(a.name, a.content, a.size) for a in result],
+                [(u'file{}.txt'.format(i), u'content {}'.format(i), 9) for i in range(3)])
+        self.assertEqual(len(set(a.file.name for a in result)), 3)
+        for obj in result:
+            self.assertAlmostEqual(obj.created, utc_now(), delta=datetime.timedelta(seconds=10))
+
+    def test_bulk_create_is_still_forbidden(self):
+        obj = Attachment(generic_object=self.user, file=ContentFile(u'content'))
+        with self.assertRaisesMessage(ValueError, u"Can't bulk create Attachment"):
+            Attachment.objects.bulk_create([obj])
+
     def test_order_by_pk_query_method(self):
         objs = [self._create_instance(generic_object=self.user) for i in range(20)]
         sample = random.sample(objs, 10)
@@ -1,24 +1,46 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import time
+import Queue
 import logging
+import threading
+import traceback
 
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.translation import get_language
 from django_cron import CronJobBase, Schedule
 
+from poleno.utils.translation import translation
+
+from .instrument import instrumented, current_stats, activate_stats
+
 
 default_app_config = 'poleno.cron.apps.CronConfig'
 cron_logger = logging.getLogger(u'poleno.cron')
 
-def cron_job(**kwargs):
+def cron_job(shards=None, **kwargs):
     u"""
     Decorator to create a cron job class. To enable the created cron job, add it to
     ``CRON_CLASSES`` in ``settings.py``.
 
+    The job holds a lease while running, so it runs on at most one node at a time if ``runcrons``
+    is run on multiple nodes. If ``shards`` is given, the job work is split into that many shards
+    and the function is called with a ``Shard`` argument for every shard not being processed by
+    other nodes nor already processed in the current run. Use ``shard.filter(queryset)`` to
+    restrict the processed objects to the shard.
+
+    Every run is measured and saved as ``CronRun``. Use ``cron_count()`` to report the number of
+    items the job examined and acted on. Items handled by ``cron_dispatch()`` are counted
+    automatically.
+
     Depends on: django_cron
 
     Arguments:
      -- run_every_mins: int
      -- run_at_times: list of 'HH:MM' srings
      -- retry_after_failure_mins: int
+     -- shards: int
 
     Example:
         @cron_job(run_every_mins=60)
@@ -28,13 +50,160 @@ def cron_job(**kwargs):
         @cron_job(run_at_times=['09:00'], retry_after_failure_mins=10)
         def run_every_morning():
             pass
+
+        @cron_job(run_every_mins=60, shards=4)
+        def run_every_hour_on_multiple_nodes(shard):
+            for book in shard.filter(Book.objects.all()):
+                pass
     """
     def decorator(function):
         class CronJob(CronJobBase):
             schedule = Schedule(**kwargs)
             code = u'{}.{}'.format(function.__module__.split('.')[-2], function.__name__)
             def do(self):
-                return function()
+                from .lease import run_leased, run_started
+                with instrumented(self.code):
+                    return run_leased(self.code, function, shards, run_started(self.schedule))
         CronJob.__name__ = function.__name__
         return CronJob
     return decorator
+
+def cron_count(examined=0, acted=0):
+    u"""
+    Adds to the number of items examined and acted on by the cron job running in the current
+    thread. The numbers are saved with the job ``CronRun``. Does nothing if no cron job is running.
+
+    Example:
+        @cron_job(run_at_times=[u'09:00'])
+        def send_reminders():
+            users = list(User.objects.filter(...))
+            cron_count(examined=len(users))
+            for user in users:
+                if user.needs_reminder():
+                    user.send_reminder()
+                    cron_count(acted=1)
+    """
+    stats = current_stats()
+    if stats is not None:
+        stats.add(examined=examined, acted=acted)
+
+def _dispatch_items(queue, handler, name, failed):
+    while True:
+        try:
+            item = queue.get_nowait()
+        except Queue.Empty:
+            return
+        try:
+            with transaction.atomic():
+                handler(item)
+        except Exception:
+            failed.append(item)
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'{} failed: {}\n{}'.format(name, item, trace))
+
+def _dispatch_worker(queue, handler, name, failed, language_code, stats):
+    try:
+        with translation(language_code), activate_stats(stats):
+            _dispatch_items(queue, handler, name, failed)
+    finally:
+        # Every thread has its own database connection.
+        connection.close()
+
+def cron_dispatch(items, handler, name, workers=None):
+    u"""
+    Calls ``handler(item)`` for every item, every call in its own transaction. If the handler
+    fails, the failure is logged and the remaining items are handled anyway. ``name`` describes
+    the work in logs, e.g. "Sending reminder". Logs a summary with the throughput and the number
+    of failures. Returns the list of failed items. Successfully handled items are counted as
+    acted on by the running cron job.
+
+    The items are handled by a pool of ``workers`` threads, by default
+    ``settings.CRON_DISPATCH_WORKERS``. With a single worker the items are handled in the current
+    thread. Worker threads use their own database connections, so don't call it with more than
+    one worker inside a transaction. The threads would not see its uncommitted changes and could
+    deadlock on rows it has locked.
+
+    Example:
+        @cron_job(run_at_times=[u'09:00'])
+        def send_reminders():
+            users = User.objects.filter(...)
+            cron_dispatch(users, lambda user: user.send_reminder(), u'Sending reminder')
+    """
+    queue = Queue.Queue()
+    for item in items:
+        queue.put(item)
+    if queue.empty():
+        return []
+
+    count = queue.qsize()
+    if workers is None:
+        workers = getattr(settings, u'CRON_DISPATCH_WORKERS', 1)
+    workers = max(1, min(workers, count))
+    failed = []
+
+    start = time.time()
+    if workers == 1:
+        _dispatch_items(queue, handler, name, failed)
+    else:
+        threads = [threading.Thread(target=_dispatch_worker,
+                args=(queue, handler, name, failed, get_language(), current_stats()))
+                for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.time() - start
+    cron_count(acted=count - len(failed))
+
+    cron_logger.info(u'{}: {} items, {} failed, {} workers, {:.2f} s, {:.1f} items/s'.format(
+            name, count, len(failed), workers, elapsed, count / elapsed if elapsed else 0))
+    return failed
+
+def cron_delete(queryset, name, chunk_size=500, before_delete=None, after_delete=None):
+    u"""
+    Deletes objects returned by ``queryset`` in chunks of at most ``chunk_size`` objects ordered by
+    primary key, every chunk in its own short transaction, so the deletion does not lock the table
+    for long. ``name`` describes the work in logs, e.g. "Deleting old draft". Logs a summary with
+    the throughput. Returns the number of deleted objects.
+
+    Every chunk is deleted with a single query. Neither ``pre_delete`` nor ``post_delete`` signals
+    are emitted and related objects are not deleted. If the objects have any, delete them with
+    ``before_delete(chunk)``. It's called with a queryset of the chunk objects in the chunk
+    transaction before the chunk is deleted. Work that can't be rolled back, e.g. deleting files,
+    should be done by ``after_delete(result)`` instead. It's called with the value returned by
+    ``before_delete`` only after the chunk transaction is committed.
+
+    Example:
+        @cron_job(run_at_times=[u'04:00'])
+        def delete_old_books():
+            books = Book.objects.filter(published__lt=...)
+            cron_delete(books, u'Deleting old book',
+                    before_delete=lambda chunk: Page.objects.filter(book__in=chunk).delete())
+    """
+    model = queryset.model
+    count = 0
+    last = None
+    start = time.time()
+    while True:
+        pks = queryset.order_by(u'pk')
+        if last is not None:
+            pks = pks.filter(pk__gt=last)
+        pks = list(pks.values_list(u'pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        result = None
+        with transaction.atomic():
+            chunk = model._default_manager.filter(pk__in=pks)
+            if before_delete is not None:
+                result = before_delete(chunk)
+            chunk._raw_delete(chunk.db)
+        if after_delete is not None:
+            after_delete(result)
+        count += len(pks)
+        last = pks[-1]
+    elapsed = time.time() - start
+    cron_count(examined=count, acted=count)
+
+    cron_logger.info(u'{}: {} items, {:.2f} s, {:.1f} items/s'.format(
+            name, count, elapsed, count / elapsed if elapsed else 0))
+    return count
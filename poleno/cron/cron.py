@@ -2,17 +2,20 @@
 # -*- coding: utf-8 -*-
 from datetime import timedelta
 
-from django.db import transaction
 from django.conf import settings
 from django_cron.models import CronJobLog
 
-from poleno.cron import cron_job, cron_logger
+from poleno.cron import cron_job, cron_logger, cron_delete
 from poleno.utils.date import utc_now
 
+from .models import CronRun
+
 
 @cron_job(run_at_times=settings.CRON_UNIMPORTANT_MAINTENANCE_TIMES)
-@transaction.atomic
 def clear_old_cronlogs():
     threshold = utc_now() - timedelta(days=7)
-    CronJobLog.objects.filter(start_time__lt=threshold).delete()
+    cron_delete(CronJobLog.objects.filter(start_time__lt=threshold), u'Clearing old cron log')
+    # Runs are kept longer, so we can see how jobs degrade over time.
+    threshold = utc_now() - timedelta(days=90)
+    cron_delete(CronRun.objects.filter(started__lt=threshold), u'Clearing old cron run')
     cron_logger.info(u'Cleared old cron logs.')
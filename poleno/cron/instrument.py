@@ -0,0 +1,109 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import os
+import time
+import resource
+import threading
+import traceback
+from contextlib import contextmanager
+
+from django.db import connection
+
+from poleno.utils.date import utc_now
+
+
+_local = threading.local()
+
+class CronStats(object):
+    u"""
+    Counters of a running cron job. Worker threads of the job add to the same counters, so the
+    counters are guarded with a lock.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.query_time = 0.0
+        self.examined = 0
+        self.acted = 0
+
+    def add(self, **kwargs):
+        with self.lock:
+            for name, value in kwargs.items():
+                setattr(self, name, getattr(self, name) + value)
+
+def current_stats():
+    u"""
+    Returns counters of the cron job running in the current thread, or None.
+    """
+    return getattr(_local, u'stats', None)
+
+@contextmanager
+def _count_queries(stats):
+    # Django records executed queries only with debug cursors. We record them only for the
+    # duration of the block and forget them afterwards, so they don't pile up in long running
+    # processes.
+    start = len(connection.queries)
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    try:
+        yield
+    finally:
+        connection.use_debug_cursor = use_debug_cursor
+        queries = connection.queries[start:]
+        del connection.queries[start:]
+        stats.add(queries=len(queries), query_time=sum(float(q[u'time']) for q in queries))
+
+@contextmanager
+def activate_stats(stats):
+    u"""
+    Activates ``stats`` in the current thread, so queries executed by the thread and items
+    reported by ``cron_count()`` are added to them. Used by worker threads of cron jobs.
+    """
+    if stats is None:
+        yield
+        return
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        with _count_queries(stats):
+            yield
+    finally:
+        _local.stats = previous
+
+@contextmanager
+def instrumented(code):
+    u"""
+    Measures the cron job ``code`` run in the block and saves the measurements as ``CronRun``.
+    Exceptions raised in the block are propagated.
+    """
+    from .models import CronRun
+    from . import cron_logger
+
+    stats = CronStats()
+    started = utc_now()
+    wall_start = time.time()
+    cpu_start = sum(os.times()[:2])
+    # The peak is kept for the whole process, so we record only how much the run raised it.
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    is_success = False
+    try:
+        with activate_stats(stats):
+            yield stats
+        is_success = True
+    finally:
+        try:
+            CronRun.objects.create(
+                    code=code,
+                    started=started,
+                    is_success=is_success,
+                    wall_time=time.time() - wall_start,
+                    cpu_time=sum(os.times()[:2]) - cpu_start,
+                    queries=stats.queries,
+                    query_time=stats.query_time,
+                    peak_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start,
+                    examined=stats.examined,
+                    acted=stats.acted,
+                    )
+        except Exception:
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'Saving run of cron job "{}" failed:\n{}'.format(code, trace))
@@ -0,0 +1,131 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import datetime
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+from poleno.utils.date import local_now, local_datetime_from_local
+
+from . import cron_logger
+from .models import CronLease
+
+
+class Shard(object):
+    u"""
+    Part of the work of a sharded cron job. The work is split into ``count`` shards by ranges of
+    primary keys of the processed objects. Nodes running the job split the shards among themselves.
+    """
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+
+    def filter(self, queryset):
+        u"""
+        Restricts ``queryset`` to objects with primary keys within this shard range. The range of
+        all existing primary keys is split into ``count`` ranges of equal width. If new objects
+        are created while other nodes process their shards, the ranges may shift a bit, so jobs
+        using shards should not depend on processing every object exactly once per run.
+        """
+        last = queryset.model.objects.order_by(u'-pk').values_list(u'pk', flat=True).first()
+        width = (last or 0) // self.count + 1
+        queryset = queryset.filter(pk__gte=self.index * width)
+        if self.index < self.count - 1:
+            queryset = queryset.filter(pk__lt=(self.index + 1) * width)
+        return queryset
+
+    def __unicode__(self):
+        return u'{}/{}'.format(self.index + 1, self.count)
+
+    def __repr__(self):
+        return u'<Shard: {}>'.format(self).encode(u'utf-8')
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, lease, duration):
+        super(_Heartbeat, self).__init__()
+        self.daemon = True
+        self.lease = lease
+        self.duration = duration
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.duration / 3.0):
+                if not self.lease.heartbeat(self.duration):
+                    cron_logger.error(u'Cron job "{}" lost its lease.'.format(self.lease.code))
+                    return
+        finally:
+            # The thread has its own database connection.
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def run_started(schedule):
+    u"""
+    Returns the date and time the current run of a cron job with ``schedule`` started. For jobs
+    run at ``run_at_times`` it's the last of the times that passed, so all nodes running the job
+    at that time agree on it. Runs of jobs run every ``run_every_mins`` have no common start, so
+    it's the current time. Such nodes skip only shards finished after they started the run.
+    """
+    now = local_now()
+    if not schedule.run_at_times:
+        return now
+    times = sorted(datetime.datetime.strptime(t, u'%H:%M').time() for t in schedule.run_at_times)
+    passed = [t for t in times if t <= now.time()]
+    if passed:
+        return local_datetime_from_local(now.date(), passed[-1])
+    return local_datetime_from_local(now.date() - datetime.timedelta(days=1), times[-1])
+
+@contextmanager
+def cron_lease(code, shard=0, duration=None, since=None):
+    u"""
+    Context manager acquiring the lease for cron job ``code`` and its ``shard``. Yields the lease,
+    or None if another node holds it or if the shard was finished since ``since``. While the
+    ``with`` block is running the lease is renewed by heartbeats from a background thread. It's
+    released when the block exits. If the node crashes, the lease expires in ``duration``
+    seconds, by default ``settings.CRON_LEASE_DURATION``.
+    """
+    if duration is None:
+        duration = getattr(settings, u'CRON_LEASE_DURATION', 300)
+    lease = CronLease.acquire(code, shard, duration, since)
+    if lease is None:
+        yield None
+        return
+
+    heartbeat = _Heartbeat(lease, duration)
+    heartbeat.start()
+    try:
+        yield lease
+    finally:
+        heartbeat.stop()
+        lease.release()
+
+def run_leased(code, function, shards, since=None):
+    u"""
+    Runs cron job ``function`` if no other node is running it. If ``shards`` is not None, the
+    function is called for every shard not being processed by other nodes. Shards processed
+    successfully by any node since ``since``, the start of the current run, are skipped, so a node
+    finishing early does not process them again after other nodes release them. Returns the
+    message to store in the cron job log.
+    """
+    if shards is None:
+        with cron_lease(code) as lease:
+            if lease is None:
+                cron_logger.info(u'Cron job "{}" is running on another node.'.format(code))
+                return u'Skipped, running on another node.'
+            return function()
+
+    done = []
+    for index in range(shards):
+        shard = Shard(index, shards)
+        with cron_lease(code, index, since=since) as lease:
+            if lease is None:
+                continue
+            function(shard)
+            lease.finish()
+            done.append(shard)
+    return u'Processed shards: {}'.format(u', '.join(format(s) for s in done) or u'none')
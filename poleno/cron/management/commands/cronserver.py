@@ -1,30 +1,37 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
-import time
 from textwrap import dedent
 from optparse import make_option
 
-from django.core.management import call_command
+from django.conf import settings
 from django.core.management.base import NoArgsCommand
-from poleno.utils.date import utc_now
 from poleno.utils.misc import squeeze
 
 from django_cron.models import CronJobLog
 
+from poleno.cron.scheduler import Scheduler
+
 
 class Command(NoArgsCommand):
     default_interval = 60
 
     help = dedent(u"""\
-        Dummy cron server for local development. Repeatedly calls ``runcrons`` management command
-        executing all sheduled cron jobs.""")
+        Cron server running all cron jobs from ``CRON_CLASSES`` at their scheduled times. Keeps
+        the job schedules in memory, sleeps until the next job is due and runs the jobs in a pool
+        of worker threads.""")
 
     option_list = NoArgsCommand.option_list + (
         make_option(u'--interval', action=u'store', type=u'int', dest=u'interval',
             default=default_interval, help=squeeze(u"""
-                Interval in seconds how often to check if there are jobs to run. Defaults to {}
-                secons.
+                Maximal interval in seconds the server sleeps before checking the clock again. It
+                is relevant only if the clock may be changed, e.g. by timewarp. Defaults to {}
+                seconds.
                 """).format(default_interval)),
+        make_option(u'--workers', action=u'store', type=u'int', dest=u'workers',
+            default=None, help=squeeze(u"""
+                Number of jobs that may run at the same time. Defaults to
+                ``settings.CRON_SCHEDULER_WORKERS``.
+                """)),
         make_option(u'--clearlogs', action=u'store_true', dest=u'clearlogs', default=False,
             help=squeeze(u"""
                 Clear cron logs before running the server like no cron jobs have ever been run yet.
@@ -33,17 +40,13 @@ class Command(NoArgsCommand):
 
     def handle_noargs(self, **options):
         interval = options[u'interval']
+        workers = options[u'workers'] or getattr(settings, u'CRON_SCHEDULER_WORKERS', 1)
         clearlogs = options[u'clearlogs']
 
         try:
             if clearlogs:
                 CronJobLog.objects.all().delete()
-            while True:
-                # If we are timewarping, we may encounter cron logs from future. We must remove
-                # them, otherwise django_cron won't run any jobs with logs from furure.
-                CronJobLog.objects.filter(end_time__gt=utc_now()).delete()
-
-                call_command(u'runcrons')
-                time.sleep(interval)
+            scheduler = Scheduler(settings.CRON_CLASSES, workers=workers, max_sleep=interval)
+            scheduler.serve()
         except KeyboardInterrupt:
             pass
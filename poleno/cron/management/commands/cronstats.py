@@ -0,0 +1,83 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import math
+import datetime
+import collections
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from poleno.utils.date import utc_now
+from poleno.utils.misc import squeeze
+
+from poleno.cron.models import CronRun
+
+
+def percentile(values, percent):
+    u"""
+    Returns the nearest-rank percentile of sorted ``values``.
+    """
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+class Command(NoArgsCommand):
+    default_days = 30
+
+    help = squeeze(u"""
+            Prints percentiles of wall time, CPU time, SQL queries, peak memory and processed items
+            of recent cron job runs per job.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--days', action=u'store', type=u'int', dest=u'days',
+            default=default_days, help=squeeze(u"""
+                Number of past days to include. Defaults to {} days.
+                """).format(default_days)),
+        make_option(u'--code', action=u'append', dest=u'codes', default=[],
+            help=squeeze(u"""
+                Code of the cron job to print, e.g. "inforequests.deadline_sweep". May be given
+                multiple times. Defaults to all jobs.
+                """)),
+        )
+
+    metrics = [
+            (u'wall_time',  u'Wall time [s]',    u'{:.2f}'),
+            (u'cpu_time',   u'CPU time [s]',     u'{:.2f}'),
+            (u'queries',    u'SQL queries',      u'{}'),
+            (u'query_time', u'SQL time [s]',     u'{:.2f}'),
+            (u'peak_rss',   u'RSS growth [KiB]', u'{}'),
+            (u'examined',   u'Examined',         u'{}'),
+            (u'acted',      u'Acted on',         u'{}'),
+            ]
+    percents = [50, 90, 99, 100]
+
+    def handle_noargs(self, **options):
+        since = utc_now() - datetime.timedelta(days=options[u'days'])
+        runs = CronRun.objects.since(since).order_by_started()
+        if options[u'codes']:
+            runs = runs.filter(code__in=options[u'codes'])
+
+        fields = [u'code', u'is_success'] + [m for m, _, _ in self.metrics]
+        values = collections.defaultdict(lambda: collections.defaultdict(list))
+        failures = collections.defaultdict(int)
+        for row in runs.values_list(*fields).iterator():
+            code, is_success = row[:2]
+            if not is_success:
+                failures[code] += 1
+            for (metric, _, _), value in zip(self.metrics, row[2:]):
+                values[code][metric].append(value)
+
+        if not values:
+            self.stdout.write(u'No cron job runs in the last {} days.'.format(options[u'days']))
+            return
+
+        header = u''.join(u'{:>12}'.format(u'p{}'.format(p) if p < 100 else u'max')
+                for p in self.percents)
+        for code in sorted(values):
+            count = len(values[code][self.metrics[0][0]])
+            self.stdout.write(u'{}: {} runs, {} failed'.format(code, count, failures[code]))
+            self.stdout.write(u'    {:<16}{}'.format(u'', header))
+            for metric, label, fmt in self.metrics:
+                sorted_values = sorted(values[code][metric])
+                self.stdout.write(u'    {:<16}{}'.format(label, u''.join(
+                        u'{:>12}'.format(fmt.format(percentile(sorted_values, p)))
+                        for p in self.percents)))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import poleno.utils.misc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronLease',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('code', models.CharField(help_text='Code of the cron job the lease is for.', max_length=255)),
+                ('shard', models.IntegerField(default=0, help_text='Shard of the cron job the lease is for. 0 for cron jobs without shards.')),
+                ('owner', models.CharField(help_text='Host, process and random identifier of the node holding or last holding the lease.', max_length=255, blank=True)),
+                ('acquired', models.DateTimeField(help_text='Date and time the lease was acquired by its owner.')),
+                ('expires', models.DateTimeField(help_text='The lease is held by its owner until it expires. The owner extends it with heartbeats while the cron job is running. If the owner crashes, the lease expires and other nodes may acquire it.')),
+            ],
+            options={
+            },
+            bases=(poleno.utils.misc.FormatMixin, models.Model),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cronlease',
+            unique_together=set([('code', 'shard')]),
+        ),
+    ]
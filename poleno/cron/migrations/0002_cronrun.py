@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import poleno.utils.misc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cron', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('code', models.CharField(help_text='Code of the cron job that was run.', max_length=255)),
+                ('started', models.DateTimeField(help_text='Date and time the run started.')),
+                ('is_success', models.BooleanField(default=False, help_text='False if the cron job raised an exception.')),
+                ('wall_time', models.FloatField(help_text='Wall clock duration of the run in seconds.')),
+                ('cpu_time', models.FloatField(help_text='User and system CPU time of the process spent during the run in seconds. Includes CPU time of other cron jobs running at the same time in the same process.')),
+                ('queries', models.IntegerField(help_text='Number of SQL queries executed by the run, including queries of its ``cron_dispatch`` worker threads.')),
+                ('query_time', models.FloatField(help_text='Total duration of the SQL queries executed by the run in seconds.')),
+                ('peak_rss', models.IntegerField(help_text='Growth of the peak resident set size of the process during the run in KiB.')),
+                ('examined', models.IntegerField(help_text='Number of items the run examined, as reported with ``cron_count()``.')),
+                ('acted', models.IntegerField(help_text='Number of items the run acted on, as reported with ``cron_count()`` or handled successfully by ``cron_dispatch()``.')),
+            ],
+            options={
+            },
+            bases=(poleno.utils.misc.FormatMixin, models.Model),
+        ),
+        migrations.AlterIndexTogether(
+            name='cronrun',
+            index_together=set([('code', 'started')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cron', '0002_cronrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronlease',
+            name='finished',
+            field=models.DateTimeField(help_text='Date and time the shard was last processed successfully. Other nodes running the cron job in the same run skip it. NULL if it was never processed.', null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
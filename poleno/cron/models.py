@@ -0,0 +1,197 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import os
+import uuid
+import socket
+import datetime
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q
+
+from poleno.utils.models import QuerySet
+from poleno.utils.date import utc_now
+from poleno.utils.misc import FormatMixin, squeeze
+
+
+# Identifies this process among all nodes running cron jobs.
+OWNER = u'{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+class CronLeaseQuerySet(QuerySet):
+    def expired(self):
+        return self.filter(expires__lt=utc_now())
+    def not_expired(self):
+        return self.filter(expires__gte=utc_now())
+    def owned(self):
+        return self.filter(owner=OWNER)
+
+class CronLease(FormatMixin, models.Model):
+    # May NOT be empty; Index is prefix of [code, shard] unique index
+    code = models.CharField(max_length=255,
+            help_text=u'Code of the cron job the lease is for.')
+
+    # May NOT be NULL
+    shard = models.IntegerField(default=0,
+            help_text=u'Shard of the cron job the lease is for. 0 for cron jobs without shards.')
+
+    # May be empty
+    owner = models.CharField(blank=True, max_length=255,
+            help_text=squeeze(u"""
+                Host, process and random identifier of the node holding or last holding the lease.
+                """))
+
+    # May NOT be NULL
+    acquired = models.DateTimeField(
+            help_text=u'Date and time the lease was acquired by its owner.')
+
+    # May NOT be NULL
+    expires = models.DateTimeField(
+            help_text=squeeze(u"""
+                The lease is held by its owner until it expires. The owner extends it with
+                heartbeats while the cron job is running. If the owner crashes, the lease expires
+                and other nodes may acquire it.
+                """))
+
+    # May be NULL
+    finished = models.DateTimeField(blank=True, null=True,
+            help_text=squeeze(u"""
+                Date and time the shard was last processed successfully. Other nodes running the
+                cron job in the same run skip it. NULL if it was never processed.
+                """))
+
+    # Indexes:
+    #  -- code, shard: unique_together
+
+    objects = CronLeaseQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [
+                [u'code', u'shard'],
+                ]
+
+    @classmethod
+    def acquire(cls, code, shard, duration, since=None):
+        u"""
+        Acquires the lease for cron job ``code`` and its ``shard`` for ``duration`` seconds.
+        Returns the lease, or None if the lease is held by another node. If ``since`` is given,
+        returns None as well if the shard was finished since then by any node.
+        """
+        now = utc_now()
+        expires = now + datetime.timedelta(seconds=duration)
+        leases = cls.objects.filter(code=code, shard=shard)
+        if since is not None:
+            leases = leases.exclude(finished__gte=since)
+        updated = (leases
+                .filter(Q(expires__lt=now) | Q(owner=OWNER))
+                .update(owner=OWNER, acquired=now, expires=expires))
+        if not updated:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(code=code, shard=shard, owner=OWNER, acquired=now,
+                            expires=expires)
+            except IntegrityError:
+                # The lease exists and is held by another node
+                return None
+        return cls.objects.get(code=code, shard=shard)
+
+    def heartbeat(self, duration):
+        u"""
+        Extends the lease for ``duration`` seconds since now. Returns False if the lease was lost
+        in the meantime, because it expired and another node acquired it.
+        """
+        expires = utc_now() + datetime.timedelta(seconds=duration)
+        updated = CronLease.objects.owned().filter(pk=self.pk).update(expires=expires)
+        if updated:
+            self.expires = expires
+        return bool(updated)
+
+    def release(self):
+        u"""
+        Releases the lease, so other nodes may acquire it immediately.
+        """
+        now = utc_now()
+        CronLease.objects.owned().filter(pk=self.pk).update(expires=now)
+        self.expires = now
+
+    def finish(self):
+        u"""
+        Marks the shard as processed, so other nodes skip it in the same run, and releases the
+        lease.
+        """
+        now = utc_now()
+        CronLease.objects.owned().filter(pk=self.pk).update(finished=now, expires=now)
+        self.finished = now
+        self.expires = now
+
+    def __unicode__(self):
+        return format(self.pk)
+
+class CronRunQuerySet(QuerySet):
+    def since(self, dt):
+        return self.filter(started__gte=dt)
+    def order_by_started(self):
+        return self.order_by(u'started', u'pk')
+
+class CronRun(FormatMixin, models.Model):
+    # May NOT be empty; Index is prefix of [code, started] index
+    code = models.CharField(max_length=255,
+            help_text=u'Code of the cron job that was run.')
+
+    # May NOT be NULL
+    started = models.DateTimeField(
+            help_text=u'Date and time the run started.')
+
+    # May NOT be NULL
+    is_success = models.BooleanField(default=False,
+            help_text=u'False if the cron job raised an exception.')
+
+    # May NOT be NULL
+    wall_time = models.FloatField(
+            help_text=u'Wall clock duration of the run in seconds.')
+
+    # May NOT be NULL
+    cpu_time = models.FloatField(
+            help_text=squeeze(u"""
+                User and system CPU time of the process spent during the run in seconds. Includes
+                CPU time of other cron jobs running at the same time in the same process.
+                """))
+
+    # May NOT be NULL
+    queries = models.IntegerField(
+            help_text=squeeze(u"""
+                Number of SQL queries executed by the run, including queries of its
+                ``cron_dispatch`` worker threads.
+                """))
+
+    # May NOT be NULL
+    query_time = models.FloatField(
+            help_text=u'Total duration of the SQL queries executed by the run in seconds.')
+
+    # May NOT be NULL
+    peak_rss = models.IntegerField(
+            help_text=squeeze(u"""
+                Growth of the peak resident set size of the process during the run in KiB.
+                """))
+
+    # May NOT be NULL
+    examined = models.IntegerField(
+            help_text=u'Number of items the run examined, as reported with ``cron_count()``.')
+
+    # May NOT be NULL
+    acted = models.IntegerField(
+            help_text=squeeze(u"""
+                Number of items the run acted on, as reported with ``cron_count()`` or handled
+                successfully by ``cron_dispatch()``.
+                """))
+
+    # Indexes:
+    #  -- code, started: index_together
+
+    objects = CronRunQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+                [u'code', u'started'],
+                ]
+
+    def __unicode__(self):
+        return format(self.pk)
@@ -0,0 +1,234 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+import Queue
+import datetime
+import threading
+import traceback
+
+from django.db import connection
+from django.utils.module_loading import import_by_path
+from django.utils.translation import get_language
+from django_cron.models import CronJobLog
+
+from poleno.utils.date import local_now, local_datetime, local_datetime_from_local, utc_now
+from poleno.utils.translation import translation
+
+from . import cron_logger
+
+
+class ScheduledJob(object):
+    u"""
+    Cron job with its schedule state kept in memory. The state is loaded from ``CronJobLog`` when
+    the scheduler starts and updated with every finished run, so the scheduler does not need to
+    query the logs to decide when to run the job again. The rules match ``django_cron``, except
+    that if the scheduler missed several ``run_at_times`` of the job, the job is run only once for
+    all of them.
+    """
+    def __init__(self, job_class):
+        self.job_class = job_class
+        self.code = job_class.code
+        self.schedule = job_class.schedule
+        self.run_at_times = sorted(datetime.datetime.strptime(t, u'%H:%M').time()
+                for t in self.schedule.run_at_times)
+        self.running = False
+        self.next_run = None
+        # Start time of the last periodic run if it succeeded
+        self.last_success = None
+        # Start time of the last run if it failed
+        self.last_failure = None
+        # The day and the latest of ``run_at_times`` the job was last run for
+        self.ran_at_date = None
+        self.ran_at_time = None
+
+    def load_state(self):
+        last = CronJobLog.objects.filter(code=self.code).order_by(u'-start_time').first()
+        self.last_failure = last.start_time if last and not last.is_success else None
+
+        last = (CronJobLog.objects
+                .filter(code=self.code, is_success=True, ran_at_time__isnull=True)
+                .order_by(u'-start_time')
+                .first())
+        self.last_success = last.start_time if last else None
+
+        midnight = local_datetime_from_local(local_now().date(), datetime.time(0, 0))
+        last = (CronJobLog.objects
+                .filter(code=self.code, start_time__gte=midnight, ran_at_time__isnull=False)
+                .order_by(u'-ran_at_time')
+                .first())
+        self.ran_at_date = local_datetime(last.start_time).date() if last else None
+        self.ran_at_time = last.ran_at_time if last else None
+
+    def due_time_at(self, now):
+        u"""
+        Returns the latest of ``run_at_times`` the job should be run for at ``now``, or None.
+        """
+        times = [t for t in self.run_at_times if t <= now.time()]
+        if self.ran_at_date == now.date():
+            times = [t for t in times if t > self.ran_at_time]
+        return times[-1] if times else None
+
+    def compute_next_run(self, now):
+        candidates = []
+        if self.schedule.run_every_mins is not None:
+            if self.last_failure and self.schedule.retry_after_failure_mins:
+                candidates.append(self.last_failure
+                        + datetime.timedelta(minutes=self.schedule.retry_after_failure_mins))
+            elif self.last_success:
+                candidates.append(self.last_success
+                        + datetime.timedelta(minutes=self.schedule.run_every_mins))
+            else:
+                candidates.append(now)
+        if self.run_at_times:
+            if self.due_time_at(now) is not None:
+                candidates.append(now)
+            else:
+                today = [t for t in self.run_at_times if t > now.time()]
+                if today:
+                    candidates.append(local_datetime_from_local(now.date(), today[0]))
+                else:
+                    tomorrow = now.date() + datetime.timedelta(days=1)
+                    candidates.append(local_datetime_from_local(tomorrow, self.run_at_times[0]))
+        self.next_run = min(candidates) if candidates else None
+
+    def record(self, log):
+        if log.is_success:
+            self.last_failure = None
+            if log.ran_at_time is None:
+                self.last_success = log.start_time
+        else:
+            self.last_failure = log.start_time
+        if log.ran_at_time is not None:
+            self.ran_at_date = local_datetime(log.start_time).date()
+            self.ran_at_time = log.ran_at_time
+
+    def run(self, ran_at_time):
+        u"""
+        Runs the job and saves its ``CronJobLog``. Exceptions raised by the job are logged.
+        Returns the log.
+        """
+        log = CronJobLog(code=self.code, start_time=utc_now(), ran_at_time=ran_at_time)
+        try:
+            message = self.job_class().do()
+            log.is_success = True
+        except Exception:
+            message = unicode(traceback.format_exc(), u'utf-8')
+            log.is_success = False
+            cron_logger.error(u'Cron job "{}" failed:\n{}'.format(self.code, message))
+        log.message = (message or u'')[-1000:]
+        log.end_time = utc_now()
+        try:
+            log.save()
+        except Exception:
+            # The schedule is updated from the unsaved log anyway, so the job is not rerun
+            # immediately.
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'Saving log of cron job "{}" failed:\n{}'.format(self.code, trace))
+        return log
+
+    def __unicode__(self):
+        return self.code
+
+class Scheduler(object):
+    u"""
+    In-process cron scheduler. Keeps schedules of the given cron jobs in memory, sleeps until the
+    next job is due and runs due jobs in a pool of ``workers`` threads. A job is never run again
+    before its previous run finishes. The state is persisted to ``CronJobLog`` only when a job
+    finishes, so ``runcrons`` may still be used to run the same jobs.
+
+    The scheduler wakes up at least once in ``max_sleep`` seconds to notice if the clock was
+    changed, e.g. by timewarp. If the clock goes back in time, cron logs from the future are
+    deleted and the schedule is reloaded.
+    """
+    def __init__(self, job_paths, workers=1, max_sleep=60):
+        self.jobs = [ScheduledJob(import_by_path(path)) for path in job_paths]
+        self.workers = workers
+        self.max_sleep = max_sleep
+        self.pending = Queue.Queue()
+        self.finished = Queue.Queue()
+        self.last_now = None
+
+    def load_state(self):
+        # If we are timewarping, we may encounter cron logs from future. We must remove them,
+        # otherwise the jobs with logs from the future would not run.
+        CronJobLog.objects.filter(end_time__gt=utc_now()).delete()
+        now = local_now()
+        for job in self.jobs:
+            job.load_state()
+            job.compute_next_run(now)
+        self.last_now = now
+
+    def run_pending(self):
+        u"""
+        Starts all due jobs that are not running. Returns the number of started jobs.
+        """
+        now = local_now()
+        if self.last_now is None or now < self.last_now:
+            self.load_state()
+        self.last_now = now
+
+        started = 0
+        for job in self.jobs:
+            if job.running or job.next_run is None or job.next_run > now:
+                continue
+            job.running = True
+            started += 1
+            if self.workers > 1:
+                self.pending.put((job, job.due_time_at(now)))
+            else:
+                self.finished.put((job, job.run(job.due_time_at(now))))
+        return started
+
+    def collect_finished(self, timeout=None):
+        u"""
+        Waits at most ``timeout`` seconds for a job to finish and updates the schedule of all
+        finished jobs. If ``timeout`` is None, it does not wait.
+        """
+        block = timeout is not None
+        while True:
+            try:
+                job, log = self.finished.get(block=block, timeout=timeout)
+            except Queue.Empty:
+                return
+            block = False
+            job.running = False
+            job.record(log)
+            job.compute_next_run(local_now())
+
+    def sleep_time(self):
+        now = local_now()
+        waiting = [j.next_run for j in self.jobs if not j.running and j.next_run is not None]
+        if not waiting:
+            return self.max_sleep
+        seconds = (min(waiting) - now).total_seconds()
+        return max(0, min(seconds, self.max_sleep))
+
+    def _worker(self, language_code):
+        with translation(language_code):
+            while True:
+                job, ran_at_time = self.pending.get()
+                try:
+                    log = job.run(ran_at_time)
+                finally:
+                    # Every thread has its own database connection.
+                    connection.close()
+                self.finished.put((job, log))
+
+    def serve(self):
+        u"""
+        Runs the scheduler until interrupted.
+        """
+        if self.workers > 1:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, args=(get_language(),))
+                thread.daemon = True
+                thread.start()
+        while True:
+            self.run_pending()
+            self.collect_finished()
+            timeout = self.sleep_time()
+            if self.workers > 1:
+                # Wake up as soon as a job finishes, so it can be rescheduled.
+                self.collect_finished(timeout=timeout)
+            elif timeout > 0:
+                time.sleep(timeout)
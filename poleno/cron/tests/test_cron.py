@@ -1,16 +1,22 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
 import datetime
+import threading
+import contextlib
+import mock
 
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.translation import get_language
 from django_cron import CronJobBase, CronJobLog
 
 from poleno.timewarp import timewarp
 from poleno.utils.date import local_datetime_from_local, utc_now
 
 from . import CronTestCaseMixin
-from .. import cron_job
+from .. import cron_job, cron_dispatch, cron_delete
 from ..cron import clear_old_cronlogs
+from ..models import CronRun
 
 class CronJobTest(CronTestCaseMixin, TestCase):
     u"""
@@ -296,6 +302,142 @@ class CronJobTest(CronTestCaseMixin, TestCase):
                 )
         timewarp.reset()
 
+class CronDeleteTest(TestCase):
+    u"""
+    Tests ``cron_delete()`` function.
+    """
+
+    def _create_logs(self, count):
+        return [CronJobLog.objects.create(code=u'mock_code', start_time=utc_now(),
+                end_time=utc_now(), is_success=True) for i in range(count)]
+
+    def test_matching_objects_are_deleted(self):
+        logs = self._create_logs(10)
+        kept = CronJobLog.objects.create(code=u'other_code', start_time=utc_now(),
+                end_time=utc_now(), is_success=True)
+        count = cron_delete(CronJobLog.objects.filter(code=u'mock_code'), u'Mock deleting',
+                chunk_size=3)
+        self.assertEqual(count, 10)
+        self.assertItemsEqual(CronJobLog.objects.all(), [kept])
+
+    def test_before_delete_is_called_for_every_chunk(self):
+        logs = self._create_logs(7)
+        chunks = []
+        cron_delete(CronJobLog.objects.all(), u'Mock deleting', chunk_size=3,
+                before_delete=lambda chunk: chunks.append(sorted(l.pk for l in chunk)))
+        self.assertEqual(chunks, [
+                [l.pk for l in logs[0:3]],
+                [l.pk for l in logs[3:6]],
+                [l.pk for l in logs[6:7]],
+                ])
+
+    def test_chunk_is_not_deleted_if_before_delete_fails(self):
+        logs = self._create_logs(5)
+        def before_delete(chunk):
+            if logs[3] in chunk:
+                raise ValueError(u'Mock error')
+        with self.assertRaisesMessage(ValueError, u'Mock error'):
+            cron_delete(CronJobLog.objects.all(), u'Mock deleting', chunk_size=3,
+                    before_delete=before_delete)
+        self.assertItemsEqual(CronJobLog.objects.all(), logs[3:])
+
+    def test_after_delete_is_called_after_every_chunk_is_committed(self):
+        logs = self._create_logs(5)
+        calls = []
+        @contextlib.contextmanager
+        def atomic():
+            calls.append(u'begin')
+            yield
+            calls.append(u'commit')
+        with mock.patch(u'poleno.cron.transaction.atomic', atomic):
+            cron_delete(CronJobLog.objects.all(), u'Mock deleting', chunk_size=3,
+                    before_delete=lambda chunk: sorted(l.pk for l in chunk),
+                    after_delete=calls.append)
+        self.assertEqual(calls, [
+                u'begin', u'commit', [l.pk for l in logs[0:3]],
+                u'begin', u'commit', [l.pk for l in logs[3:5]],
+                ])
+        self.assertFalse(CronJobLog.objects.exists())
+
+    def test_after_delete_is_not_called_if_chunk_is_not_deleted(self):
+        logs = self._create_logs(5)
+        after_delete = mock.Mock()
+        def before_delete(chunk):
+            if logs[3] in chunk:
+                raise ValueError(u'Mock error')
+            return u'result'
+        with self.assertRaisesMessage(ValueError, u'Mock error'):
+            cron_delete(CronJobLog.objects.all(), u'Mock deleting', chunk_size=3,
+                    before_delete=before_delete, after_delete=after_delete)
+        after_delete.assert_called_once_with(u'result')
+
+    def test_summary_is_logged(self):
+        self._create_logs(4)
+        with mock.patch(u'poleno.cron.cron_logger') as mock_logger:
+            cron_delete(CronJobLog.objects.all(), u'Mock deleting')
+        self.assertEqual(len(mock_logger.info.mock_calls), 1)
+        self.assertRegexpMatches(mock_logger.info.call_args[0][0], u'^Mock deleting: 4 items, ')
+
+class CronDispatchTest(TestCase):
+    u"""
+    Tests ``cron_dispatch()`` function.
+    """
+
+    def _handler(self, handled):
+        def handler(item):
+            if item < 0:
+                raise ValueError(u'Negative item')
+            handled.append((item, threading.current_thread(), get_language()))
+        return handler
+
+    def test_all_items_are_handled(self):
+        handled = []
+        failed = cron_dispatch([1, 2, 3], self._handler(handled), u'Mock work', workers=1)
+        self.assertItemsEqual([i for i, t, l in handled], [1, 2, 3])
+        self.assertEqual(failed, [])
+
+    def test_single_worker_handles_items_in_current_thread(self):
+        handled = []
+        cron_dispatch([1, 2, 3], self._handler(handled), u'Mock work', workers=1)
+        self.assertEqual([i for i, t, l in handled], [1, 2, 3])
+        self.assertEqual(set(t for i, t, l in handled), {threading.current_thread()})
+
+    def test_multiple_workers_handle_items_in_worker_threads(self):
+        handled = []
+        failed = cron_dispatch(range(20), self._handler(handled), u'Mock work', workers=4)
+        self.assertItemsEqual([i for i, t, l in handled], range(20))
+        self.assertNotIn(threading.current_thread(), set(t for i, t, l in handled))
+        self.assertEqual(failed, [])
+
+    def test_worker_threads_use_current_language(self):
+        handled = []
+        cron_dispatch(range(5), self._handler(handled), u'Mock work', workers=2)
+        self.assertEqual(set(l for i, t, l in handled), {get_language()})
+
+    def test_failed_items_are_logged_and_do_not_stop_remaining_items(self):
+        handled = []
+        with mock.patch(u'poleno.cron.cron_logger') as logger:
+            failed = cron_dispatch([1, -2, 3, -4], self._handler(handled), u'Mock work', workers=1)
+        self.assertItemsEqual([i for i, t, l in handled], [1, 3])
+        self.assertItemsEqual(failed, [-2, -4])
+        self.assertEqual(len(logger.mock_calls), 3)
+        self.assertRegexpMatches(logger.mock_calls[0][1][0], u'Mock work failed: -2')
+        self.assertRegexpMatches(logger.mock_calls[1][1][0], u'Mock work failed: -4')
+        self.assertRegexpMatches(logger.mock_calls[2][1][0], u'Mock work: 4 items, 2 failed')
+
+    @override_settings(CRON_DISPATCH_WORKERS=3)
+    def test_default_number_of_workers_from_settings(self):
+        handled = []
+        cron_dispatch(range(20), self._handler(handled), u'Mock work')
+        self.assertLessEqual(len(set(t for i, t, l in handled)), 3)
+        self.assertNotIn(threading.current_thread(), set(t for i, t, l in handled))
+
+    def test_empty_items(self):
+        handled = []
+        failed = cron_dispatch([], self._handler(handled), u'Mock work')
+        self.assertEqual(handled, [])
+        self.assertEqual(failed, [])
+
 class ClearOldCronlogsCronjobTest(TestCase):
     u"""
     Tests ``poleno.cron.cron.clear_old_cronlogs`` cron job.
@@ -322,3 +464,14 @@ class ClearOldCronlogsCronjobTest(TestCase):
                 )
         clear_old_cronlogs().do()
         self.assertTrue(CronJobLog.objects.filter(pk=old_log.pk).exists())
+
+    def test_runs_older_than_90_days_are_cleared(self):
+        old_run = CronRun.objects.create(code=u'mock_code',
+                started=(utc_now() - datetime.timedelta(days=91)), is_success=True, wall_time=1,
+                cpu_time=1, queries=1, query_time=1, peak_rss=1, examined=1, acted=1)
+        new_run = CronRun.objects.create(code=u'mock_code',
+                started=(utc_now() - datetime.timedelta(days=89)), is_success=True, wall_time=1,
+                cpu_time=1, queries=1, query_time=1, peak_rss=1, examined=1, acted=1)
+        clear_old_cronlogs().do()
+        self.assertFalse(CronRun.objects.filter(pk=old_run.pk).exists())
+        self.assertTrue(CronRun.objects.filter(pk=new_run.pk).exists())
@@ -0,0 +1,85 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from .. import cron_job, cron_count, cron_dispatch
+from ..models import CronRun
+
+class InstrumentTest(TestCase):
+    u"""
+    Tests ``CronRun`` measurements of runs of ``@cron_job`` jobs.
+    """
+
+    def test_run_is_saved(self):
+        @cron_job(run_every_mins=1)
+        def mock_cron_job():
+            list(User.objects.all())
+            list(User.objects.all())
+            cron_count(examined=5, acted=2)
+            return u'Done'
+
+        res = mock_cron_job().do()
+        self.assertEqual(res, u'Done')
+        run = CronRun.objects.get()
+        self.assertEqual(run.code, u'tests.mock_cron_job')
+        self.assertTrue(run.is_success)
+        self.assertEqual(run.examined, 5)
+        self.assertEqual(run.acted, 2)
+        # Two user queries and queries of the job lease
+        self.assertGreaterEqual(run.queries, 2)
+        self.assertGreaterEqual(run.wall_time, 0)
+        self.assertGreaterEqual(run.cpu_time, 0)
+        self.assertGreaterEqual(run.peak_rss, 0)
+
+    def test_peak_rss_growth_during_run_is_saved(self):
+        @cron_job(run_every_mins=1)
+        def mock_cron_job():
+            pass
+
+        usages = [mock.Mock(ru_maxrss=1000), mock.Mock(ru_maxrss=1500)]
+        with mock.patch(u'poleno.cron.instrument.resource.getrusage', side_effect=usages):
+            mock_cron_job().do()
+        self.assertEqual(CronRun.objects.get().peak_rss, 500)
+
+    def test_queries_are_not_recorded_after_run(self):
+        from django.db import connection
+
+        @cron_job(run_every_mins=1)
+        def mock_cron_job():
+            list(User.objects.all())
+
+        count = len(connection.queries)
+        mock_cron_job().do()
+        self.assertEqual(len(connection.queries), count)
+        self.assertFalse(connection.use_debug_cursor)
+
+    def test_failed_run_is_saved(self):
+        @cron_job(run_every_mins=1)
+        def mock_cron_job():
+            cron_count(examined=3)
+            raise ValueError(u'Mock error')
+
+        with self.assertRaisesMessage(ValueError, u'Mock error'):
+            mock_cron_job().do()
+        run = CronRun.objects.get()
+        self.assertFalse(run.is_success)
+        self.assertEqual(run.examined, 3)
+
+    def test_cron_dispatch_counts_acted_items(self):
+        def handler(item):
+            if item == 2:
+                raise ValueError(u'Mock error')
+
+        @cron_job(run_every_mins=1)
+        def mock_cron_job():
+            cron_dispatch([1, 2, 3, 4], handler, u'Mock work', workers=1)
+
+        mock_cron_job().do()
+        self.assertEqual(CronRun.objects.get().acted, 3)
+
+    def test_cron_count_without_running_job(self):
+        cron_count(examined=1, acted=1)
+        self.assertFalse(CronRun.objects.exists())
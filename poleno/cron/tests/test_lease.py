@@ -0,0 +1,161 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django_cron import Schedule
+
+from poleno.timewarp import timewarp
+from poleno.utils.date import utc_now, local_datetime_from_local
+
+from ..models import CronLease
+from ..lease import Shard, cron_lease, run_leased, run_started
+
+class CronLeaseTest(TestCase):
+    u"""
+    Tests ``CronLease`` model and ``cron_lease`` context manager.
+    """
+
+    def _foreign_lease(self, code, expires):
+        return CronLease.objects.create(code=code, shard=0, owner=u'other', acquired=utc_now(),
+                expires=expires)
+
+    def test_acquire_new_lease(self):
+        lease = CronLease.acquire(u'mock_code', 0, 60)
+        self.assertIsNotNone(lease)
+        self.assertGreater(lease.expires, utc_now())
+
+    def test_acquire_lease_held_by_other_node(self):
+        self._foreign_lease(u'mock_code', utc_now() + datetime.timedelta(minutes=1))
+        self.assertIsNone(CronLease.acquire(u'mock_code', 0, 60))
+
+    def test_acquire_expired_lease_held_by_other_node(self):
+        self._foreign_lease(u'mock_code', utc_now() - datetime.timedelta(minutes=1))
+        lease = CronLease.acquire(u'mock_code', 0, 60)
+        self.assertIsNotNone(lease)
+        self.assertNotEqual(lease.owner, u'other')
+
+    def test_acquire_lease_for_other_shard(self):
+        self._foreign_lease(u'mock_code', utc_now() + datetime.timedelta(minutes=1))
+        self.assertIsNotNone(CronLease.acquire(u'mock_code', 1, 60))
+
+    def test_heartbeat_extends_lease(self):
+        lease = CronLease.acquire(u'mock_code', 0, 1)
+        self.assertTrue(lease.heartbeat(60))
+        lease = CronLease.objects.get(pk=lease.pk)
+        self.assertGreater(lease.expires, utc_now() + datetime.timedelta(seconds=30))
+
+    def test_heartbeat_fails_if_lease_was_lost(self):
+        lease = CronLease.acquire(u'mock_code', 0, 60)
+        CronLease.objects.filter(pk=lease.pk).update(owner=u'other')
+        self.assertFalse(lease.heartbeat(60))
+
+    def test_released_lease_may_be_acquired_by_other_node(self):
+        with cron_lease(u'mock_code') as lease:
+            self.assertIsNotNone(lease)
+        CronLease.objects.filter(pk=lease.pk).update(owner=u'other')
+        self.assertIsNotNone(CronLease.acquire(u'mock_code', 0, 60))
+
+    def test_acquire_lease_for_shard_finished_since_given_time(self):
+        lease = CronLease.acquire(u'mock_code', 0, 60)
+        lease.finish()
+        since = utc_now() - datetime.timedelta(minutes=1)
+        self.assertIsNone(CronLease.acquire(u'mock_code', 0, 60, since))
+        self.assertIsNotNone(CronLease.acquire(u'mock_code', 0, 60, utc_now()))
+
+    def test_cron_lease_yields_none_if_lease_is_held_by_other_node(self):
+        self._foreign_lease(u'mock_code', utc_now() + datetime.timedelta(minutes=1))
+        with cron_lease(u'mock_code') as lease:
+            self.assertIsNone(lease)
+
+class RunLeasedTest(TestCase):
+    u"""
+    Tests ``run_leased()`` function.
+    """
+
+    def test_job_without_shards(self):
+        calls = []
+        res = run_leased(u'mock_code', lambda: calls.append(None) or u'Done', None)
+        self.assertEqual(calls, [None])
+        self.assertEqual(res, u'Done')
+
+    def test_job_without_shards_running_on_other_node(self):
+        CronLease.objects.create(code=u'mock_code', shard=0, owner=u'other', acquired=utc_now(),
+                expires=utc_now() + datetime.timedelta(minutes=1))
+        calls = []
+        run_leased(u'mock_code', lambda: calls.append(None), None)
+        self.assertEqual(calls, [])
+
+    def test_job_with_shards_skips_shards_running_on_other_nodes(self):
+        CronLease.objects.create(code=u'mock_code', shard=1, owner=u'other', acquired=utc_now(),
+                expires=utc_now() + datetime.timedelta(minutes=1))
+        calls = []
+        run_leased(u'mock_code', lambda shard: calls.append(shard.index), 3)
+        self.assertEqual(calls, [0, 2])
+
+    def test_job_with_shards_skips_shards_finished_in_current_run(self):
+        since = utc_now() - datetime.timedelta(minutes=1)
+        CronLease.objects.create(code=u'mock_code', shard=1, owner=u'other', acquired=since,
+                expires=utc_now(), finished=utc_now())
+        calls = []
+        run_leased(u'mock_code', lambda shard: calls.append(shard.index), 3, since)
+        self.assertEqual(calls, [0, 2])
+
+        # Shards finished in the previous run are processed again
+        calls = []
+        run_leased(u'mock_code', lambda shard: calls.append(shard.index), 3, utc_now())
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_failed_shard_is_not_finished(self):
+        def function(shard):
+            raise ValueError(u'Mock error')
+        with self.assertRaisesMessage(ValueError, u'Mock error'):
+            run_leased(u'mock_code', function, 3)
+        lease = CronLease.objects.get(code=u'mock_code', shard=0)
+        self.assertIsNone(lease.finished)
+        self.assertLessEqual(lease.expires, utc_now())
+
+class RunStartedTest(TestCase):
+    u"""
+    Tests ``run_started()`` function.
+    """
+
+    def tearDown(self):
+        timewarp.reset()
+
+    def test_run_at_times(self):
+        schedule = Schedule(run_at_times=[u'14:10', u'09:10'])
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        self.assertEqual(run_started(schedule), local_datetime_from_local(u'2010-10-05 09:10:00'))
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 14:10:00'))
+        self.assertEqual(run_started(schedule), local_datetime_from_local(u'2010-10-05 14:10:00'))
+
+    def test_run_at_times_before_first_time_of_day(self):
+        schedule = Schedule(run_at_times=[u'09:10', u'14:10'])
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 08:00:00'))
+        self.assertEqual(run_started(schedule), local_datetime_from_local(u'2010-10-04 14:10:00'))
+
+    def test_run_every_mins(self):
+        schedule = Schedule(run_every_mins=60)
+        timewarp.jump(local_datetime_from_local(u'2010-10-05 10:33:00'))
+        self.assertAlmostEqual(run_started(schedule), local_datetime_from_local(u'2010-10-05 10:33:00'),
+                delta=datetime.timedelta(seconds=10))
+
+class ShardTest(TestCase):
+    u"""
+    Tests ``Shard`` class.
+    """
+
+    def test_shards_split_all_objects(self):
+        users = [User.objects.create(username=u'user{}'.format(i)) for i in range(10)]
+        res = [list(Shard(i, 3).filter(User.objects.order_by(u'pk'))) for i in range(3)]
+        self.assertEqual(sum(res, []), users)
+        self.assertTrue(all(res))
+
+    def test_single_shard_contains_all_objects(self):
+        users = [User.objects.create(username=u'user{}'.format(i)) for i in range(3)]
+        self.assertEqual(list(Shard(0, 1).filter(User.objects.order_by(u'pk'))), users)
+
+    def test_shards_with_no_objects(self):
+        self.assertEqual(list(Shard(1, 3).filter(User.objects.all())), [])
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 import datetime
 import mock
+from StringIO import StringIO
 
 from django.core.management import call_command
 from django.test import TestCase
@@ -9,6 +10,8 @@ from django_cron import CronJobLog
 
 from poleno.utils.date import utc_now
 
+from ..models import CronRun
+
 class CleancronlogsManagementTest(TestCase):
     u"""
     Tests ``cleancronlogs`` management command.
@@ -35,15 +38,56 @@ class CleancronlogsManagementTest(TestCase):
         call_command(u'cleancronlogs')
         self.assertEqual(CronJobLog.objects.count(), 0)
 
+class CronstatsManagementTest(TestCase):
+    u"""
+    Tests ``cronstats`` management command.
+    """
+
+    def _create_run(self, code, wall_time, started=None, is_success=True):
+        return CronRun.objects.create(code=code, started=started or utc_now(),
+                is_success=is_success, wall_time=wall_time, cpu_time=0.5, queries=10,
+                query_time=0.1, peak_rss=1000, examined=20, acted=5)
+
+    def _call_cronstats(self, *args, **kwargs):
+        out = StringIO()
+        call_command(u'cronstats', stdout=out, *args, **kwargs)
+        return out.getvalue()
+
+
+    def test_percentiles(self):
+        for wall_time in range(1, 101):
+            self._create_run(u'mock_code', wall_time, is_success=(wall_time != 7))
+        out = self._call_cronstats()
+        self.assertIn(u'mock_code: 100 runs, 1 failed', out)
+        self.assertRegexpMatches(out, u'Wall time \\[s\\] +50.00 +90.00 +99.00 +100.00')
+        self.assertRegexpMatches(out, u'Acted on +5 +5 +5 +5')
+
+    def test_old_runs_are_ignored(self):
+        self._create_run(u'mock_code', 1, started=utc_now() - datetime.timedelta(days=40))
+        self._create_run(u'mock_code2', 1, started=utc_now() - datetime.timedelta(days=10))
+        out = self._call_cronstats()
+        self.assertNotIn(u'mock_code:', out)
+        self.assertIn(u'mock_code2: 1 runs', out)
+        out = self._call_cronstats(days=5)
+        self.assertIn(u'No cron job runs in the last 5 days.', out)
+
+    def test_code_filter(self):
+        self._create_run(u'mock_code', 1)
+        self._create_run(u'mock_code2', 1)
+        out = self._call_cronstats(codes=[u'mock_code2'])
+        self.assertNotIn(u'mock_code:', out)
+        self.assertIn(u'mock_code2: 1 runs', out)
+
 class CronserverManagementTest(TestCase):
     u"""
     Tests ``cronserver`` management command.
     """
 
     def _call_cronserver(self, *args, **kwargs):
-        # ``runcrons`` command runs ``logging.debug()`` that somehow spoils stderr.
-        with mock.patch(u'django_cron.logging'):
+        with mock.patch(u'poleno.cron.management.commands.cronserver.Scheduler') as mock_scheduler:
+            mock_scheduler.return_value.serve.side_effect = KeyboardInterrupt
             call_command(u'cronserver', *args, **kwargs)
+        return mock_scheduler
 
 
     def test_clearlogs(self):
@@ -58,58 +102,34 @@ class CronserverManagementTest(TestCase):
                 ran_at_time=None,
                 )
         self.assertEqual(CronJobLog.objects.count(), 1)
-
-        with mock.patch(u'poleno.cron.management.commands.cronserver.time.sleep', side_effect=KeyboardInterrupt):
-            with mock.patch(u'poleno.cron.management.commands.cronserver.call_command'):
-                self._call_cronserver(clearlogs=True)
+        self._call_cronserver(clearlogs=True)
         self.assertEqual(CronJobLog.objects.count(), 0)
 
-    def test_clear_logs_from_future(self):
-        u"""
-        Checks that ``cronserver`` clears any cron logs from the future before every run, but keeps
-        all logs from the past.
-        """
-        def side_effect():
-            past_log = CronJobLog.objects.create(
-                    code=u'mock_code',
-                    start_time=(utc_now() + datetime.timedelta(hours=-1)),
-                    end_time=(utc_now() + datetime.timedelta(hours=-1)),
-                    is_success=True,
-                    ran_at_time=None,
-                    )
-            future_log = CronJobLog.objects.create(
-                    code=u'mock_code',
-                    start_time=(utc_now() + datetime.timedelta(hours=+1)),
-                    end_time=(utc_now() + datetime.timedelta(hours=+1)),
-                    is_success=True,
-                    ran_at_time=None,
-                    )
-            self.assertItemsEqual(CronJobLog.objects.all(), [past_log, future_log])
-            yield None
-            self.assertItemsEqual(CronJobLog.objects.all(), [past_log])
-            yield KeyboardInterrupt
-
-        with mock.patch(u'poleno.cron.management.commands.cronserver.time.sleep', side_effect=side_effect()):
-            with mock.patch(u'poleno.cron.management.commands.cronserver.call_command'):
-                self._call_cronserver()
-
-    def test_interval(self):
-        u"""
-        Checks that ``cronserver`` takes ``--interval`` option into account.
-        """
-        with mock.patch(u'poleno.cron.management.commands.cronserver.time.sleep', side_effect=KeyboardInterrupt) as mock_sleep:
-            with mock.patch(u'poleno.cron.management.commands.cronserver.call_command'):
-                self._call_cronserver(interval=100)
-        self.assertEqual(mock_sleep.mock_calls, [mock.call(100)])
+    def test_keeps_logs_without_clearlogs(self):
+        CronJobLog.objects.create(
+                code=u'mock_code',
+                start_time=utc_now(),
+                end_time=utc_now(),
+                is_success=True,
+                ran_at_time=None,
+                )
+        self._call_cronserver()
+        self.assertEqual(CronJobLog.objects.count(), 1)
+
+    def test_scheduler_runs_cron_classes(self):
+        with self.settings(CRON_CLASSES=(u'mock.path',), CRON_SCHEDULER_WORKERS=3):
+            mock_scheduler = self._call_cronserver()
+        self.assertEqual(mock_scheduler.mock_calls[:2], [
+                mock.call((u'mock.path',), workers=3, max_sleep=60),
+                mock.call().serve(),
+                ])
 
-    def test_multiple_cycles(self):
+    def test_interval_and_workers(self):
         u"""
-        Checks ``cronserver`` with multiple calls to ``runcrons`` before interrupting.
+        Checks that ``cronserver`` takes ``--interval`` and ``--workers`` options into account.
         """
-        with mock.patch(u'poleno.cron.management.commands.cronserver.time.sleep', side_effect=[None]*10 + [KeyboardInterrupt]):
-            with mock.patch(u'poleno.cron.management.commands.cronserver.call_command') as mock_call_command:
-                self._call_cronserver()
-        self.assertEqual(mock_call_command.mock_calls, [mock.call(u'runcrons')] * 11)
+        mock_scheduler = self._call_cronserver(interval=100, workers=5)
+        self.assertEqual(mock_scheduler.call_args, mock.call(mock.ANY, workers=5, max_sleep=100))
 
 class RunCronsTimewarpAwareTest(TestCase):
     u"""
@@ -0,0 +1,147 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import datetime
+import mock
+
+from django.test import TestCase
+from django_cron import CronJobLog
+
+from poleno.utils.date import local_datetime_from_local, utc_now
+
+from .. import cron_job
+from ..scheduler import ScheduledJob, Scheduler
+
+
+mock_periodic_job = None
+mock_daily_job = None
+
+class SchedulerTest(TestCase):
+    u"""
+    Tests ``ScheduledJob`` and ``Scheduler`` classes.
+    """
+
+    def setUp(self):
+        self.periodic_call = mock.Mock(return_value=u'Periodic done')
+        self.daily_call = mock.Mock(return_value=u'Daily done')
+
+        @cron_job(run_every_mins=10, retry_after_failure_mins=1)
+        def mock_periodic_job():
+            return self.periodic_call()
+
+        @cron_job(run_at_times=[u'09:00', u'13:00'])
+        def mock_daily_job():
+            return self.daily_call()
+
+        patchers = [
+                mock.patch(u'poleno.cron.tests.test_scheduler.mock_periodic_job', mock_periodic_job),
+                mock.patch(u'poleno.cron.tests.test_scheduler.mock_daily_job', mock_daily_job),
+                ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _at(self, hour, minute=0, days=0):
+        return local_datetime_from_local(datetime.date(2014, 10, 5 + days),
+                datetime.time(hour, minute))
+
+    def _scheduler(self):
+        return Scheduler([
+                u'poleno.cron.tests.test_scheduler.mock_periodic_job',
+                u'poleno.cron.tests.test_scheduler.mock_daily_job',
+                ])
+
+    def _run_pending(self, scheduler, now):
+        with mock.patch(u'django.utils.timezone.now', return_value=now):
+            started = scheduler.run_pending()
+            scheduler.collect_finished()
+        return started
+
+
+    def test_periodic_job_next_run(self):
+        job = ScheduledJob(mock_periodic_job)
+        job.compute_next_run(self._at(10))
+        self.assertEqual(job.next_run, self._at(10))
+        job.last_success = self._at(10)
+        job.compute_next_run(self._at(10, 1))
+        self.assertEqual(job.next_run, self._at(10, 10))
+
+    def test_periodic_job_next_run_after_failure(self):
+        job = ScheduledJob(mock_periodic_job)
+        job.last_success = self._at(9)
+        job.last_failure = self._at(10)
+        job.compute_next_run(self._at(10))
+        self.assertEqual(job.next_run, self._at(10, 1))
+
+    def test_daily_job_next_run(self):
+        job = ScheduledJob(mock_daily_job)
+        job.compute_next_run(self._at(8))
+        self.assertEqual(job.next_run, self._at(9))
+        job.compute_next_run(self._at(14))
+        self.assertEqual(job.next_run, self._at(14))
+        job.ran_at_date = self._at(14).date()
+        job.ran_at_time = datetime.time(13, 0)
+        job.compute_next_run(self._at(14))
+        self.assertEqual(job.next_run, self._at(9, days=1))
+
+    def test_missed_run_at_times_are_run_once(self):
+        scheduler = self._scheduler()
+        self.assertEqual(self._run_pending(scheduler, self._at(14)), 2)
+        self.assertEqual(self._run_pending(scheduler, self._at(14, 1)), 0)
+        self.assertEqual(self.daily_call.call_count, 1)
+        log = CronJobLog.objects.get(code=mock_daily_job.code)
+        self.assertEqual(log.ran_at_time, datetime.time(13, 0))
+        self.assertEqual(log.message, u'Daily done')
+        self.assertTrue(log.is_success)
+
+    def test_jobs_run_when_due(self):
+        scheduler = self._scheduler()
+        self._run_pending(scheduler, self._at(8))
+        self.assertEqual(self.periodic_call.call_count, 1)
+        self.assertEqual(self.daily_call.call_count, 0)
+        self._run_pending(scheduler, self._at(9))
+        self.assertEqual(self.daily_call.call_count, 1)
+
+    def test_state_is_loaded_from_logs(self):
+        CronJobLog.objects.create(code=mock_periodic_job.code, start_time=utc_now(),
+                end_time=utc_now(), is_success=True, ran_at_time=None)
+        scheduler = self._scheduler()
+        with mock.patch(u'django.utils.timezone.now', return_value=utc_now()):
+            scheduler.load_state()
+        periodic_job = scheduler.jobs[0]
+        self.assertGreater(periodic_job.next_run, utc_now() + datetime.timedelta(minutes=9))
+
+    def test_logs_from_future_are_deleted_on_load(self):
+        future = utc_now() + datetime.timedelta(hours=1)
+        CronJobLog.objects.create(code=mock_periodic_job.code, start_time=future,
+                end_time=future, is_success=True, ran_at_time=None)
+        scheduler = self._scheduler()
+        scheduler.load_state()
+        self.assertFalse(CronJobLog.objects.exists())
+
+    def test_failed_job_is_logged_and_retried(self):
+        self.periodic_call.side_effect = ValueError(u'Mock error')
+        scheduler = self._scheduler()
+        with mock.patch(u'poleno.cron.scheduler.cron_logger') as mock_logger:
+            self._run_pending(scheduler, self._at(8))
+        self.assertEqual(len(mock_logger.error.mock_calls), 1)
+        log = CronJobLog.objects.get(code=mock_periodic_job.code)
+        self.assertFalse(log.is_success)
+        self.assertIn(u'Mock error', log.message)
+        self.assertEqual(scheduler.jobs[0].next_run, log.start_time + datetime.timedelta(minutes=1))
+
+    def test_running_job_is_not_started_again(self):
+        scheduler = self._scheduler()
+        scheduler.workers = 2
+        with mock.patch(u'django.utils.timezone.now', return_value=self._at(8)):
+            self.assertEqual(scheduler.run_pending(), 1)
+            self.assertEqual(scheduler.run_pending(), 0)
+        self.assertEqual(scheduler.pending.qsize(), 1)
+
+    def test_sleep_time(self):
+        scheduler = self._scheduler()
+        scheduler.max_sleep = 3600
+        self._run_pending(scheduler, self._at(8))
+        with mock.patch(u'django.utils.timezone.now', return_value=self._at(8)):
+            sleep = scheduler.sleep_time()
+        periodic_job = scheduler.jobs[0]
+        self.assertEqual(sleep, (periodic_job.next_run - self._at(8)).total_seconds())
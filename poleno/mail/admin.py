@@ -58,6 +58,7 @@ class MessageAdmin(admin.ModelAdmin):
     exclude = [
             ]
     readonly_fields = [
+            u'inbound_key',
             ]
     raw_id_fields = [
             ]
@@ -6,6 +6,7 @@ from email.mime.base import MIMEBase
 from django.core.files.base import ContentFile
 from django.core.mail.message import sanitize_address, DEFAULT_ATTACHMENT_MIME_TYPE
 from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
 
 from poleno.utils.misc import guess_extension
 from poleno.attachments.models import Attachment
@@ -16,11 +17,32 @@ from .models import Message, Recipient
 class EmailBackend(BaseEmailBackend):
 
     def send_messages(self, email_messages):
-        for message in email_messages:
-            self._enqueue(message)
+        u"""
+        Enqueues all messages at once. Every ``Message`` is inserted with its own query, as we
+        need their primary keys, but recipients and attachments of all messages are inserted in
+        bulk. So the number of queries grows only with the number of messages.
+        """
+        prepared = [self._prepare(message) for message in email_messages]
+        all_recipients = []
+        all_attachments = []
+        with transaction.atomic():
+            for message, (msg, recipients, attachments) in zip(email_messages, prepared):
+                msg.save()
+                message.instance = msg
+
+                for recipient in recipients:
+                    recipient.message = msg
+                    all_recipients.append(recipient)
+
+                for attachment in attachments:
+                    attachment.generic_object = msg
+                    all_attachments.append(attachment)
+
+            Recipient.objects.bulk_create(all_recipients)
+            Attachment.objects.bulk_create_with_files(all_attachments)
         return len(email_messages)
 
-    def _enqueue(self, message):
+    def _prepare(self, message):
         # Based on djrill.mail.backends.DjrillBackend; We can't use Djrill directly because it
         # sends the mail synchronously during user requests.
         sanitized = sanitize_address(message.from_email, message.encoding)
@@ -84,13 +106,4 @@ class EmailBackend(BaseEmailBackend):
                 html=html or u'',
                 headers=headers,
                 )
-        msg.save()
-        message.instance = msg
-
-        for recipient in recipients:
-            recipient.message = msg
-            recipient.save()
-
-        for attachment in attachments:
-            attachment.generic_object = msg
-            attachment.save()
+        return msg, recipients, attachments
@@ -7,13 +7,94 @@ from django.conf import settings
 from django.utils.module_loading import import_by_path
 
 from poleno.cron import cron_job, cron_logger
+from poleno.cron.models import OWNER
 from poleno.utils.date import utc_now
 from poleno.utils.misc import nop
 
 from .models import Message
-from .signals import message_sent, message_received
+from .signals import message_sent, message_received, messages_received
 
 
+def claim_timeout():
+    u"""
+    Number of seconds after which claims of queued outbound messages are considered abandoned.
+    """
+    return getattr(settings, u'EMAIL_OUTBOUND_CLAIM_TIMEOUT', 600)
+
+def inbound_batch_size():
+    u"""
+    Number of inbound messages processed together in one transaction.
+    """
+    return getattr(settings, u'EMAIL_INBOUND_BATCH_SIZE', 100)
+
+def process_received_messages(messages):
+    u"""
+    Marks received ``messages`` as processed and sends ``messages_received`` signal for all of
+    them at once and ``message_received`` signal for every one of them, all in one transaction.
+    If processing the batch fails, every message is processed again in its own transaction, so a
+    single broken message does not block the others. Failed messages are left unprocessed.
+    """
+    try:
+        with transaction.atomic():
+            processed = utc_now()
+            Message.objects.filter(pk__in=[m.pk for m in messages]).update(processed=processed)
+            for message in messages:
+                message.processed = processed
+            messages_received.send(sender=None, messages=messages)
+            # ``message_received`` is kept for receivers handling messages one by one, the same
+            # way Mandrill webhook sends ``webhook_event`` next to ``webhook_events``. Receivers
+            # in this project are connected to ``messages_received`` only.
+            for message in messages:
+                message_received.send(sender=None, message=message)
+            nop() # To let tests raise testing exception here.
+        for message in messages:
+            cron_logger.info(u'Processed received email: {}'.format(message))
+    except Exception:
+        for message in messages:
+            message.processed = None
+        if len(messages) > 1:
+            for message in messages:
+                process_received_messages([message])
+        else:
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'Processing received email failed: {}\n{}'.format(
+                    messages[0], trace))
+
+def _renewed(messages, owner):
+    # Claims are renewed right before the messages are sent. If a claim has expired and the
+    # message was claimed by somebody else, the message is skipped.
+    for message in messages:
+        renewed = (Message.objects
+                .claimed_by(owner)
+                .not_processed()
+                .filter(pk=message.pk)
+                .update(claimed=utc_now()))
+        if renewed:
+            yield message
+
+def send_claimed_messages(transport, messages, owner):
+    u"""
+    Sends outbound ``messages`` claimed by ``owner`` with ``transport`` and marks them as
+    processed, every message in its own transaction. ``messages`` may be a generator, e.g. to
+    throttle sending. If sending a message fails, the message is left claimed. It may be sent
+    again after its claim expires. Returns the number of sent messages.
+    """
+    sent = 0
+    for message, finish in transport.deliver(_renewed(messages, owner)):
+        try:
+            with transaction.atomic():
+                finish()
+                message.processed = utc_now()
+                message.save(update_fields=[u'processed'])
+                message_sent.send(sender=None, message=message)
+                nop() # To let tests raise testing exception here.
+            cron_logger.info(u'Sent email: {}'.format(message))
+            sent += 1
+        except Exception:
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'Seding email failed: {}\n{}'.format(message, trace))
+    return sent
+
 @cron_job(run_every_mins=1)
 def mail():
     # Get inbound mail
@@ -35,24 +116,14 @@ def mail():
                     cron_logger.error(u'Receiving emails failed:\n{}'.format(trace))
                     break
 
-    # Process inbound mail; At most 10 messages in one batch
+    # Process inbound mail in batches
     messages = (Message.objects
             .inbound()
             .not_processed()
-            .order_by_pk()
             .prefetch_related(Message.prefetch_recipients())
-            )[:10]
-    for message in messages:
-        try:
-            with transaction.atomic():
-                message.processed = utc_now()
-                message.save(update_fields=[u'processed'])
-                message_received.send(sender=None, message=message)
-                nop() # To let tests raise testing exception here.
-            cron_logger.info(u'Processed received email: {}'.format(message))
-        except Exception:
-            trace = unicode(traceback.format_exc(), u'utf-8')
-            cron_logger.error(u'Processing received email failed: {}\n{}'.format(message, trace))
+            )
+    for batch in messages.chunks(inbound_batch_size()):
+        process_received_messages(batch)
 
     # Send outbound mail; At most 10 messages in one batch
     path = getattr(settings, u'EMAIL_OUTBOUND_TRANSPORT', None)
@@ -60,22 +131,12 @@ def mail():
         messages = (Message.objects
                 .outbound()
                 .not_processed()
+                .claim(OWNER, 10, claim_timeout())
                 .order_by_pk()
                 .prefetch_related(Message.prefetch_recipients())
                 .prefetch_related(Message.prefetch_attachments())
-                )[:10]
+                )
         if messages:
             klass = import_by_path(path)
             with klass() as transport:
-                for message in messages:
-                    try:
-                        with transaction.atomic():
-                            transport.send_message(message)
-                            message.processed = utc_now()
-                            message.save(update_fields=[u'processed'])
-                            message_sent.send(sender=None, message=message)
-                            nop() # To let tests raise testing exception here.
-                        cron_logger.info(u'Sent email: {}'.format(message))
-                    except Exception:
-                        trace = unicode(traceback.format_exc(), u'utf-8')
-                        cron_logger.error(u'Seding email failed: {}\n{}'.format(message, trace))
+                send_claimed_messages(transport, messages, OWNER)
@@ -0,0 +1,64 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from poleno.utils.misc import squeeze
+
+from poleno.mail.transports.imap import ImapTransport
+
+
+class Rollback(Exception):
+    pass
+
+class Command(NoArgsCommand):
+    default_smtp_host = u'localhost'
+    default_smtp_port = 2025
+
+    help = squeeze(u"""
+            Benchmarks receiving e-mails with ``ImapTransport`` from the IMAP server configured
+            with IMAP_* settings and prints the number of received messages per second. With
+            ``dummymail`` running, use ``--fill`` to send testing messages to its incoming SMTP
+            server first. Received messages are deleted from the mailbox, but they are not stored
+            in the database.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--fill', action=u'store', type=u'int', dest=u'fill', default=0,
+            help=u'Number of testing messages to send before receiving. Defaults to 0.'),
+        make_option(u'--smtp-host', action=u'store', dest=u'smtp_host',
+            default=default_smtp_host,
+            help=u'SMTP server to send testing messages to. Defaults to "{}".'.format(
+                default_smtp_host)),
+        make_option(u'--smtp-port', action=u'store', type=u'int', dest=u'smtp_port',
+            default=default_smtp_port,
+            help=u'SMTP server port. Defaults to {}.'.format(default_smtp_port)),
+        )
+
+    def fill(self, count, host, port):
+        connection = get_connection(u'django.core.mail.backends.smtp.EmailBackend',
+                host=host, port=port, username=u'', password=u'', use_tls=False)
+        connection.send_messages([EmailMessage(subject=u'Benchmark message {}'.format(i),
+                body=u'Benchmark message {}.'.format(i), from_email=u'bench@example.com',
+                to=[u'bench@example.com']) for i in range(count)])
+
+    def handle_noargs(self, **options):
+        if options[u'fill']:
+            self.fill(options[u'fill'], options[u'smtp_host'], options[u'smtp_port'])
+
+        try:
+            with transaction.atomic():
+                start = time.time()
+                with ImapTransport() as transport:
+                    count = sum(1 for message in transport.get_messages())
+                elapsed = time.time() - start
+                raise Rollback
+        except Rollback:
+            pass
+
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(u'Received {} messages in {:.3f} s, {:.1f} messages/s'.format(
+                count, elapsed, rate))
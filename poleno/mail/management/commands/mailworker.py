@@ -0,0 +1,111 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+import signal
+import traceback
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand, CommandError
+from django.utils.module_loading import import_by_path
+from poleno.utils.misc import squeeze
+
+from poleno.cron import cron_logger
+from poleno.cron.models import OWNER
+from poleno.mail.models import Message
+from poleno.mail.cron import claim_timeout, send_claimed_messages
+
+
+class Command(NoArgsCommand):
+    default_batch_size = 50
+    default_idle = 5
+
+    help = squeeze(u"""
+            Outbound mail worker. Continuously sends queued outbound messages using
+            ``EMAIL_OUTBOUND_TRANSPORT``. Multiple workers may run at the same time, every message
+            is claimed by a single worker before it is sent. On SIGINT or SIGTERM the worker
+            finishes sending the messages in flight, releases its remaining claims and exits.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--batch-size', action=u'store', type=u'int', dest=u'batch_size',
+            default=default_batch_size, help=squeeze(u"""
+                Number of messages claimed and sent over one transport connection. Defaults to
+                {} messages.
+                """).format(default_batch_size)),
+        make_option(u'--rate', action=u'store', type=u'float', dest=u'rate', default=0,
+            help=squeeze(u"""
+                Target number of sent messages per second. Defaults to 0, no limit.
+                """)),
+        make_option(u'--idle', action=u'store', type=u'int', dest=u'idle',
+            default=default_idle, help=squeeze(u"""
+                Interval in seconds how often to check for new messages when the queue is empty.
+                Defaults to {} seconds.
+                """).format(default_idle)),
+        )
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def sleep(self, seconds):
+        # Sleep in short steps, so we notice when we are stopped.
+        end = time.time() + seconds
+        while not self.stopping and time.time() < end:
+            time.sleep(min(0.5, end - time.time()))
+
+    def throttled(self, messages, rate):
+        for message in messages:
+            if self.stopping:
+                return
+            if rate:
+                self.sleep(self.next_send - time.time())
+                if self.stopping:
+                    return
+                self.next_send = max(self.next_send, time.time()) + 1.0 / rate
+            yield message
+
+    def send_batch(self, klass, messages, rate):
+        with klass() as transport:
+            send_claimed_messages(transport, self.throttled(messages, rate), OWNER)
+
+    def handle_noargs(self, **options):
+        batch_size = options[u'batch_size']
+        rate = options[u'rate']
+        idle = options[u'idle']
+
+        path = getattr(settings, u'EMAIL_OUTBOUND_TRANSPORT', None)
+        if not path:
+            raise CommandError(u'No outbound transport is configured.')
+        klass = import_by_path(path)
+
+        self.stopping = False
+        self.next_send = time.time()
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        cron_logger.info(u'Mail worker {} started.'.format(OWNER))
+        try:
+            while not self.stopping:
+                messages = list(Message.objects
+                        .outbound()
+                        .not_processed()
+                        .claim(OWNER, batch_size, claim_timeout())
+                        .order_by_pk()
+                        .prefetch_related(Message.prefetch_recipients())
+                        .prefetch_related(Message.prefetch_attachments())
+                        )
+                if not messages:
+                    self.sleep(idle)
+                    continue
+                try:
+                    self.send_batch(klass, messages, rate)
+                except Exception:
+                    # The transport failed to connect or disconnect
+                    trace = unicode(traceback.format_exc(), u'utf-8')
+                    cron_logger.error(u'Mail worker transport failed:\n{}'.format(trace))
+                    Message.objects.release(OWNER)
+                    self.sleep(idle)
+        finally:
+            # Messages we claimed, but did not send, may be sent by other workers right away.
+            Message.objects.release(OWNER)
+            cron_logger.info(u'Mail worker {} stopped.'.format(OWNER))
@@ -0,0 +1,97 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import os
+import email
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from optparse import make_option
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import NoArgsCommand
+from poleno.utils.misc import squeeze
+
+from poleno.mail.mime import SpooledContent, MessageStreamParser
+
+
+def _parse_in_memory(path, storage):
+    with open(path, u'rb') as f:
+        msg = email.message_from_string(f.read())
+    for part in msg.walk():
+        if not part.is_multipart():
+            storage.save(u'part', ContentFile(part.get_payload(decode=True)))
+
+def _parse_streaming(path, storage):
+    parts = []
+    def handler(headers):
+        parts.append(SpooledContent())
+        return parts[-1]
+    with open(path, u'rb') as f:
+        MessageStreamParser(handler).parse(f)
+    for content in parts:
+        storage.save(u'part', content.file())
+
+def _measure(func, path, directory, queue):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func(path, FileSystemStorage(location=directory))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(after - before)
+
+class Command(NoArgsCommand):
+    help = squeeze(u"""
+            Benchmarks peak memory used to decode a large synthetic inbound message and to save
+            its parts to a temporary storage. Compares decoding the whole message in memory with
+            ``email`` package and streaming it with ``MessageStreamParser``. Every variant runs
+            in a separate process, so their peak memory usages do not affect each other.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--size', action=u'store', type=u'int', dest=u'size', default=20,
+            help=u'Size of every attachment in MiB. Default: 20'),
+        make_option(u'--attachments', action=u'store', type=u'int', dest=u'attachments',
+            default=2,
+            help=u'Number of attachments in the message. Default: 2'),
+        )
+
+    def write_message(self, f, size, attachments):
+        chunk = os.urandom(57*1024)
+        f.write(u'From: bench@example.com\n')
+        f.write(u'To: bench@example.com\n')
+        f.write(u'Subject: Benchmark message\n')
+        f.write(u'MIME-Version: 1.0\n')
+        f.write(u'Content-Type: multipart/mixed; boundary="BENCH"\n')
+        f.write(u'\n--BENCH\nContent-Type: text/plain\n\nBenchmark message.\n')
+        for i in range(attachments):
+            f.write(u'--BENCH\nContent-Type: application/octet-stream\n')
+            f.write(u'Content-Transfer-Encoding: base64\n')
+            f.write(u'Content-Disposition: attachment; filename="file{}.bin"\n\n'.format(i))
+            for j in range(size * 1024 * 1024 // len(chunk)):
+                f.write(chunk.encode(u'base64'))
+        f.write(u'--BENCH--\n')
+
+    def run(self, func, path, directory):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_measure, args=(func, path, directory, queue))
+        process.start()
+        res = queue.get()
+        process.join()
+        return res
+
+    def handle_noargs(self, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, u'message.eml')
+            with open(path, u'wb') as f:
+                self.write_message(f, options[u'size'], options[u'attachments'])
+            self.stdout.write(u'Message size: {:.1f} MiB'.format(
+                    os.path.getsize(path) / 1024.0 / 1024.0))
+            for name, func in ((u'email.message_from_string', _parse_in_memory),
+                               (u'MessageStreamParser', _parse_streaming)):
+                peak = self.run(func, path, directory)
+                # ``ru_maxrss`` is in KiB on Linux
+                self.stdout.write(u'{:<28} peak memory increase {:>10.1f} MiB'.format(
+                        name, peak / 1024.0))
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,70 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.mail import EmailMessage
+from django.core.management.base import NoArgsCommand
+from django.test.utils import override_settings
+from poleno.utils.misc import squeeze
+
+from poleno.mail.transports.smtp import SmtpConnectionPool
+
+
+class Command(NoArgsCommand):
+    default_host = u'localhost'
+    default_port = 1025
+    default_count = 200
+    default_batch_size = 10
+
+    help = squeeze(u"""
+            Benchmarks sending e-mails over pooled SMTP connections against opening a new
+            connection for every batch. Sends synthetic messages to the outgoing SMTP server of
+            ``dummymail`` by default, so run ``dummymail`` first. No messages are stored in the
+            database.
+            """)
+
+    option_list = NoArgsCommand.option_list + (
+        make_option(u'--host', action=u'store', dest=u'host', default=default_host,
+            help=u'SMTP server host. Defaults to "{}".'.format(default_host)),
+        make_option(u'--port', action=u'store', type=u'int', dest=u'port', default=default_port,
+            help=u'SMTP server port. Defaults to {}.'.format(default_port)),
+        make_option(u'--count', action=u'store', type=u'int', dest=u'count',
+            default=default_count,
+            help=u'Number of messages to send. Defaults to {}.'.format(default_count)),
+        make_option(u'--batch-size', action=u'store', type=u'int', dest=u'batch_size',
+            default=default_batch_size, help=squeeze(u"""
+                Number of messages sent in one batch, like in one run of the mail cron job.
+                Defaults to {}.
+                """).format(default_batch_size)),
+        )
+
+    def _send(self, pool, count, batch_size):
+        start = time.time()
+        for first in range(0, count, batch_size):
+            connection = pool.acquire()
+            try:
+                for i in range(first, min(first + batch_size, count)):
+                    EmailMessage(subject=u'Benchmark message {}'.format(i),
+                            body=u'Benchmark message {}.'.format(i),
+                            from_email=u'bench@example.com', to=[u'bench@example.com'],
+                            connection=connection).send()
+            finally:
+                pool.release(connection)
+        return time.time() - start
+
+    def handle_noargs(self, **options):
+        count = options[u'count']
+        batch_size = options[u'batch_size']
+        with override_settings(EMAIL_HOST=options[u'host'], EMAIL_PORT=options[u'port']):
+            results = []
+            for label, size in [(u'New connection per batch', 0), (u'Pooled connection', 1)]:
+                pool = SmtpConnectionPool()
+                with override_settings(EMAIL_SMTP_POOL_SIZE=size):
+                    elapsed = self._send(pool, count, batch_size)
+                pool.clear()
+                results.append(elapsed)
+                self.stdout.write(u'{}: {} messages in {:.3f} s, {:.2f} ms per message'.format(
+                        label, count, elapsed, 1000.0 * elapsed / count))
+        if results[1]:
+            self.stdout.write(u'Speedup: {:.2f}x'.format(results[0] / results[1]))
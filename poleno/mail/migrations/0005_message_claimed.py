@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0004_message_index_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='claimed',
+            field=models.DateTimeField(help_text='Date and time the message was claimed for sending. Claims are renewed before the message is sent. Abandoned claims expire, so other workers may claim the message.', null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='claimed_by',
+            field=models.CharField(help_text='Worker process that claimed the queued message for sending. Empty if the message was never claimed or the claim was released.', max_length=255, blank=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import poleno.utils.misc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0005_message_claimed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImapMailbox',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('mailbox', models.CharField(help_text='IMAP user, host, port and mailbox name identifying the mailbox, e.g. "user@imap.example.com:993/INBOX".', unique=True, max_length=255)),
+                ('uid_validity', models.BigIntegerField(help_text='UIDVALIDITY of the mailbox when ``last_uid`` was recorded. If the server reports a different value, message UIDs were reassigned and ``last_uid`` is not valid anymore.', null=True, blank=True)),
+                ('last_uid', models.BigIntegerField(default=0, help_text='High-water mark of the mailbox. Messages with UIDs up to and including this value were already fetched and are not fetched again.')),
+            ],
+            options={
+            },
+            bases=(poleno.utils.misc.FormatMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import poleno.utils.misc
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0006_imapmailbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MandrillEventBatch',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(help_text='Date and time the batch was received by Mandrill webhook.', auto_now_add=True)),
+                ('events', models.TextField(help_text='Raw JSON list of events as posted by Mandrill webhook. The batch is deleted as soon as its events are processed.')),
+            ],
+            options={
+            },
+            bases=(poleno.utils.misc.FormatMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0007_mandrilleventbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='inbound_key',
+            field=models.CharField(help_text='Digest of the inbound message Message-ID header and raw content. Used to skip messages that were already received, e.g. if the transport delivers them again after a failure. NULL for outbound messages and messages received before the key was introduced.', max_length=255, unique=True, null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
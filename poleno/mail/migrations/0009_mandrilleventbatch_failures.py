@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0008_message_inbound_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mandrilleventbatch',
+            name='events',
+            field=models.TextField(help_text='Raw JSON list of events as posted by Mandrill webhook. The batch is deleted as soon as its events are processed. If some events fail, only the failed events are kept.'),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='mandrilleventbatch',
+            name='failures',
+            field=models.IntegerField(default=0, help_text='Number of times processing the batch failed. Batches that failed ``MANDRILL_WEBHOOK_MAX_FAILURES`` times are kept for inspection, but not processed anymore.'),
+            preserve_default=True,
+        ),
+    ]
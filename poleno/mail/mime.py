@@ -0,0 +1,218 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import re
+import hashlib
+import binascii
+import tempfile
+import email.errors
+import email.parser
+
+from django.core.files.base import File
+from django.conf import settings
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Longer lines are read in pieces, so even binary parts with no line breaks are never loaded to
+# memory at once.
+_MAX_LINE = 64*1024
+
+def spool_size():
+    u"""
+    Number of bytes of a decoded attachment kept in memory before it is spooled to a temporary
+    file.
+    """
+    return getattr(settings, u'EMAIL_INBOUND_SPOOL_SIZE', 256*1024)
+
+class SpooledContent(object):
+    u"""
+    Collects decoded content written in pieces. Small content is kept in memory, larger content
+    is spooled to a temporary file. Use ``file()`` to get a django ``File`` for the content with
+    its size already known, so it may be assigned to ``Attachment.file``. The storage reads the
+    file in chunks when the attachment is saved. If ``digest`` is set, SHA-1 digest of the
+    content is computed while it is written.
+    """
+    def __init__(self, digest=False):
+        self.spool = tempfile.SpooledTemporaryFile(max_size=spool_size())
+        self.size = 0
+        self.sha1 = hashlib.sha1() if digest else None
+
+    def write(self, data):
+        self.spool.write(data)
+        self.size += len(data)
+        if self.sha1 is not None:
+            self.sha1.update(data)
+
+    def digest(self):
+        return self.sha1.hexdigest()
+
+    def read(self):
+        self.spool.seek(0)
+        return self.spool.read()
+
+    def file(self):
+        self.spool.seek(0)
+        res = File(self.spool)
+        res.size = self.size
+        return res
+
+class Base64Decoder(object):
+    u"""
+    Incremental base64 decoder. Decodes input in any pieces and writes the decoded data to
+    ``output`` as soon as complete 4 character groups are available. Malformed input is decoded
+    as much as possible like ``email`` package does, unless ``strict`` is set. Strict decoder
+    raises ``TypeError`` like ``base64.b64decode()``.
+    """
+    def __init__(self, output, strict=False):
+        self.output = output
+        self.strict = strict
+        self.pending = b''
+
+    def write(self, data):
+        data = self.pending + _WHITESPACE.sub(b'', data)
+        complete = len(data) - len(data) % 4
+        self.pending = data[complete:]
+        if complete:
+            self._decode(data[:complete])
+
+    def close(self):
+        if self.pending:
+            if self.strict:
+                raise TypeError(u'Incorrect padding')
+            self._decode(self.pending + b'=' * (-len(self.pending) % 4))
+            self.pending = b''
+
+    def _decode(self, data):
+        try:
+            self.output.write(binascii.a2b_base64(data))
+        except binascii.Error as e:
+            if self.strict:
+                raise TypeError(e)
+
+class QuotedPrintableDecoder(object):
+    u"""
+    Incremental quoted-printable decoder. Expects input in whole lines.
+    """
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, data):
+        self.output.write(binascii.a2b_qp(data))
+
+    def close(self):
+        pass
+
+class IdentityDecoder(object):
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, data):
+        self.output.write(data)
+
+    def close(self):
+        pass
+
+_DECODERS = {
+        u'base64': Base64Decoder,
+        u'quoted-printable': QuotedPrintableDecoder,
+        }
+
+class MessageStreamParser(object):
+    u"""
+    Parses a MIME message from a file-like object line by line without loading it to memory. For
+    every non-multipart part it calls ``handler(headers)``, where ``headers`` is
+    ``email.message.Message`` with the part headers only. The handler returns an object with
+    ``write(data)`` method the decoded part content is written to in pieces. The parser returns
+    the message headers.
+
+    Unlike ``email`` package, the parser does not descend into attached messages. Parts of type
+    "message/rfc822" are passed to the handler as a whole.
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.header_parser = email.parser.HeaderParser()
+
+    def parse(self, fp):
+        headers, _ = self._read_headers(fp)
+        self._parse_entity(fp, headers, [])
+        return headers
+
+    def _read_headers(self, fp):
+        lines = []
+        while True:
+            line = fp.readline()
+            if not line or line in (b'\n', b'\r\n'):
+                break
+            lines.append(line)
+        return self.header_parser.parsestr(b''.join(lines)), line
+
+    def _boundary(self, line, boundaries):
+        u"""
+        Returns ``(boundary, is_closing)`` if ``line`` is a delimiter of any of ``boundaries``, or
+        ``(None, False)`` otherwise.
+        """
+        if not line.startswith(b'--'):
+            return None, False
+        stripped = line.rstrip()
+        for boundary in reversed(boundaries):
+            if stripped == b'--' + boundary:
+                return boundary, False
+            if stripped == b'--' + boundary + b'--':
+                return boundary, True
+        return None, False
+
+    def _skip(self, fp, boundaries):
+        # Skips preamble or epilogue. Returns the delimiter line it stopped at or empty string.
+        while True:
+            line = fp.readline()
+            if not line or self._boundary(line, boundaries)[0] is not None:
+                return line
+
+    def _parse_entity(self, fp, headers, boundaries):
+        u"""
+        Parses the entity body. Returns the delimiter line of an enclosing multipart the body was
+        terminated by, or empty string if the input ended.
+        """
+        boundary = None
+        if headers.get_content_maintype() == u'multipart':
+            boundary = headers.get_boundary()
+        if boundary is None:
+            return self._parse_leaf(fp, headers, boundaries)
+
+        boundary = boundary.encode(u'ascii', u'replace')
+        inner = boundaries + [boundary]
+        line = self._skip(fp, inner)
+        while line:
+            found, closing = self._boundary(line, inner)
+            if found != boundary:
+                # Delimiter of an enclosing multipart; This one is not closed properly.
+                return line
+            if closing:
+                return self._skip(fp, boundaries)
+            part_headers, header_end = self._read_headers(fp)
+            if not header_end:
+                self._parse_leaf(fp, part_headers, inner)
+                return b''
+            line = self._parse_entity(fp, part_headers, inner)
+        return b''
+
+    def _parse_leaf(self, fp, headers, boundaries):
+        encoding = headers.get(u'Content-Transfer-Encoding', u'').strip().lower()
+        decoder = _DECODERS.get(encoding, IdentityDecoder)(self.handler(headers))
+
+        # The line break before a delimiter belongs to the delimiter, so every line is written
+        # only after we know it is not the last one.
+        previous = None
+        line_start = True
+        while True:
+            line = fp.readline(_MAX_LINE)
+            if not line or line_start and self._boundary(line, boundaries)[0] is not None:
+                break
+            line_start = line.endswith(b'\n')
+            if previous is not None:
+                decoder.write(previous)
+            previous = line
+        if previous is not None:
+            decoder.write(previous if not line else previous.rstrip(b'\r\n'))
+        decoder.close()
+        return line
@@ -1,9 +1,12 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import hashlib
+import datetime
+from collections import defaultdict
 from email.utils import formataddr, parseaddr
 
 from django.db import models
-from django.db.models import Prefetch
+from django.db.models import Q, Prefetch
 from django.utils.translation import ugettext_lazy as _
 from django.utils.html import escape
 from django.utils.functional import cached_property
@@ -13,6 +16,7 @@ from jsonfield import JSONField
 
 from poleno.attachments.models import Attachment
 from poleno.utils.models import FieldChoices, QuerySet, join_lookup
+from poleno.utils.date import utc_now
 from poleno.utils.misc import FormatMixin, squeeze
 
 
@@ -25,6 +29,11 @@ class MessageQuerySet(QuerySet):
         return self.filter(processed__isnull=False)
     def not_processed(self):
         return self.filter(processed__isnull=True)
+    def claimable(self, timeout):
+        threshold = utc_now() - datetime.timedelta(seconds=timeout)
+        return self.filter(Q(claimed__isnull=True) | Q(claimed__lt=threshold))
+    def claimed_by(self, owner):
+        return self.filter(claimed_by=owner)
     def order_by_pk(self):
         return self.order_by(u'pk')
     def order_by_created(self):
@@ -32,6 +41,31 @@ class MessageQuerySet(QuerySet):
     def order_by_processed(self):
         return self.order_by(u'processed', u'pk')
 
+    def received(self, inbound_key):
+        return self.filter(inbound_key=inbound_key)
+
+    def claim(self, owner, count, timeout):
+        u"""
+        Claims at most ``count`` messages with the lowest ``pk`` not claimed by anybody else for
+        ``owner``. Claims older than ``timeout`` seconds are considered abandoned. Returns
+        a queryset of the claimed messages. Every message is claimed by a single conditional
+        update, so the message may be claimed by only one of the concurrently claiming owners.
+        """
+        pks = list(self.claimable(timeout).order_by_pk().values_list(u'pk', flat=True)[:count])
+        now = utc_now()
+        (Message.objects
+                .claimable(timeout)
+                .filter(pk__in=pks)
+                .update(claimed_by=owner, claimed=now))
+        return Message.objects.claimed_by(owner).filter(pk__in=pks, claimed=now)
+
+    def release(self, owner):
+        u"""
+        Releases claims of ``owner`` on messages that are not processed yet, so other owners may
+        claim them immediately.
+        """
+        return self.claimed_by(owner).not_processed().update(claimed_by=u'', claimed=None)
+
 class Message(FormatMixin, models.Model):
     # May NOT be NULL
     TYPES = FieldChoices(
@@ -53,6 +87,20 @@ class Message(FormatMixin, models.Model):
                 want the application to process it.
                 """))
 
+    # May be empty
+    claimed_by = models.CharField(blank=True, max_length=255,
+            help_text=squeeze(u"""
+                Worker process that claimed the queued message for sending. Empty if the message
+                was never claimed or the claim was released.
+                """))
+
+    # May be NULL
+    claimed = models.DateTimeField(blank=True, null=True,
+            help_text=squeeze(u"""
+                Date and time the message was claimed for sending. Claims are renewed before the
+                message is sent. Abandoned claims expire, so other workers may claim the message.
+                """))
+
     # May be empty
     from_name = models.CharField(blank=True, max_length=255,
             help_text=escape(squeeze(u"""
@@ -96,6 +144,15 @@ class Message(FormatMixin, models.Model):
                 messages it contains all message headers.
                 """))
 
+    # NULL for outbound messages; May be NULL for inbound messages; Unique
+    inbound_key = models.CharField(blank=True, null=True, max_length=255, unique=True,
+            help_text=squeeze(u"""
+                Digest of the inbound message Message-ID header and raw content. Used to skip
+                messages that were already received, e.g. if the transport delivers them again
+                after a failure. NULL for outbound messages and messages received before the key
+                was introduced.
+                """))
+
     # May be empty; Backward generic relation
     attachment_set = generic.GenericRelation(u'attachments.Attachment',
             content_type_field=u'generic_type', object_id_field=u'generic_id')
@@ -106,6 +163,7 @@ class Message(FormatMixin, models.Model):
     #     Should NOT be empty
 
     # Indexes:
+    #  -- inbound_key:   unique
     #  -- processed, id: index_together
     #  -- created, id:   index_together
 
@@ -117,6 +175,17 @@ class Message(FormatMixin, models.Model):
                 [u'created', u'id'],
                 ]
 
+    @staticmethod
+    def make_inbound_key(message_id, content_digest):
+        u"""
+        Returns ``inbound_key`` for an inbound message with ``message_id`` header and raw content
+        with ``content_digest``. Repeated deliveries of the same message get the same key. Copies
+        of the same message delivered for different recipients differ in their delivery headers,
+        so they get different keys.
+        """
+        data = u'{}\n{}'.format(message_id.strip(), content_digest)
+        return hashlib.sha1(data.encode(u'utf-8')).hexdigest()
+
     @property
     def from_formatted(self):
         return formataddr((self.from_name, self.from_mail))
@@ -307,5 +376,89 @@ class Recipient(FormatMixin, models.Model):
     def formatted(self, value):
         self.name, self.mail = parseaddr(value)
 
+    @staticmethod
+    def save_statuses(recipients):
+        u"""
+        Saves ``status``, ``status_details`` and ``remote_id`` of all ``recipients`` with a single
+        update query for every distinct combination of their values.
+        """
+        groups = defaultdict(list)
+        for recipient in recipients:
+            groups[(recipient.status, recipient.status_details, recipient.remote_id)].append(
+                    recipient.pk)
+        for (status, status_details, remote_id), pks in groups.items():
+            Recipient.objects.filter(pk__in=pks).update(status=status,
+                    status_details=status_details, remote_id=remote_id)
+
     def __unicode__(self):
         return u'[{}] {}'.format(self.pk, self.mail)
+
+class ImapMailboxQuerySet(QuerySet):
+    pass
+
+class ImapMailbox(FormatMixin, models.Model):
+    # May NOT be empty; Unique
+    mailbox = models.CharField(max_length=255, unique=True,
+            help_text=squeeze(u"""
+                IMAP user, host, port and mailbox name identifying the mailbox, e.g.
+                "user@imap.example.com:993/INBOX".
+                """))
+
+    # May be NULL
+    uid_validity = models.BigIntegerField(blank=True, null=True,
+            help_text=squeeze(u"""
+                UIDVALIDITY of the mailbox when ``last_uid`` was recorded. If the server reports a
+                different value, message UIDs were reassigned and ``last_uid`` is not valid
+                anymore.
+                """))
+
+    # May NOT be NULL
+    last_uid = models.BigIntegerField(default=0,
+            help_text=squeeze(u"""
+                High-water mark of the mailbox. Messages with UIDs up to and including this value
+                were already fetched and are not fetched again.
+                """))
+
+    # Indexes:
+    #  -- mailbox: unique
+
+    objects = ImapMailboxQuerySet.as_manager()
+
+    def __unicode__(self):
+        return u'[{}] {}'.format(self.pk, self.mailbox)
+
+class MandrillEventBatchQuerySet(QuerySet):
+    def failed_less_than(self, failures):
+        return self.filter(failures__lt=failures)
+    def order_by_pk(self):
+        return self.order_by(u'pk')
+
+class MandrillEventBatch(FormatMixin, models.Model):
+    # May NOT be NULL
+    created = models.DateTimeField(auto_now_add=True,
+            help_text=squeeze(u"""
+                Date and time the batch was received by Mandrill webhook.
+                """))
+
+    # May NOT be empty
+    events = models.TextField(
+            help_text=squeeze(u"""
+                Raw JSON list of events as posted by Mandrill webhook. The batch is deleted as soon
+                as its events are processed. If some events fail, only the failed events are kept.
+                """))
+
+    # May NOT be NULL
+    failures = models.IntegerField(default=0,
+            help_text=squeeze(u"""
+                Number of times processing the batch failed. Batches that failed
+                ``MANDRILL_WEBHOOK_MAX_FAILURES`` times are kept for inspection, but not processed
+                anymore.
+                """))
+
+    # Indexes:
+    #  -- pk only
+
+    objects = MandrillEventBatchQuerySet.as_manager()
+
+    def __unicode__(self):
+        return u'[{}] {}'.format(self.pk, self.created)
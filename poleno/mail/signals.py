@@ -5,3 +5,4 @@ from django.dispatch.dispatcher import Signal
 
 message_sent = Signal(providing_args=['message'])
 message_received = Signal(providing_args=['message'])
+messages_received = Signal(providing_args=['messages'])
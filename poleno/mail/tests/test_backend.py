@@ -1,8 +1,10 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
 from email.mime.text import MIMEText
-from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail import EmailMessage, EmailMultiAlternatives, get_connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 
 from . import MailTestCaseMixin
 from ..models import Message, Recipient
@@ -192,3 +194,29 @@ class EmailBackendTest(MailTestCaseMixin, TestCase):
             (u'message.html', u'<p>HTML alternative 2</p>', u'text/html'),
             (u'message.txt', u'Text alternative', u'text/plain'),
             ])
+
+    def test_send_messages_inserts_recipients_and_attachments_in_bulk(self):
+        def count_queries(recipients, attachments):
+            mails = [EmailMessage(u'Subject', u'Content', u'from@example.com',
+                    [u'to{}@example.com'.format(i) for i in range(recipients)],
+                    attachments=[(u'file{}.txt'.format(i), u'Content', u'text/plain')
+                        for i in range(attachments)]) for j in range(10)]
+            with CaptureQueriesContext(connection) as ctx:
+                get_connection().send_messages(mails)
+            return len(ctx)
+        count_queries(1, 1) # Warm up ContentType cache
+        self.assertEqual(count_queries(1, 1), count_queries(5, 3))
+        self.assertLessEqual(count_queries(5, 3), 10 + 4)
+
+    def test_send_messages_enqueues_all_messages(self):
+        mails = [EmailMessage(u'Subject {}'.format(i), u'Content', u'from@example.com',
+                [u'to{}@example.com'.format(i)], cc=[u'cc@example.com'],
+                attachments=[(u'file{}.txt'.format(i), u'Content {}'.format(i), u'text/plain')])
+                for i in range(3)]
+        self.assertEqual(get_connection().send_messages(mails), 3)
+        for i, mail in enumerate(mails):
+            self.assertEqual(mail.instance.subject, u'Subject {}'.format(i))
+            self.assertEqual(mail.instance.to_formatted, u'to{}@example.com'.format(i))
+            self.assertEqual(mail.instance.cc_formatted, u'cc@example.com')
+            self.assertEqual([(a.name, a.content) for a in mail.instance.attachment_set.all()],
+                    [(u'file{}.txt'.format(i), u'Content {}'.format(i))])
@@ -13,7 +13,7 @@ from poleno.utils.test import override_signals, created_instances
 
 from . import MailTestCaseMixin
 from ..models import Message
-from ..cron import mail as mail_cron_job
+from ..cron import mail as mail_cron_job, process_received_messages
 from ..signals import message_sent, message_received
 
 class MailCronjobTest(MailTestCaseMixin, TestCase):
@@ -145,26 +145,24 @@ class MailCronjobTest(MailTestCaseMixin, TestCase):
         self._run_mail_cron_job(inbound=True, get_messages_method=method, message_received_receiver=receiver)
         self.assertItemsEqual(receiver.mock_calls, [])
 
-    def test_inbound_transport_processes_at_most_10_messages_in_one_batch(self):
+    def test_inbound_transport_processes_all_messages_in_batches(self):
         msgs = []
         def method(transport):
-            for i in range(20):
+            for i in range(25):
                 msg = self._create_message(type=Message.TYPES.INBOUND, processed=None)
                 msgs.append(msg)
                 yield msg
 
         receiver = mock.Mock()
-        self._run_mail_cron_job(inbound=True, get_messages_method=method, message_received_receiver=receiver)
-
-        # We expect only first 10 messages (sorted by their ``pk``) to be processed.
-        processed = Message.objects.filter(pk__in=sorted(m.pk for m in msgs)[:10])
-        remaining = Message.objects.filter(pk__in=sorted(m.pk for m in msgs)[10:])
-        self.assertEqual(len(processed), 10)
-        self.assertEqual(len(remaining), 10)
-        for msg in processed:
+        with self.settings(EMAIL_INBOUND_BATCH_SIZE=10):
+            with mock.patch(u'poleno.mail.cron.process_received_messages', wraps=process_received_messages) as process:
+                self._run_mail_cron_job(inbound=True, get_messages_method=method, message_received_receiver=receiver)
+
+        # We expect all messages to be processed in batches of 10 messages sorted by their ``pk``.
+        pks = sorted(m.pk for m in msgs)
+        self.assertEqual([[m.pk for m in c[0][0]] for c in process.call_args_list], [pks[0:10], pks[10:20], pks[20:25]])
+        for msg in Message.objects.filter(pk__in=pks):
             self.assertAlmostEqual(msg.processed, utc_now(), delta=datetime.timedelta(seconds=10))
-        for msg in remaining:
-            self.assertIsNone(msg.processed)
 
     def test_inbound_transport_processes_prequeued_message(self):
         msg = self._create_message(type=Message.TYPES.INBOUND, processed=None)
@@ -201,7 +199,9 @@ class MailCronjobTest(MailTestCaseMixin, TestCase):
                 msgs.append(msg)
                 yield msg
 
-        with mock.patch(u'poleno.mail.cron.nop', side_effect=[None, None, None, None, Exception, None]):
+        # Three messages are received, then processing the batch fails and the messages are
+        # processed one by one.
+        with mock.patch(u'poleno.mail.cron.nop', side_effect=[None, None, None, Exception, None, Exception, None]):
             with mock.patch(u'poleno.mail.cron.cron_logger') as logger:
                 with created_instances(Message.objects) as message_set:
                     self._run_mail_cron_job(inbound=True, get_messages_method=method)
@@ -3,6 +3,7 @@
 import mock
 import datetime
 from textwrap import dedent
+from StringIO import StringIO
 
 from django.conf import settings
 from django.test import TestCase
@@ -11,9 +12,10 @@ from poleno.utils.date import utc_now
 from poleno.utils.test import override_signals
 
 from . import MailTestCaseMixin
-from ..models import Message, Recipient
+from ..models import Message, Recipient, ImapMailbox
 from ..cron import mail as mail_cron_job
 from ..signals import message_sent, message_received
+from ..transports.imap import _spool_literal
 
 class ImapTransportTest(MailTestCaseMixin, TestCase):
     u"""
@@ -59,9 +61,22 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
                 }
         overrides.update(override_settings)
 
+        def uid(command, *args):
+            if command == u'SEARCH':
+                return [u'OK', [u' '.join(str(k) for k in range(1, len(mails)+1))]]
+            if command == u'FETCH':
+                data = []
+                for k in args[0].split(u','):
+                    raw = mails[int(k)-1].encode(u'utf-8')
+                    data.append((u'{} (UID {} RFC822 {{{}}}'.format(k, k, len(raw)),
+                            _spool_literal(StringIO(raw).read, len(raw))))
+                    data.append(u')')
+                return [u'OK', data]
+            return [u'OK', [None]]
+
         transport = mock.Mock()
-        transport.return_value.search.return_value = [None, [u' '.join(str(k) for k in range(len(mails)))]]
-        transport.return_value.fetch.side_effect = lambda k, _: [None, [[None, mails[int(k)]]]]
+        transport.return_value.response.return_value = [u'UIDVALIDITY', [u'1']]
+        transport.return_value.uid.side_effect = uid
         imap4 = transport if not overrides[u'IMAP_SSL'] else None
         imap4ssl = transport if overrides[u'IMAP_SSL'] else None
 
@@ -74,6 +89,13 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
 
         return transport
 
+    def _create_mails(self, count):
+        return [self._create_mail(headers={u'Message-ID': u'<{}@testhost>'.format(k)})
+                for k in range(count)]
+
+    def _stored(self, transport):
+        return [c for c in transport.return_value.uid.mock_calls if c[1][0] == u'STORE']
+
 
     def test_non_ssl_connect(self):
         transport = self._run_mail_cron_job(IMAP_SSL=False, IMAP_HOST=u'testhost.com', IMAP_PORT=2000)
@@ -104,23 +126,24 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
             mock.call(u'testhost.com', 2000),
             mock.call().login(u'TestUser', u'big_secret'),
             mock.call().select(),
-            mock.call().search(None, u'ALL'),
+            mock.call().response(u'UIDVALIDITY'),
+            mock.call().uid(u'SEARCH', None, u'UID', u'1:*'),
+            mock.call().expunge(),
             mock.call().close(),
             mock.call().logout(),
             ])
 
     def test_transport_calls_with_nonempty_inbox(self):
-        mails = [self._create_mail(), self._create_mail()]
+        mails = self._create_mails(2)
         transport = self._run_mail_cron_job(mails=mails, IMAP_HOST=u'testhost.com', IMAP_PORT=2000, IMAP_USERNAME=u'TestUser', IMAP_PASSWORD=u'big_secret')
         self.assertEqual(transport.mock_calls, [
             mock.call(u'testhost.com', 2000),
             mock.call().login(u'TestUser', u'big_secret'),
             mock.call().select(),
-            mock.call().search(None, u'ALL'),
-            mock.call().fetch(u'0', '(RFC822)'),
-            mock.call().store(u'0', u'+FLAGS', u'\\Deleted'),
-            mock.call().fetch(u'1', '(RFC822)'),
-            mock.call().store(u'1', u'+FLAGS', u'\\Deleted'),
+            mock.call().response(u'UIDVALIDITY'),
+            mock.call().uid(u'SEARCH', None, u'UID', u'1:*'),
+            mock.call().uid(u'FETCH', u'1,2', u'(UID RFC822)'),
+            mock.call().uid(u'STORE', u'1,2', u'+FLAGS.SILENT', u'(\\Deleted)'),
             mock.call().expunge(),
             mock.call().close(),
             mock.call().logout(),
@@ -129,16 +152,39 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
     def test_mail_stored_to_database_and_deleted_from_imap(self):
         mail = self._create_mail()
         transport = self._run_mail_cron_job(mails=[mail])
-        transport.return_value.store.assert_called_once_with(u'0', u'+FLAGS', u'\\Deleted')
+        self.assertEqual(self._stored(transport), [
+                mock.call(u'STORE', u'1', u'+FLAGS.SILENT', u'(\\Deleted)')])
         self.assertEqual(Message.objects.count(), 1)
 
     def test_mail_stored_to_database_and_deleted_from_imap_with_multiple_mails_in_inbox(self):
-        mails = [self._create_mail() for k in range(10)]
+        mails = self._create_mails(10)
         transport = self._run_mail_cron_job(mails=mails)
-        expected_calls = [mock.call(str(k), u'+FLAGS', u'\\Deleted') for k in range(10)]
-        self.assertEqual(transport.return_value.store.mock_calls, expected_calls)
+        self.assertEqual(self._stored(transport), [
+                mock.call(u'STORE', u'1,2,3,4,5,6,7,8,9,10', u'+FLAGS.SILENT', u'(\\Deleted)')])
         self.assertEqual(Message.objects.count(), 10)
 
+    def test_mails_fetched_and_deleted_in_batches(self):
+        mails = self._create_mails(5)
+        transport = self._run_mail_cron_job(mails=mails, IMAP_FETCH_BATCH_SIZE=2)
+        self.assertEqual([c for c in transport.return_value.uid.mock_calls if c[1][0] != u'SEARCH'], [
+                mock.call(u'FETCH', u'1,2', u'(UID RFC822)'),
+                mock.call(u'STORE', u'1,2', u'+FLAGS.SILENT', u'(\\Deleted)'),
+                mock.call(u'FETCH', u'3,4', u'(UID RFC822)'),
+                mock.call(u'STORE', u'3,4', u'+FLAGS.SILENT', u'(\\Deleted)'),
+                mock.call(u'FETCH', u'5', u'(UID RFC822)'),
+                mock.call(u'STORE', u'5', u'+FLAGS.SILENT', u'(\\Deleted)'),
+                ])
+        self.assertEqual(Message.objects.count(), 5)
+
+    def test_high_water_mark_is_saved_with_uid_validity(self):
+        mails = self._create_mails(3)
+        self._run_mail_cron_job(mails=mails, IMAP_HOST=u'testhost.com', IMAP_PORT=2000,
+                IMAP_USERNAME=u'TestUser')
+        mailbox = ImapMailbox.objects.get()
+        self.assertEqual(mailbox.mailbox, u'TestUser@testhost.com:2000/INBOX')
+        self.assertEqual(mailbox.uid_validity, 1)
+        self.assertEqual(mailbox.last_uid, 3)
+
     def test_mail_marked_as_inbound(self):
         mail = self._create_mail()
         transport = self._run_mail_cron_job(mails=[mail])
@@ -166,6 +212,8 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
     def test_mail_with_invalid_subject_header(self):
         mail = self._create_mail(headers={u'Subject': u'GewSt: =?invalid?q?_Wegfall_der_Vorl=C3=A4ufigkeit?='})
         transport = self._run_mail_cron_job(mails=[mail])
+        self.assertEqual(self._stored(transport), [
+                mock.call(u'STORE', u'1', u'+FLAGS.SILENT', u'(\\Flagged)')])
         self.assertEqual(Message.objects.count(), 0)
 
     def test_mail_with_missing_subject_header(self):
@@ -476,4 +524,6 @@ class ImapTransportTest(MailTestCaseMixin, TestCase):
                 Text content
                 --===============1111111111==--"""))
         transport = self._run_mail_cron_job(mails=[mail])
+        self.assertEqual(self._stored(transport), [
+                mock.call(u'STORE', u'1', u'+FLAGS.SILENT', u'(\\Flagged)')])
         self.assertEqual(Message.objects.count(), 0)
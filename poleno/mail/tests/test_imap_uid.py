@@ -0,0 +1,245 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+import threading
+import SocketServer
+from textwrap import dedent
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from . import MailTestCaseMixin
+from ..models import Message, ImapMailbox
+from ..transports.imap import ImapTransport
+
+
+class _ImapStandIn(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    u"""
+    Local IMAP server with a single in-memory mailbox. Supports only the commands used by
+    ``ImapTransport`` and records them, so tests may count round trips.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, uid_validity=1):
+        SocketServer.TCPServer.__init__(self, (u'127.0.0.1', 0), _ImapHandler)
+        self.port = self.server_address[1]
+        self.uid_validity = uid_validity
+        self.lock = threading.Lock()
+        self.messages = [] # [uid, flags, contents] triples ordered by uid
+        self.next_uid = 1
+        self.commands = []
+
+    def append(self, contents):
+        with self.lock:
+            self.messages.append([self.next_uid, set(), contents])
+            self.next_uid += 1
+
+    def expunge(self):
+        with self.lock:
+            expunged = [i for i, m in enumerate(self.messages) if u'\\Deleted' in m[1]]
+            self.messages = [m for m in self.messages if u'\\Deleted' not in m[1]]
+        return expunged
+
+class _ImapHandler(SocketServer.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line + '\r\n')
+
+    def uid_set(self, spec):
+        with self.server.lock:
+            max_uid = self.server.messages[-1][0] if self.server.messages else 0
+        uids = set()
+        for part in spec.split(','):
+            first, _, last = part.partition(':')
+            first = max_uid if first == '*' else int(first)
+            last = first if not last else max_uid if last == '*' else int(last)
+            uids.update(range(min(first, last), max(first, last) + 1))
+        return uids
+
+    def selected(self, uids):
+        with self.server.lock:
+            return [(seq, m) for seq, m in enumerate(self.server.messages, 1) if m[0] in uids]
+
+    def handle(self):
+        self.reply('* OK IMAP4rev1 stand-in ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, command, args = (line.rstrip('\r\n').split(' ', 2) + [''])[:3]
+            command = command.upper()
+            if command == 'UID':
+                command, _, args = args.partition(' ')
+                command = u'UID ' + command.upper()
+            self.server.commands.append(command)
+
+            if command == 'CAPABILITY':
+                self.reply('* CAPABILITY IMAP4rev1')
+            elif command == 'SELECT':
+                self.reply('* {} EXISTS'.format(len(self.server.messages)))
+                self.reply('* OK [UIDVALIDITY {}] UIDs valid'.format(self.server.uid_validity))
+                self.reply('{} OK [READ-WRITE] SELECT completed'.format(tag))
+                continue
+            elif command == 'UID SEARCH':
+                criteria = args.split()
+                uids = self.uid_set(criteria[criteria.index('UID') + 1])
+                found = [m[0] for _, m in self.selected(uids)
+                        if not ('UNFLAGGED' in criteria and u'\\Flagged' in m[1])
+                        and not ('UNDELETED' in criteria and u'\\Deleted' in m[1])]
+                self.reply('* SEARCH {}'.format(' '.join(str(u) for u in found)).rstrip())
+            elif command == 'UID FETCH':
+                spec, _, items = args.partition(' ')
+                for seq, (uid, _, contents) in self.selected(self.uid_set(spec)):
+                    self.wfile.write('* {} FETCH (UID {} RFC822 {{{}}}\r\n{})\r\n'.format(
+                            seq, uid, len(contents), contents))
+            elif command == 'UID STORE':
+                spec, _, flags = args.split(' ', 2)
+                for _, message in self.selected(self.uid_set(spec)):
+                    message[1].update(flags.strip('()').split())
+            elif command in ('EXPUNGE', 'CLOSE'):
+                for offset, index in enumerate(self.server.expunge()):
+                    if command == 'EXPUNGE':
+                        self.reply('* {} EXPUNGE'.format(index + 1 - offset))
+            elif command == 'LOGOUT':
+                self.reply('* BYE')
+                self.reply('{} OK LOGOUT completed'.format(tag))
+                return
+            self.reply('{} OK {} completed'.format(tag, command))
+
+class ImapUidFetchTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests ``ImapTransport`` incremental fetching against a local IMAP stand-in.
+    """
+
+    def setUp(self):
+        self.server = self._start_server()
+
+    def _start_server(self, uid_validity=1):
+        server = _ImapStandIn(uid_validity)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _mail(self, subject=u'Subject', to=u'to@example.com'):
+        return dedent(u"""\
+                From: from@example.com
+                To: {to}
+                Subject: {subject}
+                Content-Type: text/plain; charset="utf-8"
+
+                Content of {subject}""").format(to=to, subject=subject).encode(u'utf-8')
+
+    def _settings(self, **kwargs):
+        kwargs.setdefault(u'IMAP_FETCH_BATCH_SIZE', 3)
+        return self.settings(IMAP_SSL=False, IMAP_HOST=u'127.0.0.1', IMAP_PORT=self.server.port,
+                IMAP_USERNAME=u'user', IMAP_PASSWORD=u'secret', **kwargs)
+
+    def _receive(self, limit=None, **kwargs):
+        received = []
+        with self._settings(**kwargs):
+            with ImapTransport() as transport:
+                for message in transport.get_messages():
+                    received.append(message.subject)
+                    if len(received) == limit:
+                        break
+        return received
+
+
+    def test_messages_are_received(self):
+        for i in range(7):
+            self.server.append(self._mail(subject=u'Message {}'.format(i)))
+        self.assertEqual(self._receive(), [u'Message {}'.format(i) for i in range(7)])
+        self.assertEqual(Message.objects.inbound().count(), 7)
+        self.assertEqual(self.server.messages, [])
+
+    def test_messages_are_fetched_in_batches(self):
+        for i in range(7):
+            self.server.append(self._mail())
+        self._receive(IMAP_FETCH_BATCH_SIZE=3)
+        self.assertEqual(self.server.commands.count(u'UID FETCH'), 3)
+        self.assertEqual(self.server.commands.count(u'UID STORE'), 3)
+        self.assertEqual(self.server.commands.count(u'EXPUNGE'), 1)
+
+    def test_high_water_mark_is_persisted(self):
+        for i in range(4):
+            self.server.append(self._mail())
+        self._receive()
+        mailbox = ImapMailbox.objects.get()
+        self.assertEqual(mailbox.mailbox, u'user@127.0.0.1:{}/INBOX'.format(self.server.port))
+        self.assertEqual(mailbox.uid_validity, 1)
+        self.assertEqual(mailbox.last_uid, 4)
+
+    def test_only_new_messages_are_fetched(self):
+        for i in range(3):
+            self.server.append(self._mail(subject=u'Old {}'.format(i)))
+        self._receive()
+        for i in range(2):
+            self.server.append(self._mail(subject=u'New {}'.format(i)))
+        self.assertEqual(self._receive(), [u'New 0', u'New 1'])
+
+    def test_interrupted_run_is_resumed(self):
+        for i in range(5):
+            self.server.append(self._mail(subject=u'Message {}'.format(i)))
+        self.assertEqual(self._receive(limit=2), [u'Message 0', u'Message 1'])
+        self.assertEqual(ImapMailbox.objects.get().last_uid, 2)
+        self.assertEqual(self._receive(), [u'Message 2', u'Message 3', u'Message 4'])
+        self.assertEqual(Message.objects.inbound().count(), 5)
+        # Messages received by the interrupted run are deleted by the next one.
+        self.assertEqual(self.server.messages, [])
+
+    def test_changed_uid_validity_resets_high_water_mark(self):
+        for i in range(3):
+            self.server.append(self._mail())
+        self._receive()
+        self.server.uid_validity = 2
+        self.server.next_uid = 1
+        self.server.append(self._mail(subject=u'Renumbered'))
+        self.assertEqual(self._receive(), [u'Renumbered'])
+        self.assertEqual(ImapMailbox.objects.get().uid_validity, 2)
+
+    def test_unparsable_message_is_flagged_and_skipped(self):
+        self.server.append(self._mail(subject=u'First'))
+        self.server.append(self._mail().replace(u'charset="utf-8"', u'charset="invalid"'))
+        self.server.append(self._mail(subject=u'Last'))
+        self.assertEqual(self._receive(), [u'First', u'Last'])
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(self.server.messages[0][1], {u'\\Flagged'})
+        self.assertEqual(self._receive(), [])
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_imapbench_command(self):
+        for i in range(20):
+            self.server.append(self._mail(subject=u'Message {}'.format(i)))
+        stdout = StringIO()
+        with self._settings():
+            call_command(u'imapbench', stdout=stdout)
+        self.assertIn(u'Received 20 messages', stdout.getvalue())
+        self.assertIn(u'messages/s', stdout.getvalue())
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(ImapMailbox.objects.exists())
+
+    def test_already_received_message_is_deleted_without_saving(self):
+        for i in range(3):
+            self.server.append(self._mail(subject=u'Message {}'.format(i)))
+        self._receive()
+        # Server renumbers messages and delivers the same messages again.
+        self.server.uid_validity = 2
+        for i in range(3):
+            self.server.append(self._mail(subject=u'Message {}'.format(i)))
+        self.server.append(self._mail(subject=u'New'))
+        self.assertEqual(self._receive(), [u'New'])
+        self.assertEqual(Message.objects.inbound().count(), 4)
+        self.assertEqual(self.server.messages, [])
+
+    def test_messages_with_same_message_id_but_different_content_are_received(self):
+        self.server.append(b'Message-ID: <id@example.com>\r\n' + self._mail(subject=u'First'))
+        self.server.append(b'Message-ID: <id@example.com>\r\n' + self._mail(subject=u'Second'))
+        self.assertEqual(self._receive(), [u'First', u'Second'])
+        keys = Message.objects.inbound().values_list(u'inbound_key', flat=True)
+        self.assertEqual(len(set(keys)), 2)
+        self.assertNotIn(None, keys)
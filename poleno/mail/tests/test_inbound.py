@@ -0,0 +1,74 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import mock
+
+from django.dispatch.dispatcher import Signal
+from django.test import TestCase
+
+from . import MailTestCaseMixin
+from ..models import Message
+from ..cron import mail as mail_cron_job, process_received_messages
+
+class ProcessReceivedMessagesTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests processing of received messages in batches by ``mail`` cron job.
+    """
+
+    def setUp(self):
+        self.batches = []
+        self.singles = []
+        batch_signal = Signal(providing_args=[u'messages'])
+        batch_signal.connect(lambda sender, messages, **kwargs:
+                self.batches.append([m.pk for m in messages]), weak=False)
+        single_signal = Signal(providing_args=[u'message'])
+        single_signal.connect(lambda sender, message, **kwargs:
+                self.singles.append(message.pk), weak=False)
+        patchers = [
+                mock.patch(u'poleno.mail.cron.messages_received', batch_signal),
+                mock.patch(u'poleno.mail.cron.message_received', single_signal),
+                ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_inbound_messages(self, count):
+        return [self._create_message(processed=None) for i in range(count)]
+
+    def _run_mail_cron_job(self, **settings):
+        with self.settings(EMAIL_OUTBOUND_TRANSPORT=None, EMAIL_INBOUND_TRANSPORT=None,
+                **settings):
+            mail_cron_job().do()
+
+
+    def test_messages_are_processed_in_batches(self):
+        msgs = self._create_inbound_messages(25)
+        self._run_mail_cron_job(EMAIL_INBOUND_BATCH_SIZE=10)
+        self.assertEqual([len(b) for b in self.batches], [10, 10, 5])
+        self.assertEqual(sum(self.batches, []), [m.pk for m in msgs])
+        self.assertEqual(self.singles, [m.pk for m in msgs])
+        self.assertFalse(Message.objects.not_processed().exists())
+
+    def test_processed_messages_are_skipped(self):
+        msgs = self._create_inbound_messages(2)
+        processed = self._create_message()
+        outbound = self._create_message(type=Message.TYPES.OUTBOUND, processed=None)
+        self._run_mail_cron_job()
+        self.assertEqual(self.batches, [[m.pk for m in msgs]])
+
+    def test_processed_messages_have_processed_time_set(self):
+        msgs = self._create_inbound_messages(3)
+        process_received_messages(msgs)
+        for msg in msgs:
+            self.assertIsNotNone(msg.processed)
+            self.assertEqual(Message.objects.get(pk=msg.pk).processed, msg.processed)
+
+    def test_failed_batch_is_processed_message_by_message(self):
+        msgs = self._create_inbound_messages(3)
+        with mock.patch(u'poleno.mail.cron.nop', side_effect=[Exception, None, Exception, None]):
+            process_received_messages(msgs)
+        self.assertEqual(self.batches, [[m.pk for m in msgs], [msgs[0].pk], [msgs[1].pk],
+                [msgs[2].pk]])
+        self.assertItemsEqual(Message.objects.not_processed(), [msgs[1]])
+        self.assertIsNotNone(msgs[0].processed)
+        self.assertIsNone(msgs[1].processed)
+        self.assertIsNotNone(msgs[2].processed)
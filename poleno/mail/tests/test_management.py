@@ -0,0 +1,88 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from poleno.cron.models import OWNER
+
+from . import MailTestCaseMixin
+from ..models import Message
+from ..management.commands.mailworker import Command as MailworkerCommand
+
+class MailworkerManagementTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests ``mailworker`` management command.
+    """
+
+    def _call_mailworker(self, send_message_method=mock.DEFAULT, stop_after=1, **kwargs):
+        u"""
+        Runs the worker with mocked transport. The worker is stopped after it goes idle
+        ``stop_after`` times.
+        """
+        sleeps = []
+        def sleep(command, seconds):
+            sleeps.append(seconds)
+            if len(sleeps) >= stop_after:
+                command.stopping = True
+
+        transport = u'poleno.mail.transports.base.BaseTransport'
+        with self.settings(EMAIL_OUTBOUND_TRANSPORT=transport):
+            with mock.patch.multiple(transport, send_message=send_message_method):
+                with mock.patch.object(MailworkerCommand, u'sleep', sleep):
+                    with mock.patch(u'poleno.mail.management.commands.mailworker.signal'):
+                        call_command(u'mailworker', **kwargs)
+        return sleeps
+
+
+    def test_all_queued_messages_are_sent(self):
+        msgs = [self._create_message(type=Message.TYPES.OUTBOUND, processed=None) for i in range(7)]
+        method = mock.Mock()
+        self._call_mailworker(send_message_method=method, batch_size=3)
+        self.assertEqual(method.call_count, 7)
+        self.assertFalse(Message.objects.not_processed().exists())
+
+    def test_messages_claimed_by_other_workers_are_skipped(self):
+        msgs = [self._create_message(type=Message.TYPES.OUTBOUND, processed=None) for i in range(3)]
+        list(Message.objects.claim(u'other', 1, 600))
+        method = mock.Mock()
+        self._call_mailworker(send_message_method=method)
+        self.assertItemsEqual(method.mock_calls, [mock.call(m) for m in msgs[1:]])
+        self.assertItemsEqual(Message.objects.not_processed(), [msgs[0]])
+
+    def test_inbound_messages_are_ignored(self):
+        msg = self._create_message(type=Message.TYPES.INBOUND, processed=None)
+        method = mock.Mock()
+        self._call_mailworker(send_message_method=method)
+        self.assertEqual(method.call_count, 0)
+
+    def test_stopped_worker_releases_unsent_messages(self):
+        msgs = [self._create_message(type=Message.TYPES.OUTBOUND, processed=None) for i in range(3)]
+        original_send_batch = MailworkerCommand.send_batch
+        def send_batch(command, klass, messages, rate):
+            # The worker is stopped while sending the first message of the batch.
+            def send_message(transport, message):
+                command.stopping = True
+            with mock.patch(u'poleno.mail.transports.base.BaseTransport.send_message', send_message):
+                original_send_batch(command, klass, messages, rate)
+
+        with mock.patch.object(MailworkerCommand, u'send_batch', send_batch):
+            self._call_mailworker()
+        self.assertItemsEqual(Message.objects.not_processed(), msgs[1:])
+        self.assertFalse(Message.objects.claimed_by(OWNER).not_processed().exists())
+        self.assertItemsEqual(Message.objects.claim(u'other', 3, 600), msgs[1:])
+
+    def test_rate_limit(self):
+        msgs = [self._create_message(type=Message.TYPES.OUTBOUND, processed=None) for i in range(3)]
+        with mock.patch(u'poleno.mail.management.commands.mailworker.time.time', return_value=100.0):
+            sleeps = self._call_mailworker(rate=2, stop_after=4)
+        # The first message is sent right away, the others wait for their turn. Then the worker
+        # goes idle.
+        self.assertEqual(sleeps, [0.0, 0.5, 1.0, 5])
+
+    def test_no_outbound_transport(self):
+        with self.settings(EMAIL_OUTBOUND_TRANSPORT=None):
+            with self.assertRaisesMessage(CommandError, u'No outbound transport is configured.'):
+                call_command(u'mailworker')
@@ -16,10 +16,10 @@ from poleno.utils.misc import Bunch
 from poleno.utils.test import override_signals, created_instances, patch_with_exception, ViewTestCaseMixin
 
 from . import MailTestCaseMixin
-from ..models import Message, Recipient
+from ..models import Message, Recipient, MandrillEventBatch
 from ..cron import mail as mail_cron_job
 from ..signals import message_sent, message_received
-from ..transports.mandrill.signals import webhook_event, message_status_webhook_event, inbound_email_webhook_event
+from ..transports.mandrill.signals import webhook_event, webhook_events, message_status_webhook_events, inbound_email_webhook_event
 
 class MandrillTransportTest(MailTestCaseMixin, TestCase):
     u"""
@@ -55,9 +55,10 @@ class MandrillTransportTest(MailTestCaseMixin, TestCase):
         overrides.update(override_settings)
 
         requests = mock.Mock()
-        requests.post.return_value.status_code = status_code
-        requests.post.return_value.text = u'Response text'
-        requests.post.return_value.json.return_value = response
+        session = requests.Session.return_value
+        session.post.return_value.status_code = status_code
+        session.post.return_value.text = u'Response text'
+        session.post.return_value.json.return_value = response
 
         with self.settings(**overrides):
             for name in delete_settings:
@@ -66,7 +67,7 @@ class MandrillTransportTest(MailTestCaseMixin, TestCase):
                 with override_signals(message_sent, message_received):
                     mail_cron_job().do()
 
-        posts = [Bunch(url=call[0][0], data=json.loads(call[1][u'data'])) for call in requests.post.call_args_list]
+        posts = [Bunch(url=call[0][0], data=json.loads(b''.join(call[1][u'data']))) for call in session.post.call_args_list]
         return posts
 
 
@@ -416,7 +417,7 @@ class WebhookViewTest(MailTestCaseMixin, ViewTestCaseMixin, TestCase):
                     HTTP_X_MANDRILL_SIGNATURE=u'Cu4i92MszJnwAhrkRXirRhGBb1o=')
         self._check_response(response, HttpResponseBadRequest, 400, u'Request syntax error')
 
-    def test_post_request_with_valid_data_emits_webhook_events(self):
+    def test_post_request_with_valid_data_stores_webhook_events(self):
         with self._overrides(MANDRILL_WEBHOOK_URL=u'https://testhost/', MANDRILL_WEBHOOK_KEYS=[u'testkey']):
             receiver = mock.Mock()
             webhook_event.connect(receiver)
@@ -428,59 +429,56 @@ class WebhookViewTest(MailTestCaseMixin, ViewTestCaseMixin, TestCase):
                         ])},
                     HTTP_X_MANDRILL_SIGNATURE=u'e/e0y1qBZghx4pyHFFoRrtgqmWg=')
         self._check_response(response)
-        self.assertItemsEqual(receiver.mock_calls, [
-            mock.call(signal=webhook_event, data={u'_id': u'remote-1', u'event': u'deferral'}, event_type=u'deferral', sender=None),
-            mock.call(signal=webhook_event, data={u'_id': u'remote-2', u'event': u'soft_bounce'}, event_type=u'soft_bounce', sender=None),
-            mock.call(signal=webhook_event, data={u'_id': u'remote-3', u'event': u'click'}, event_type=u'click', sender=None),
+        self.assertEqual(json.loads(MandrillEventBatch.objects.get().events), [
+            {u'_id': u'remote-1', u'event': u'deferral'},
+            {u'_id': u'remote-2', u'event': u'soft_bounce'},
+            {u'_id': u'remote-3', u'event': u'click'},
             ])
+        # Events are processed later by ``webhook`` cron job
+        self.assertEqual(receiver.mock_calls, [])
 
     def test_post_request_with_valid_data_rolls_back_if_exception_raised(self):
-        def receiver(*args, **kwargs):
-            self._create_message()
-
         with self._overrides(MANDRILL_WEBHOOK_URL=u'https://testhost/', MANDRILL_WEBHOOK_KEYS=[u'testkey']):
-            webhook_event.connect(receiver)
-
             # No exceptions, data commited
-            with created_instances(Message.objects) as msg_set:
+            with created_instances(MandrillEventBatch.objects) as batch_set:
                 self.client.post(self._webhook_url(), secure=True,
                         data={u'mandrill_events': json.dumps([
                             {u'event': u'click', u'_id': u'remote-1'},
                             ])},
                         HTTP_X_MANDRILL_SIGNATURE=u'phOye9ZN3XunJ8SG7R9AT6KhpUo=')
-            self.assertTrue(msg_set.exists())
+            self.assertTrue(batch_set.exists())
 
             # With exception, data rolled back
-            with created_instances(Message.objects) as msg_set:
+            with created_instances(MandrillEventBatch.objects) as batch_set:
                 with patch_with_exception(u'poleno.mail.transports.mandrill.views.HttpResponse'):
                     self.client.post(self._webhook_url(), secure=True,
                             data={u'mandrill_events': json.dumps([
                                 {u'event': u'click', u'_id': u'remote-1'},
                                 ])},
                             HTTP_X_MANDRILL_SIGNATURE=u'phOye9ZN3XunJ8SG7R9AT6KhpUo=')
-            self.assertFalse(msg_set.exists())
+            self.assertFalse(batch_set.exists())
 
-class MessageStatusWebhookEventTest(MailTestCaseMixin, TestCase):
+class MessageStatusWebhookEventsTest(MailTestCaseMixin, TestCase):
     u"""
-    Tests ``message_status_webhook_event()`` event receiver.
+    Tests ``message_status_webhook_events()`` event receiver.
     """
 
     def _create_message(self, **kwargs):
         kwargs.setdefault(u'type', Message.TYPES.OUTBOUND)
-        return super(MessageStatusWebhookEventTest, self)._create_message(**kwargs)
+        return super(MessageStatusWebhookEventsTest, self)._create_message(**kwargs)
 
     def _create_recipient(self, **kwargs):
         kwargs.setdefault(u'status', Recipient.STATUSES.UNDEFINED)
-        return super(MessageStatusWebhookEventTest, self)._create_recipient(**kwargs)
+        return super(MessageStatusWebhookEventsTest, self)._create_recipient(**kwargs)
 
 
     def test_event_receiver_is_registered(self):
-        self.assertIn(message_status_webhook_event, webhook_event._live_receivers(sender=None))
+        self.assertIn(message_status_webhook_events, webhook_events._live_receivers(sender=None))
 
     def _test_event_type_changing_recipient_status(self, event_type, status):
         msg = self._create_message()
         rcpt = self._create_recipient(message=msg, remote_id=u'remote-1')
-        message_status_webhook_event(sender=None, event_type=event_type, data={u'_id': u'remote-1'})
+        message_status_webhook_events(sender=None, events=[{u'event': event_type, u'_id': u'remote-1'}])
         rcpt = Recipient.objects.get(pk=rcpt.pk)
         self.assertEqual(rcpt.status, status)
         self.assertEqual(rcpt.status_details, event_type)
@@ -512,7 +510,7 @@ class MessageStatusWebhookEventTest(MailTestCaseMixin, TestCase):
     def test_event_type_inbound_does_nothing(self):
         msg = self._create_message()
         rcpt = self._create_recipient(message=msg, remote_id=u'remote-1', status=Recipient.STATUSES.UNDEFINED, status_details=u'details')
-        message_status_webhook_event(sender=None, event_type=u'inbound', data={u'_id': u'remote-1'})
+        message_status_webhook_events(sender=None, events=[{u'event': u'inbound', u'_id': u'remote-1'}])
         rcpt = Recipient.objects.get(pk=rcpt.pk)
         self.assertEqual(rcpt.status, Recipient.STATUSES.UNDEFINED)
         self.assertEqual(rcpt.status_details, u'details')
@@ -520,7 +518,7 @@ class MessageStatusWebhookEventTest(MailTestCaseMixin, TestCase):
     def test_other_event_types_do_nothing(self):
         msg = self._create_message()
         rcpt = self._create_recipient(message=msg, remote_id=u'remote-1', status=Recipient.STATUSES.UNDEFINED, status_details=u'details')
-        message_status_webhook_event(sender=None, event_type=u'other', data={u'_id': u'remote-1'})
+        message_status_webhook_events(sender=None, events=[{u'event': u'other', u'_id': u'remote-1'}])
         rcpt = Recipient.objects.get(pk=rcpt.pk)
         self.assertEqual(rcpt.status, Recipient.STATUSES.UNDEFINED)
         self.assertEqual(rcpt.status_details, u'details')
@@ -529,7 +527,7 @@ class MessageStatusWebhookEventTest(MailTestCaseMixin, TestCase):
         msg = self._create_message()
         rcpt1 = self._create_recipient(message=msg, remote_id=u'remote-1', status=Recipient.STATUSES.UNDEFINED, status_details=u'details')
         rcpt2 = self._create_recipient(message=msg, remote_id=u'remote-1', status=Recipient.STATUSES.UNDEFINED, status_details=u'details')
-        message_status_webhook_event(sender=None, event_type=u'deferral', data={u'_id': u'remote-1'})
+        message_status_webhook_events(sender=None, events=[{u'event': u'deferral', u'_id': u'remote-1'}])
         rcpt1 = Recipient.objects.get(pk=rcpt1.pk)
         rcpt2 = Recipient.objects.get(pk=rcpt2.pk)
         self.assertEqual(rcpt1.status, Recipient.STATUSES.UNDEFINED)
@@ -540,7 +538,7 @@ class MessageStatusWebhookEventTest(MailTestCaseMixin, TestCase):
     def test_remote_id_matching_no_recipients_does_nothing(self):
         msg = self._create_message()
         rcpt = self._create_recipient(message=msg, remote_id=u'remote-1', status=Recipient.STATUSES.UNDEFINED, status_details=u'details')
-        message_status_webhook_event(sender=None, event_type=u'deferral', data={u'_id': u'remote-2'})
+        message_status_webhook_events(sender=None, events=[{u'event': u'deferral', u'_id': u'remote-2'}])
         rcpt = Recipient.objects.get(pk=rcpt.pk)
         self.assertEqual(rcpt.status, Recipient.STATUSES.UNDEFINED)
         self.assertEqual(rcpt.status_details, u'details')
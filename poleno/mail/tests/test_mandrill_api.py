@@ -0,0 +1,209 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import base64
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from django.test import TestCase
+
+from poleno.cron.models import OWNER
+
+from . import MailTestCaseMixin
+from ..models import Message, Recipient
+from ..cron import send_claimed_messages
+from ..transports.mandrill import MandrillTransport
+from ..transports.mandrill.transport import _JsonBody, _AttachmentContent
+
+
+class _MandrillStandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    u"""
+    Local HTTP server standing in for Mandrill API ``messages/send.json`` call. Responds with
+    statuses for every recipient based on the recipient e-mail address.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (u'127.0.0.1', 0), _MandrillHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+class _MandrillHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = u'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            data = json.loads(self.rfile.read(int(self.headers[u'Content-Length'])))
+            time.sleep(server.delay)
+            with server.lock:
+                server.requests.append((self.path, data))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+        if data[u'message'][u'subject'] == u'Fail':
+            status, body = 500, json.dumps({u'status': u'error'})
+        else:
+            status, body = 200, json.dumps([{
+                    u'email': rcpt[u'email'],
+                    u'_id': u'remote-{}'.format(rcpt[u'email']),
+                    u'status': rcpt[u'email'].split(u'@')[0],
+                    u'reject_reason': u'hard-bounce',
+                    } for rcpt in data[u'message'][u'to']])
+        self.send_response(status)
+        self.send_header(u'Content-Type', u'application/json')
+        self.send_header(u'Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MandrillApiTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests ``MandrillTransport`` against a local HTTP stand-in for Mandrill API.
+    """
+
+    def _start_server(self, delay=0):
+        server = _MandrillStandIn(delay)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _create_outbound_message(self, recipients=(u'sent@example.com',), **kwargs):
+        msg = self._create_message(type=Message.TYPES.OUTBOUND, processed=None, **kwargs)
+        for mail in recipients:
+            self._create_recipient(message=msg, mail=mail, status=Recipient.STATUSES.UNDEFINED)
+        return msg
+
+    def _send(self, server, concurrency=4):
+        messages = (Message.objects
+                .claim(OWNER, 100, 600)
+                .order_by_pk()
+                .prefetch_related(Message.prefetch_recipients())
+                .prefetch_related(Message.prefetch_attachments())
+                )
+        with self.settings(MANDRILL_API_KEY=u'testing_api_key',
+                MANDRILL_API_URL=u'http://127.0.0.1:{}/api/'.format(server.server_port),
+                MANDRILL_CONCURRENCY=concurrency):
+            with MandrillTransport() as transport:
+                return send_claimed_messages(transport, messages, OWNER)
+
+
+    def test_messages_are_sent(self):
+        server = self._start_server()
+        msgs = [self._create_outbound_message(subject=u'Message {}'.format(i)) for i in range(5)]
+        self.assertEqual(self._send(server), 5)
+        self.assertEqual(len(server.requests), 5)
+        self.assertEqual(set(p for p, d in server.requests), {u'/api/messages/send.json'})
+        self.assertEqual(set(d[u'key'] for p, d in server.requests), {u'testing_api_key'})
+        self.assertItemsEqual([d[u'message'][u'subject'] for p, d in server.requests],
+                [u'Message {}'.format(i) for i in range(5)])
+        self.assertFalse(Message.objects.not_processed().exists())
+
+    def test_recipient_statuses_are_saved(self):
+        server = self._start_server()
+        msg = self._create_outbound_message(recipients=[u'sent@example.com',
+                u'queued@example.com', u'rejected@example.com', u'invalid@example.com'])
+        self._send(server)
+        statuses = {r.mail: r for r in Recipient.objects.filter(message=msg)}
+        self.assertEqual(statuses[u'sent@example.com'].status, Recipient.STATUSES.SENT)
+        self.assertEqual(statuses[u'sent@example.com'].remote_id, u'remote-sent@example.com')
+        self.assertEqual(statuses[u'queued@example.com'].status, Recipient.STATUSES.QUEUED)
+        self.assertEqual(statuses[u'rejected@example.com'].status, Recipient.STATUSES.REJECTED)
+        self.assertEqual(statuses[u'rejected@example.com'].status_details, u'hard-bounce')
+        self.assertEqual(statuses[u'invalid@example.com'].status, Recipient.STATUSES.INVALID)
+
+    def test_multiple_messages_are_in_flight_at_once(self):
+        server = self._start_server(delay=0.1)
+        msgs = [self._create_outbound_message() for i in range(8)]
+        start = time.time()
+        self._send(server, concurrency=4)
+        self.assertLess(time.time() - start, 0.8)
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLessEqual(server.max_in_flight, 4)
+
+    def test_connections_are_reused(self):
+        server = self._start_server()
+        msgs = [self._create_outbound_message() for i in range(10)]
+        self._send(server, concurrency=2)
+        self.assertEqual(len(server.requests), 10)
+        self.assertLessEqual(len(server.connections), 2)
+
+    def test_failed_message_is_left_unprocessed(self):
+        server = self._start_server()
+        msgs = [self._create_outbound_message(subject=s) for s in [u'Ok', u'Fail', u'Ok']]
+        self.assertEqual(self._send(server), 2)
+        self.assertItemsEqual(Message.objects.not_processed(), [msgs[1]])
+        self.assertEqual(Recipient.objects.get(message=msgs[1]).status,
+                Recipient.STATUSES.UNDEFINED)
+
+    def test_attachments_are_sent(self):
+        server = self._start_server()
+        msg = self._create_outbound_message()
+        content = os.urandom(200000)
+        self._create_attachment(generic_object=msg, content=content, name=u'scan.pdf',
+                content_type=u'application/pdf')
+        self._create_attachment(generic_object=msg, content=u'', name=u'empty.txt')
+        self.assertEqual(self._send(server), 1)
+        attachments = server.requests[0][1][u'message'][u'attachments']
+        self.assertItemsEqual([(a[u'name'], a[u'type'], base64.b64decode(a[u'content']))
+                for a in attachments], [
+                    (u'scan.pdf', u'application/pdf', content),
+                    (u'empty.txt', u'text/plain', u''),
+                    ])
+
+class JsonBodyTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests ``_JsonBody`` streaming request body.
+    """
+
+    def _body(self, *contents):
+        msg = self._create_message()
+        attachments = [self._create_attachment(generic_object=msg, content=c) for c in contents]
+        return _JsonBody({u'key': u'Žltý kôň', u'attachments': [
+                {u'name': u'file', u'content': _AttachmentContent(a)} for a in attachments]})
+
+    def test_body_is_json_with_encoded_attachments(self):
+        contents = [os.urandom(n) for n in [0, 1, 2, 3, 100000, 100001]]
+        body = self._body(*contents)
+        data = json.loads(b''.join(body))
+        self.assertEqual(data[u'key'], u'Žltý kôň')
+        self.assertEqual([base64.b64decode(a[u'content']) for a in data[u'attachments']],
+                contents)
+
+    def test_length_is_known_in_advance(self):
+        body = self._body(os.urandom(100000), os.urandom(5))
+        self.assertEqual(len(body), len(b''.join(body)))
+
+    def test_body_is_read_in_blocks(self):
+        body = self._body(os.urandom(300000))
+        blocks = []
+        while True:
+            block = body.read(8192)
+            if not block:
+                break
+            blocks.append(block)
+        self.assertTrue(all(len(b) == 8192 for b in blocks[:-1]))
+        self.assertEqual(b''.join(blocks), b''.join(body))
+
+    def test_attachment_files_are_read_in_chunks(self):
+        body = self._body(os.urandom(300000))
+        chunks = list(body.parts[1])
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(c) <= _AttachmentContent.chunk_size * 4 // 3 for c in chunks))
@@ -0,0 +1,225 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import hmac
+import json
+import mock
+import hashlib
+from base64 import b64encode
+
+from django.core.exceptions import SuspiciousOperation
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from . import MailTestCaseMixin
+from ..models import Message, Recipient, MandrillEventBatch
+from ..transports.mandrill.cron import webhook as webhook_cron_job, process_event_batch
+from ..transports.mandrill.signals import webhook_event, webhook_events
+from ..transports.mandrill.signals import message_status_webhook_events, _inbound_key
+from ..transports.mandrill.views import webhook as webhook_view
+
+
+class MandrillWebhookTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests storing Mandrill webhook events in batches and processing them by ``webhook`` cron job.
+    """
+    urls = u'poleno.mail.transports.mandrill.urls'
+
+    def _create_recipient(self, **kwargs):
+        kwargs.setdefault(u'status', Recipient.STATUSES.UNDEFINED)
+        kwargs.setdefault(u'message', self._create_message(type=Message.TYPES.OUTBOUND))
+        return super(MandrillWebhookTest, self)._create_recipient(**kwargs)
+
+    def _settings(self):
+        return self.settings(MANDRILL_WEBHOOK_SECRET=u'secret',
+                MANDRILL_WEBHOOK_URL=u'https://testhost/', MANDRILL_WEBHOOK_KEYS=[u'testkey'])
+
+    def _post(self, events, client=None):
+        url = u'https://testhost/'
+        data = {u'mandrill_events': events if isinstance(events, unicode) else json.dumps(events)}
+        signature = b64encode(hmac.new(key=b'testkey', digestmod=hashlib.sha1,
+                msg=(url + u'mandrill_events' + data[u'mandrill_events']).encode(u'ascii')).digest())
+        with self._settings():
+            return (client or self.client).post(u'{}?secret=secret'.format(reverse(u'webhook')),
+                    data, secure=True, HTTP_X_MANDRILL_SIGNATURE=signature)
+
+    def _inbound_event(self, subject):
+        return {u'event': u'inbound', u'msg': {u'subject': subject,
+                u'from_email': u'from@example.com', u'email': u'for@example.com',
+                u'to': [[u'for@example.com', None]]}}
+
+
+    def test_webhook_stores_events_without_processing_them(self):
+        receiver = mock.Mock()
+        webhook_event.connect(receiver)
+        self.addCleanup(webhook_event.disconnect, receiver)
+        events = [{u'event': u'send', u'_id': u'remote-1'}, self._inbound_event(u'Subject')]
+        response = self._post(events)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(MandrillEventBatch.objects.get().events), events)
+        self.assertFalse(receiver.called)
+        self.assertFalse(Message.objects.exists())
+
+    def test_webhook_with_invalid_events(self):
+        for events in [u'invalid', u'{}', u'[1, 2]', u'[{"_id": "remote-1"}]']:
+            request = self._post(events, client=RequestFactory())
+            with self._settings():
+                with self.assertRaisesMessage(SuspiciousOperation, u'Request syntax error'):
+                    webhook_view(request)
+        self.assertFalse(MandrillEventBatch.objects.exists())
+
+    def test_webhook_with_no_events_stores_nothing(self):
+        response = self._post([])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(MandrillEventBatch.objects.exists())
+
+    def test_cron_job_processes_and_deletes_batches(self):
+        rcpt1 = self._create_recipient(remote_id=u'remote-1')
+        rcpt2 = self._create_recipient(remote_id=u'remote-2')
+        self._post([{u'event': u'send', u'_id': u'remote-1'}, self._inbound_event(u'First')])
+        self._post([{u'event': u'hard_bounce', u'_id': u'remote-2'}, self._inbound_event(u'Second')])
+        webhook_cron_job().do()
+        self.assertEqual(Recipient.objects.get(pk=rcpt1.pk).status, Recipient.STATUSES.SENT)
+        self.assertEqual(Recipient.objects.get(pk=rcpt2.pk).status, Recipient.STATUSES.REJECTED)
+        self.assertEqual(Recipient.objects.get(pk=rcpt2.pk).status_details, u'hard_bounce')
+        self.assertItemsEqual([m.subject for m in Message.objects.inbound()], [u'First', u'Second'])
+        self.assertFalse(MandrillEventBatch.objects.exists())
+
+    def test_failed_batch_is_left_for_next_run(self):
+        rcpt = self._create_recipient(remote_id=u'remote-1')
+        events = [{u'event': u'send', u'_id': u'remote-1'}, self._inbound_event(u'Subject')]
+        batch = MandrillEventBatch.objects.create(events=json.dumps(events))
+        with mock.patch(u'poleno.mail.transports.mandrill.cron.nop', side_effect=Exception):
+            webhook_cron_job().do()
+        batch = MandrillEventBatch.objects.get(pk=batch.pk)
+        self.assertEqual(json.loads(batch.events), events)
+        self.assertEqual(batch.failures, 1)
+        self.assertEqual(Recipient.objects.get(pk=rcpt.pk).status, Recipient.STATUSES.UNDEFINED)
+        self.assertFalse(Message.objects.inbound().exists())
+
+        webhook_cron_job().do()
+        self.assertFalse(MandrillEventBatch.objects.exists())
+        self.assertEqual(Recipient.objects.get(pk=rcpt.pk).status, Recipient.STATUSES.SENT)
+
+    def test_failed_batch_is_processed_again_event_by_event(self):
+        rcpt = self._create_recipient(remote_id=u'remote-1')
+        batch = MandrillEventBatch.objects.create(events=json.dumps([
+                {u'event': u'send', u'_id': u'remote-1'}, self._inbound_event(u'Subject')]))
+        with mock.patch(u'poleno.mail.transports.mandrill.cron.nop',
+                side_effect=[Exception, None, None]):
+            webhook_cron_job().do()
+        self.assertFalse(MandrillEventBatch.objects.exists())
+        self.assertEqual(Recipient.objects.get(pk=rcpt.pk).status, Recipient.STATUSES.SENT)
+        self.assertEqual(Message.objects.inbound().count(), 1)
+
+    def test_failing_event_does_not_block_other_events_of_batch(self):
+        rcpt = self._create_recipient(remote_id=u'remote-1')
+        broken = self._inbound_event(u'Broken')
+        broken[u'msg'][u'attachments'] = {u'file': {u'content': u'invalid', u'base64': True}}
+        self._post([{u'event': u'send', u'_id': u'remote-1'}, broken,
+                self._inbound_event(u'Subject')])
+        webhook_cron_job().do()
+        self.assertEqual(Recipient.objects.get(pk=rcpt.pk).status, Recipient.STATUSES.SENT)
+        self.assertItemsEqual([m.subject for m in Message.objects.inbound()], [u'Subject'])
+        batch = MandrillEventBatch.objects.get()
+        self.assertEqual(json.loads(batch.events), [broken])
+        self.assertEqual(batch.failures, 1)
+
+    def test_batch_is_not_processed_after_max_failures(self):
+        broken = self._inbound_event(u'Broken')
+        broken[u'msg'][u'attachments'] = {u'file': {u'content': u'invalid', u'base64': True}}
+        batch = MandrillEventBatch.objects.create(events=json.dumps([broken]))
+        with self.settings(MANDRILL_WEBHOOK_MAX_FAILURES=2):
+            with mock.patch(u'poleno.mail.transports.mandrill.cron.process_event_batch',
+                    wraps=process_event_batch) as process:
+                for i in range(4):
+                    webhook_cron_job().do()
+        self.assertEqual(process.call_count, 2)
+        self.assertEqual(MandrillEventBatch.objects.get(pk=batch.pk).failures, 2)
+        self.assertFalse(Message.objects.exists())
+
+    def test_batch_with_invalid_json_is_left_for_next_run(self):
+        batch = MandrillEventBatch.objects.create(events=u'invalid')
+        webhook_cron_job().do()
+        batch = MandrillEventBatch.objects.get(pk=batch.pk)
+        self.assertEqual(batch.events, u'invalid')
+        self.assertEqual(batch.failures, 1)
+
+    def test_batch_signal_is_sent_once_per_batch(self):
+        receiver = mock.Mock()
+        webhook_events.connect(receiver)
+        self.addCleanup(webhook_events.disconnect, receiver)
+        events = [{u'event': u'open', u'_id': u'remote-{}'.format(i)} for i in range(5)]
+        process_event_batch(MandrillEventBatch.objects.create(events=json.dumps(events)))
+        receiver.assert_called_once_with(signal=webhook_events, sender=None, events=events)
+
+    def test_status_events_are_applied_with_bounded_number_of_queries(self):
+        rcpts = [self._create_recipient(remote_id=u'remote-{}'.format(i)) for i in range(20)]
+        events = [{u'event': u'open' if i % 2 else u'send', u'_id': u'remote-{}'.format(i)}
+                for i in range(20)]
+        with CaptureQueriesContext(connection) as ctx:
+            message_status_webhook_events(sender=None, events=events)
+        # One lookup and one update for every distinct status
+        self.assertEqual(len(ctx), 3)
+        statuses = dict(Recipient.objects.values_list(u'remote_id', u'status'))
+        self.assertEqual(statuses, {u'remote-{}'.format(i):
+                Recipient.STATUSES.OPENED if i % 2 else Recipient.STATUSES.SENT for i in range(20)})
+
+    def test_last_status_event_for_recipient_wins(self):
+        rcpt = self._create_recipient(remote_id=u'remote-1')
+        message_status_webhook_events(sender=None, events=[
+                {u'event': u'send', u'_id': u'remote-1'},
+                {u'event': u'click', u'_id': u'remote-1'},
+                ])
+        self.assertEqual(Recipient.objects.get(pk=rcpt.pk).status, Recipient.STATUSES.OPENED)
+
+    def test_status_events_matching_multiple_or_no_recipients_are_ignored(self):
+        rcpt1 = self._create_recipient(remote_id=u'remote-1')
+        rcpt2 = self._create_recipient(remote_id=u'remote-1')
+        message_status_webhook_events(sender=None, events=[
+                {u'event': u'send', u'_id': u'remote-1'},
+                {u'event': u'send', u'_id': u'remote-2'},
+                {u'event': u'other', u'_id': u'remote-1'},
+                ])
+        self.assertEqual(set(Recipient.objects.values_list(u'status', flat=True)),
+                {Recipient.STATUSES.UNDEFINED})
+
+    def test_redelivered_inbound_events_are_received_once(self):
+        raw = u'Message-ID: <id@example.com>\nSubject: Subject\n\nContent'
+        event = self._inbound_event(u'Subject')
+        event[u'msg'][u'raw_msg'] = raw
+        event[u'msg'][u'headers'] = {u'Message-Id': u'<id@example.com>'}
+        self._post([event])
+        self._post([event, event])
+        webhook_cron_job().do()
+        self.assertEqual(Message.objects.inbound().count(), 1)
+        self.assertIsNotNone(Message.objects.get().inbound_key)
+
+    def test_inbound_event_with_headers_as_pairs(self):
+        event = self._inbound_event(u'Subject')
+        event[u'msg'][u'headers'] = [[u'X-Extra', u'Value'], [u'Message-ID', u'<id@example.com>']]
+        self._post([event, event])
+        webhook_cron_job().do()
+        msg = Message.objects.get()
+        self.assertEqual(msg.headers, event[u'msg'][u'headers'])
+        self.assertEqual(msg.inbound_key, _inbound_key(event[u'msg']))
+
+    def test_message_id_is_read_from_headers_in_both_shapes(self):
+        msg = self._inbound_event(u'Subject')[u'msg']
+        msg[u'raw_msg'] = u'Message-ID: <id@example.com>\n\nContent'
+        msg[u'headers'] = {u'Message-Id': u'<id@example.com>'}
+        key = _inbound_key(msg)
+        msg[u'headers'] = ((u'X-Extra', u'Value'), (u'Message-Id', u'<id@example.com>'))
+        self.assertEqual(_inbound_key(msg), key)
+        msg[u'headers'] = ()
+        self.assertNotEqual(_inbound_key(msg), key)
+
+    def test_inbound_event_for_another_address_is_received(self):
+        first = self._inbound_event(u'Subject')
+        second = self._inbound_event(u'Subject')
+        second[u'msg'][u'email'] = u'another@example.com'
+        self._post([first, second])
+        webhook_cron_job().do()
+        self.assertItemsEqual(Message.objects.values_list(u'received_for', flat=True),
+                [u'for@example.com', u'another@example.com'])
@@ -0,0 +1,185 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import os
+import email
+from StringIO import StringIO
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.message import MIMEMessage
+from email.encoders import encode_base64
+from textwrap import dedent
+
+from django.test import TestCase
+
+from ..mime import SpooledContent, Base64Decoder, MessageStreamParser
+from ..transports.mandrill.signals import _decode_attachment
+
+
+class MessageStreamParserTest(TestCase):
+    u"""
+    Tests ``MessageStreamParser`` against ``email`` package.
+    """
+
+    def _parse(self, raw):
+        parts = []
+        def handler(headers):
+            content = SpooledContent()
+            parts.append((headers, content))
+            return content
+        headers = MessageStreamParser(handler).parse(StringIO(raw))
+        return headers, [(h.get_content_type(), c.read()) for h, c in parts]
+
+    def _reference(self, raw):
+        msg = email.message_from_string(raw)
+        return [(p.get_content_type(), p.get_payload(decode=True))
+                for p in msg.walk() if not p.is_multipart()]
+
+    def _attachment(self, content, content_type=u'application/pdf', filename=u'scan.pdf'):
+        part = MIMEBase(*content_type.split(u'/'))
+        part.set_payload(content)
+        encode_base64(part)
+        part.add_header(u'Content-Disposition', u'attachment', filename=filename)
+        return part
+
+
+    def test_simple_message(self):
+        raw = MIMEText(u'Simple text.\nSecond line.').as_string()
+        headers, parts = self._parse(raw)
+        self.assertEqual(parts, self._reference(raw))
+        self.assertEqual(headers.get_content_type(), u'text/plain')
+
+    def test_message_headers(self):
+        msg = MIMEText(u'Text')
+        msg[u'Subject'] = u'Testing Subject'
+        msg[u'From'] = u'smith@example.com'
+        headers, _ = self._parse(msg.as_string())
+        self.assertEqual(headers[u'Subject'], u'Testing Subject')
+        self.assertEqual(headers[u'From'], u'smith@example.com')
+
+    def test_alternative_with_quoted_printable_parts(self):
+        msg = MIMEMultipart(u'alternative')
+        msg.attach(MIMEText(u'Žltý kôň\n' * 20, u'plain', u'utf-8'))
+        msg.attach(MIMEText(u'<p>Žltý kôň</p>' * 20, u'html', u'utf-8'))
+        for part in msg.get_payload():
+            del part[u'Content-Transfer-Encoding']
+            email.encoders.encode_quopri(part)
+        raw = msg.as_string()
+        self.assertEqual(self._parse(raw)[1], self._reference(raw))
+
+    def test_nested_multipart_with_attachments(self):
+        inner = MIMEMultipart(u'alternative')
+        inner.attach(MIMEText(u'Text'))
+        inner.attach(MIMEText(u'<p>Html</p>', u'html'))
+        msg = MIMEMultipart()
+        msg.preamble = u'This is a multi-part message in MIME format.'
+        msg.epilogue = u'Epilogue'
+        msg.attach(inner)
+        msg.attach(self._attachment(os.urandom(5000)))
+        msg.attach(self._attachment(u'', u'text/plain', u'empty.txt'))
+        raw = msg.as_string()
+        self.assertEqual(self._parse(raw)[1], self._reference(raw))
+
+    def test_large_attachment_is_spooled_to_file(self):
+        content = os.urandom(1024*1024)
+        msg = MIMEMultipart()
+        msg.attach(MIMEText(u'Text'))
+        msg.attach(self._attachment(content))
+        parts = []
+        def handler(headers):
+            parts.append(SpooledContent())
+            return parts[-1]
+        with self.settings(EMAIL_INBOUND_SPOOL_SIZE=64*1024):
+            MessageStreamParser(handler).parse(StringIO(msg.as_string()))
+        self.assertFalse(parts[0].spool._rolled)
+        self.assertTrue(parts[1].spool._rolled)
+        self.assertEqual(parts[1].size, len(content))
+        self.assertEqual(parts[1].file().size, len(content))
+        self.assertEqual(parts[1].read(), content)
+
+    def test_binary_part_with_long_lines(self):
+        content = b'x' * 200000 + b'\n--not-a-boundary\n' + b'y' * 100
+        raw = dedent(u"""\
+                Content-Type: multipart/mixed; boundary="BBB"
+
+                --BBB
+                Content-Type: application/octet-stream
+                Content-Transfer-Encoding: binary
+
+                {}
+                --BBB--
+                """).format(content)
+        self.assertEqual(self._parse(raw)[1], [(u'application/octet-stream', content)])
+
+    def test_attached_message_is_not_parsed(self):
+        attached = MIMEText(u'Attached text')
+        msg = MIMEMultipart()
+        msg.attach(MIMEText(u'Text'))
+        msg.attach(MIMEMessage(attached))
+        parts = self._parse(msg.as_string())[1]
+        self.assertEqual([t for t, c in parts], [u'text/plain', u'message/rfc822'])
+        self.assertIn(u'Attached text', parts[1][1])
+
+    def test_multipart_without_closing_delimiter(self):
+        raw = dedent(u"""\
+                Content-Type: multipart/mixed; boundary="BBB"
+
+                --BBB
+                Content-Type: text/plain
+
+                First
+                --BBB
+                Content-Type: text/plain
+
+                Second
+                """)
+        self.assertEqual(self._parse(raw)[1], [(u'text/plain', u'First'),
+                (u'text/plain', u'Second\n')])
+
+class Base64DecoderTest(TestCase):
+    u"""
+    Tests ``Base64Decoder`` incremental decoder.
+    """
+
+    def test_input_split_in_any_pieces(self):
+        content = os.urandom(1000)
+        encoded = content.encode(u'base64')
+        for size in [1, 3, 4, 7, 76, 77, 1000]:
+            output = StringIO()
+            decoder = Base64Decoder(output)
+            for i in range(0, len(encoded), size):
+                decoder.write(encoded[i:i+size])
+            decoder.close()
+            self.assertEqual(output.getvalue(), content)
+
+    def test_missing_padding(self):
+        output = StringIO()
+        decoder = Base64Decoder(output)
+        decoder.write(u'YWJjZA')
+        decoder.close()
+        self.assertEqual(output.getvalue(), u'abcd')
+
+    def test_strict_decoder_raises_on_malformed_input(self):
+        decoder = Base64Decoder(StringIO(), strict=True)
+        decoder.write(u'invalid')
+        with self.assertRaisesMessage(TypeError, u'Incorrect padding'):
+            decoder.close()
+
+class MandrillAttachmentTest(TestCase):
+    u"""
+    Tests decoding of Mandrill inbound attachments.
+    """
+
+    def test_base64_content(self):
+        content = os.urandom(300000)
+        decoded = _decode_attachment(content.encode(u'base64').decode(u'ascii'), True)
+        self.assertEqual(decoded.size, len(content))
+        self.assertEqual(decoded.read(), content)
+
+    def test_plain_content(self):
+        decoded = _decode_attachment(u'Žltý kôň', False)
+        self.assertEqual(decoded.read(), u'Žltý kôň'.encode(u'utf-8'))
+
+    def test_invalid_base64_content(self):
+        with self.assertRaisesMessage(TypeError, u'Incorrect padding'):
+            _decode_attachment(u'invalid', True)
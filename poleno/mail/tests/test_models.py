@@ -1,6 +1,7 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
 import random
+import datetime
 
 from django.db import IntegrityError
 from django.test import TestCase
@@ -305,6 +306,36 @@ class MessageModelTest(MailTestCaseMixin, TestCase):
         result = Message.objects.not_processed()
         self.assertItemsEqual(result, [obj1, obj2])
 
+    def test_claim_query_method(self):
+        msgs = [self._create_message(processed=None) for i in range(5)]
+        result = Message.objects.claim(u'owner', 3, 600)
+        self.assertItemsEqual(result, msgs[:3])
+        result = Message.objects.claim(u'other', 3, 600)
+        self.assertItemsEqual(result, msgs[3:])
+        self.assertItemsEqual(Message.objects.claimed_by(u'owner'), msgs[:3])
+        self.assertItemsEqual(Message.objects.claimed_by(u'other'), msgs[3:])
+
+    def test_claim_query_method_ignores_claims_of_others(self):
+        msgs = [self._create_message(processed=None) for i in range(3)]
+        Message.objects.filter(pk=msgs[0].pk).update(claimed_by=u'other', claimed=utc_now())
+        result = Message.objects.claim(u'owner', 3, 600)
+        self.assertItemsEqual(result, msgs[1:])
+
+    def test_claim_query_method_takes_over_expired_claims(self):
+        msgs = [self._create_message(processed=None) for i in range(2)]
+        expired = utc_now() - datetime.timedelta(seconds=700)
+        Message.objects.filter(pk=msgs[0].pk).update(claimed_by=u'other', claimed=expired)
+        result = Message.objects.claim(u'owner', 3, 600)
+        self.assertItemsEqual(result, msgs)
+
+    def test_release_query_method(self):
+        msgs = [self._create_message(processed=None) for i in range(3)]
+        list(Message.objects.claim(u'owner', 3, 600))
+        Message.objects.filter(pk=msgs[0].pk).update(processed=utc_now())
+        Message.objects.release(u'owner')
+        self.assertItemsEqual(Message.objects.claimed_by(u'owner'), [msgs[0]])
+        self.assertItemsEqual(Message.objects.claim(u'other', 3, 600), msgs[1:])
+
     def test_order_by_pk_query_method(self):
         msgs = [self._create_message() for i in range(20)]
         sample = random.sample(msgs, 10)
@@ -502,3 +533,20 @@ class RecipientModelTest(MailTestCaseMixin, TestCase):
         sample = random.sample(rcpts, 10)
         result = msg.recipient_set.filter(pk__in=(d.pk for d in sample)).order_by_pk().reverse()
         self.assertEqual(list(result), sorted(sample, key=lambda d: -d.pk))
+
+    def test_save_statuses(self):
+        msg = self._create_message()
+        rcpts = [self._create_recipient(message=msg, status=Recipient.STATUSES.UNDEFINED) for i in range(4)]
+        for rcpt, status in zip(rcpts, [Recipient.STATUSES.SENT, Recipient.STATUSES.SENT, Recipient.STATUSES.REJECTED]):
+            rcpt.status = status
+            rcpt.status_details = u'details-{}'.format(status)
+            rcpt.remote_id = u'remote-{}'.format(status)
+        with self.assertNumQueries(2):
+            Recipient.save_statuses(rcpts[:3])
+        result = [(r.status, r.status_details, r.remote_id) for r in Recipient.objects.filter(message=msg).order_by_pk()]
+        self.assertEqual(result, [
+                (Recipient.STATUSES.SENT, u'details-5', u'remote-5'),
+                (Recipient.STATUSES.SENT, u'details-5', u'remote-5'),
+                (Recipient.STATUSES.REJECTED, u'details-3', u'remote-3'),
+                (Recipient.STATUSES.UNDEFINED, u'', u''),
+                ])
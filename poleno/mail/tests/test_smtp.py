@@ -1,5 +1,6 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import re
 import mock
 from textwrap import dedent
 from collections import defaultdict
@@ -16,12 +17,17 @@ from . import MailTestCaseMixin
 from ..models import Message, Recipient
 from ..cron import mail as mail_cron_job
 from ..signals import message_sent, message_received
+from ..transports.smtp import pool
 
 class SmtpTransportTest(MailTestCaseMixin, TestCase):
     u"""
     Tests ``SmtpTransport`` mail transport class.
     """
 
+    def setUp(self):
+        pool.clear()
+        self.addCleanup(pool.clear)
+
     def _create_message(self, **kwargs):
         kwargs.setdefault(u'type', Message.TYPES.OUTBOUND)
         kwargs.setdefault(u'processed', None)
@@ -33,7 +39,7 @@ class SmtpTransportTest(MailTestCaseMixin, TestCase):
 
     def _parse_headers(self, headers):
         dd = defaultdict(list)
-        for header in headers.split(u'\n'):
+        for header in re.sub(u'\n[ \t]+', u' ', headers).split(u'\n'):
             key, value = header.split(u': ', 1)
             dd[key].append(value)
         res = {k: v for k, v in dd.iteritems()}
@@ -111,40 +117,22 @@ class SmtpTransportTest(MailTestCaseMixin, TestCase):
         msg = self._create_message(text=u'Text content', omit=[u'html'])
         rcpt = self._create_recipient(message=msg)
         result = self._run_mail_cron_job()
-        self.assertRegexpMatches(result[0].headers[u'Content-Type'][0], u'multipart/mixed; boundary="===============.*=="')
-        self.assertRegexpMatches(result[0].body, dedent(u"""\
-                --===============.*==
-                MIME-Version: 1.0
-                Content-Type: text/plain; charset="utf-8"
-                Content-Transfer-Encoding: 7bit
-
-                Text content
-                --===============.*==--"""))
+        self.assertEqual(result[0].headers[u'Content-Type'], [u'text/plain; charset="utf-8"'])
+        self.assertEqual(result[0].body, u'Text content')
 
     def test_message_with_html_body_only(self):
         msg = self._create_message(html=u'<p>HTML content</p>', omit=[u'text'])
         rcpt = self._create_recipient(message=msg)
         result = self._run_mail_cron_job()
-        self.assertRegexpMatches(result[0].headers[u'Content-Type'][0], u'multipart/mixed; boundary="===============.*=="')
-        self.assertRegexpMatches(result[0].body, dedent(u"""\
-                --===============.*==
-                MIME-Version: 1.0
-                Content-Type: text/html; charset="utf-8"
-                Content-Transfer-Encoding: 7bit
-
-                <p>HTML content</p>
-                --===============.*==--"""))
+        self.assertEqual(result[0].headers[u'Content-Type'], [u'text/html; charset="utf-8"'])
+        self.assertEqual(result[0].body, u'<p>HTML content</p>')
 
     def test_message_with_both_text_and_html_body(self):
         msg = self._create_message(text=u'Text content', html=u'<p>HTML content</p>')
         rcpt = self._create_recipient(message=msg)
         result = self._run_mail_cron_job()
-        self.assertRegexpMatches(result[0].headers[u'Content-Type'][0], u'multipart/mixed; boundary="===============.*=="')
+        self.assertRegexpMatches(result[0].headers[u'Content-Type'][0], u'multipart/alternative; boundary="===============.*=="')
         self.assertRegexpMatches(result[0].body, dedent(u"""\
-                --===============.*==
-                Content-Type: multipart/alternative; boundary="===============.*=="
-                MIME-Version: 1.0
-
                 --===============.*==
                 MIME-Version: 1.0
                 Content-Type: text/plain; charset="utf-8"
@@ -157,18 +145,14 @@ class SmtpTransportTest(MailTestCaseMixin, TestCase):
                 Content-Transfer-Encoding: 7bit
 
                 <p>HTML content</p>
-                --===============.*==--
                 --===============.*==--"""))
 
     def test_message_with_neither_text_nor_html_body(self):
         msg = self._create_message(omit=[u'text', u'html'])
         rcpt = self._create_recipient(message=msg)
         result = self._run_mail_cron_job()
-        self.assertRegexpMatches(result[0].headers[u'Content-Type'][0], u'multipart/mixed; boundary="===============.*=="')
-        self.assertRegexpMatches(result[0].body, dedent(u"""\
-                --===============.*==
-
-                --===============.*==--"""))
+        self.assertEqual(result[0].headers[u'Content-Type'], [u'text/plain; charset="utf-8"'])
+        self.assertEqual(result[0].body, u'')
 
     def test_message_with_extra_headers(self):
         msg = self._create_message(headers={u'X-Some-Header': u'Value', u'X-Another-Header': u'Another Value'})
@@ -0,0 +1,172 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import time
+import mock
+import smtpd
+import smtplib
+import asyncore
+import threading
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from . import MailTestCaseMixin
+from ..models import Message, Recipient
+from ..transports.smtp import SmtpTransport, pool
+
+
+class _SmtpStandIn(smtpd.SMTPServer):
+    u"""
+    Local SMTP server collecting received messages and counting accepted connections. Served by
+    ``asyncore`` loop in its own thread.
+    """
+    def __init__(self):
+        smtpd.SMTPServer.__init__(self, (u'127.0.0.1', 0), None)
+        self.port = self.socket.getsockname()[1]
+        self.received = []
+        self.channels = []
+        self.drop_requested = threading.Event()
+        self.stopped = threading.Event()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            conn, addr = pair
+            self.channels.append(smtpd.SMTPChannel(self, conn, addr))
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        self.received.append((mailfrom, rcpttos, data))
+
+    def serve(self):
+        while not self.stopped.is_set():
+            if self.drop_requested.is_set():
+                for channel in self.channels:
+                    channel.close()
+                self.drop_requested.clear()
+            asyncore.loop(timeout=0.01, count=1)
+        for channel in self.channels:
+            channel.close()
+        self.close()
+
+    def drop_connections(self):
+        self.drop_requested.set()
+        while self.drop_requested.is_set():
+            time.sleep(0.01)
+
+class SmtpConnectionPoolTest(MailTestCaseMixin, TestCase):
+    u"""
+    Tests ``SmtpTransport`` with pooled connections against a local SMTP stand-in.
+    """
+
+    def setUp(self):
+        pool.clear()
+        self.server = _SmtpStandIn()
+        thread = threading.Thread(target=self.server.serve)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.stopped.set)
+        self.addCleanup(pool.clear)
+        settings = self.settings(EMAIL_HOST=u'127.0.0.1', EMAIL_PORT=self.server.port,
+                EMAIL_HOST_USER=u'', EMAIL_HOST_PASSWORD=u'', EMAIL_USE_TLS=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _create_outbound_message(self, recipients=(u'rcpt@example.com',)):
+        msg = self._create_message(type=Message.TYPES.OUTBOUND, processed=None)
+        for mail in recipients:
+            self._create_recipient(message=msg, mail=mail, status=Recipient.STATUSES.QUEUED)
+        return (Message.objects
+                .prefetch_related(Message.prefetch_recipients())
+                .prefetch_related(Message.prefetch_attachments())
+                .get(pk=msg.pk))
+
+    def _send(self, *messages):
+        with SmtpTransport() as transport:
+            for message in messages:
+                transport.send_message(message)
+
+
+    def test_messages_are_sent(self):
+        msgs = [self._create_outbound_message() for i in range(3)]
+        self._send(*msgs)
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(self.server.received[0][1], [u'rcpt@example.com'])
+
+    def test_connection_is_reused_by_consecutive_batches(self):
+        for i in range(3):
+            self._send(self._create_outbound_message())
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(len(self.server.channels), 1)
+
+    def test_dropped_idle_connection_is_replaced(self):
+        self._send(self._create_outbound_message())
+        self.server.drop_connections()
+        self._send(self._create_outbound_message())
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(len(self.server.channels), 2)
+
+    def test_connection_idle_for_too_long_is_replaced(self):
+        self._send(self._create_outbound_message())
+        with self.settings(EMAIL_SMTP_POOL_MAX_IDLE=0):
+            self._send(self._create_outbound_message())
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(len(self.server.channels), 2)
+
+    def test_connection_dropped_between_messages_is_replaced(self):
+        msgs = [self._create_outbound_message() for i in range(2)]
+        with SmtpTransport() as transport:
+            transport.send_message(msgs[0])
+            self.server.drop_connections()
+            transport.send_message(msgs[1])
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(len(self.server.channels), 2)
+
+    def test_connection_failing_health_check_with_any_exception_is_replaced(self):
+        self._send(self._create_outbound_message())
+        with mock.patch(u'smtplib.SMTP.noop', side_effect=ValueError):
+            self._send(self._create_outbound_message())
+        self.assertEqual(len(self.server.received), 2)
+        self.assertEqual(len(self.server.channels), 2)
+
+    def test_message_failed_while_being_sent_is_not_retried(self):
+        msg = self._create_outbound_message()
+        with SmtpTransport() as transport:
+            with mock.patch(u'smtplib.SMTP.sendmail', side_effect=smtplib.SMTPServerDisconnected):
+                with self.assertRaises(smtplib.SMTPServerDisconnected):
+                    transport.send_message(msg)
+        self.assertEqual(len(self.server.received), 0)
+        self.assertEqual(len(self.server.channels), 1)
+        self.assertItemsEqual(Recipient.objects.filter(message=msg).values_list(u'status', flat=True),
+                [Recipient.STATUSES.QUEUED])
+
+    def test_pool_size_limits_idle_connections(self):
+        with self.settings(EMAIL_SMTP_POOL_SIZE=1):
+            with SmtpTransport() as first:
+                with SmtpTransport() as second:
+                    pass
+            self.assertEqual(len(pool.idle), 1)
+        with self.settings(EMAIL_SMTP_POOL_SIZE=0):
+            self._send()
+            self.assertEqual(len(pool.idle), 0)
+
+    def test_recipient_statuses_are_saved_with_single_query(self):
+        msg = self._create_outbound_message(
+                recipients=[u'first@example.com', u'second@example.com', u'third@example.com'])
+        with SmtpTransport() as transport:
+            with self.assertNumQueries(1):
+                transport.send_message(msg)
+        self.assertItemsEqual(Recipient.objects.filter(message=msg).values_list(u'status', flat=True),
+                [Recipient.STATUSES.SENT] * 3)
+
+    def test_smtpbench_command(self):
+        stdout = StringIO()
+        call_command(u'smtpbench', host=u'127.0.0.1', port=self.server.port, count=6,
+                batch_size=2, stdout=stdout)
+        self.assertEqual(len(self.server.received), 12)
+        # 3 batches with a new connection each and 3 batches over a single pooled connection
+        self.assertEqual(len(self.server.channels), 4)
+        self.assertIn(u'New connection per batch: 6 messages', stdout.getvalue())
+        self.assertIn(u'Pooled connection: 6 messages', stdout.getvalue())
+        self.assertIn(u'Speedup:', stdout.getvalue())
@@ -1,5 +1,7 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import functools
+
 
 class BaseTransport(object):
     def __init__(self):
@@ -21,5 +23,19 @@ class BaseTransport(object):
     def send_message(self, message):
         raise NotImplementedError
 
+    def deliver(self, messages):
+        u"""
+        Starts sending ``messages`` and yields ``(message, finish)`` pairs in the order of
+        ``messages``. Calling ``finish()`` completes sending the message. It saves recipient
+        statuses, or raises an exception if sending the message failed. Call it in the
+        transaction that marks the message as processed.
+
+        By default the message is sent by ``send_message()`` called from ``finish()``. Transports
+        that may have multiple messages in flight at once override it to start sending the
+        following messages before ``finish()`` is called for the previous ones.
+        """
+        for message in messages:
+            yield message, functools.partial(self.send_message, message)
+
     def get_messages(self):
         raise NotImplementedError
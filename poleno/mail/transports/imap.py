@@ -1,21 +1,38 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import re
 import email
 import email.header
-import email.message
+import email.errors
+from functools import partial
 from email.utils import parseaddr
 from imaplib import IMAP4, IMAP4_SSL, IMAP4_PORT, IMAP4_SSL_PORT
 
-from django.core.files.base import ContentFile
 from django.conf import settings
 
 from poleno.attachments.models import Attachment
 from poleno.utils.misc import guess_extension
 
 from .base import BaseTransport
-from ..models import Message, Recipient
+from ..mime import SpooledContent, MessageStreamParser
+from ..models import Message, Recipient, ImapMailbox
 
 
+_FETCH_UID = re.compile(r'\bUID (\d+)')
+
+def _spool_literal(read, size):
+    # IMAP literals, e.g. fetched messages, are spooled to temporary files instead of strings.
+    # Their digest is computed on the way, so we may recognize messages received before.
+    content = SpooledContent(digest=True)
+    while content.size < size:
+        chunk = read(min(size - content.size, 64*1024))
+        if not chunk:
+            raise IMAP4.abort(u'socket error: EOF')
+        content.write(chunk)
+    res = content.file()
+    res.digest = content.digest()
+    return res
+
 class ImapTransport(BaseTransport):
     def __init__(self, **kwargs):
         super(ImapTransport, self).__init__(**kwargs)
@@ -24,13 +41,20 @@ class ImapTransport(BaseTransport):
         self.port = getattr(settings, u'IMAP_PORT', IMAP4_SSL_PORT if self.ssl else IMAP4_PORT)
         self.username = getattr(settings, u'IMAP_USERNAME', u'')
         self.password = getattr(settings, u'IMAP_PASSWORD', u'')
-        self.transport = IMAP4_SSL if self.ssl else IMAP4
+        self.batch_size = getattr(settings, u'IMAP_FETCH_BATCH_SIZE', 50)
         self.connection = None
+        self.uid_validity = None
 
     def connect(self):
-        self.connection = self.transport(self.host, self.port)
+        # IMAP classes are looked up when connecting, not when the module is imported, so tests
+        # may patch them.
+        transport = IMAP4_SSL if self.ssl else IMAP4
+        self.connection = transport(self.host, self.port)
+        self.connection.read = partial(_spool_literal, self.connection.read)
         self.connection.login(self.username, self.password)
         self.connection.select()
+        _, data = self.connection.response(u'UIDVALIDITY')
+        self.uid_validity = int(data[0]) if data and data[0] else None
 
     def disconnect(self):
         self.connection.close()
@@ -52,8 +76,22 @@ class ImapTransport(BaseTransport):
         except LookupError as e:
             raise email.errors.MessageParseError(e)
 
-    def _decode_message(self, msg):
-        assert isinstance(msg, email.message.Message)
+    def _decode_message(self, fp):
+        u"""
+        Parses the message from file-like object ``fp`` with ``MessageStreamParser``. Parts are
+        decoded to spooled temporary files, so large attachments are never held in memory.
+        Returns None if the message was already received.
+        """
+        parts = []
+        def handler(headers):
+            content = SpooledContent()
+            parts.append((headers, content))
+            return content
+        msg = MessageStreamParser(handler).parse(fp)
+
+        inbound_key = Message.make_inbound_key(msg.get(u'message-id', u''), fp.digest)
+        if Message.objects.received(inbound_key).exists():
+            return None
 
         headers = {name: self._decode_header(value) for name, value in msg.items()}
         subject = self._decode_header(msg.get(u'subject', u''))
@@ -63,23 +101,20 @@ class ImapTransport(BaseTransport):
         text = u''
         html = u''
         attachments = []
-        for part in msg.walk():
-            if part.is_multipart():
-                continue
+        for part, content in parts:
             content_type = part.get_content_type()
             charset = part.get_content_charset()
-            content = part.get_payload(decode=True)
             disposition = self._decode_header(part.get(u'Content-Disposition', u''))
             is_attachment = disposition.startswith(u'attachment')
             if not text and content_type == u'text/plain' and not is_attachment:
-                text = self._decode_content(content, charset)
+                text = self._decode_content(content.read(), charset)
             elif not html and content_type == u'text/html' and not is_attachment:
-                html = self._decode_content(content, charset)
+                html = self._decode_content(content.read(), charset)
             else:
                 default = u'attachment{}'.format(guess_extension(content_type, u'.bin'))
                 filename = part.get_filename(default)
                 attachments.append(Attachment(
-                        file=ContentFile(content),
+                        file=content.file(),
                         name=filename,
                         content_type=content_type,
                         ))
@@ -108,6 +143,7 @@ class ImapTransport(BaseTransport):
                 text=text,
                 html=html,
                 headers=headers,
+                inbound_key=inbound_key,
                 )
         message.save()
 
@@ -121,19 +157,74 @@ class ImapTransport(BaseTransport):
 
         return message
 
+    def _uids(self, *criteria):
+        _, data = self.connection.uid(u'SEARCH', None, *criteria)
+        return sorted(int(uid) for uid in data[0].split()) if data and data[0] else []
+
+    def _store(self, uids, flags):
+        if uids:
+            self.connection.uid(u'STORE', u','.join(str(uid) for uid in uids), u'+FLAGS.SILENT',
+                    flags)
+
+    def _fetch(self, uids):
+        u"""
+        Fetches all messages with ``uids`` with a single command. Returns a list of ``(uid,
+        contents)`` pairs ordered by UID.
+        """
+        _, data = self.connection.uid(u'FETCH', u','.join(str(uid) for uid in uids),
+                u'(UID RFC822)')
+        res = []
+        for item in data:
+            if isinstance(item, tuple):
+                match = _FETCH_UID.search(item[0])
+                res.append([int(match.group(1)) if match else None, item[1]])
+            elif res and res[-1][0] is None and item:
+                # Some servers send UID after the message contents.
+                match = _FETCH_UID.search(item)
+                if match:
+                    res[-1][0] = int(match.group(1))
+        return sorted((uid, contents) for uid, contents in res if uid is not None)
+
     def get_messages(self):
-        # Based on django_mailbox.transports.imap.ImapTransport
-        _, inbox = self.connection.search(None, u'ALL')
-        if inbox[0]:
-            for key in inbox[0].split():
+        u"""
+        Fetches messages with UIDs above the high-water mark of the mailbox in batches of
+        ``IMAP_FETCH_BATCH_SIZE`` messages. The mark is advanced together with saving every
+        message, so if the caller saves the messages in transactions, a failed run is resumed
+        after the last saved message. Fetched messages are flagged as deleted after every batch
+        and expunged at the end. Messages that fail to parse are flagged and left in the mailbox.
+        Messages that were already received are deleted without saving them again.
+        """
+        key = u'{}@{}:{}/INBOX'.format(self.username, self.host, self.port)
+        mailbox, _ = ImapMailbox.objects.get_or_create(mailbox=key)
+        if mailbox.uid_validity != self.uid_validity:
+            mailbox.uid_validity = self.uid_validity
+            mailbox.last_uid = 0
+            mailbox.save(update_fields=[u'uid_validity', u'last_uid'])
+
+        # Messages fetched by a failed run were not flagged as deleted.
+        if mailbox.last_uid:
+            self._store(self._uids(u'UID', u'1:{}'.format(mailbox.last_uid), u'UNFLAGGED',
+                    u'UNDELETED'), u'(\\Deleted)')
+
+        # Searching "N:*" returns the last message even if its UID is lower than N.
+        uids = [u for u in self._uids(u'UID', u'{}:*'.format(mailbox.last_uid + 1))
+                if u > mailbox.last_uid]
+        for first in range(0, len(uids), self.batch_size):
+            fetched = []
+            for uid, contents in self._fetch(uids[first:first+self.batch_size]):
                 try:
-                    _, contents = self.connection.fetch(key, '(RFC822)')
-                    msg = email.message_from_string(contents[0][1])
-                    message = self._decode_message(msg)
+                    message = self._decode_message(contents)
+                    parsed = True
                 except email.errors.MessageParseError:
-                    continue
-
-                yield message
-
-                self.connection.store(key, u'+FLAGS', u'\\Deleted')
-            self.connection.expunge()
+                    self._store([uid], u'(\\Flagged)')
+                    message, parsed = None, False
+                finally:
+                    contents.close()
+                mailbox.last_uid = uid
+                mailbox.save(update_fields=[u'last_uid'])
+                if message is not None:
+                    yield message
+                if parsed:
+                    fetched.append(uid)
+            self._store(fetched, u'(\\Deleted)')
+        self.connection.expunge()
@@ -0,0 +1,88 @@
+# vim: expandtab
+# -*- coding: utf-8 -*-
+import json
+import traceback
+
+from django.db import transaction
+from django.conf import settings
+
+from poleno.cron import cron_job, cron_logger, cron_count
+from poleno.utils.misc import nop
+
+from ...models import MandrillEventBatch
+from .signals import webhook_event, webhook_events
+
+
+def max_failures():
+    u"""
+    Number of failed runs after which a batch is not processed anymore.
+    """
+    return getattr(settings, u'MANDRILL_WEBHOOK_MAX_FAILURES', 5)
+
+def _send_events(events):
+    webhook_events.send(sender=None, events=events)
+    for event in events:
+        webhook_event.send(sender=None, event_type=event[u'event'], data=event)
+
+def process_event_batch(batch):
+    u"""
+    Processes events of the batch received by Mandrill webhook and deletes the batch, all in one
+    transaction. Sends ``webhook_events`` signal for all the events at once and ``webhook_event``
+    signal for every one of them. If processing the batch fails, every event is processed again
+    in its own transaction, so a single broken event does not block the others. Only the failed
+    events are kept in the batch and its failure counter is increased. The batch is left for the
+    next run until it fails ``MANDRILL_WEBHOOK_MAX_FAILURES`` times. Returns True if all the
+    events were processed.
+    """
+    events = None
+    try:
+        events = json.loads(batch.events)
+        with transaction.atomic():
+            _send_events(events)
+            MandrillEventBatch.objects.filter(pk=batch.pk).delete()
+            nop() # To let tests raise testing exception here.
+        cron_logger.info(u'Processed {} Mandrill webhook events.'.format(len(events)))
+        return True
+    except Exception:
+        trace = unicode(traceback.format_exc(), u'utf-8')
+        cron_logger.error(u'Processing Mandrill webhook events failed: {}\n{}'.format(
+                batch, trace))
+
+    failed = []
+    for event in events or []:
+        try:
+            with transaction.atomic():
+                _send_events([event])
+                nop() # To let tests raise testing exception here.
+        except Exception:
+            trace = unicode(traceback.format_exc(), u'utf-8')
+            cron_logger.error(u'Processing Mandrill webhook event failed: {}\n{}'.format(
+                    batch, trace))
+            failed.append(event)
+
+    if events is not None and not failed:
+        batch.delete()
+        cron_logger.info(u'Processed {} Mandrill webhook events one by one.'.format(len(events)))
+        return True
+
+    if events is not None:
+        batch.events = json.dumps(failed)
+    batch.failures += 1
+    batch.save(update_fields=[u'events', u'failures'])
+    if batch.failures >= max_failures():
+        cron_logger.error(u'Giving up Mandrill webhook events after {} failures: {}'.format(
+                batch.failures, batch))
+    return False
+
+@cron_job(run_every_mins=1)
+def webhook():
+    # Batches are fetched one by one, as they may be large.
+    pks = list(MandrillEventBatch.objects
+            .failed_less_than(max_failures())
+            .order_by_pk()
+            .values_list(u'pk', flat=True))
+    cron_count(examined=len(pks))
+    for pk in pks:
+        batch = MandrillEventBatch.objects.get_or_none(pk=pk)
+        if batch is not None and process_event_batch(batch):
+            cron_count(acted=1)
@@ -1,42 +1,99 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
-from base64 import b64decode
+import json
+import hashlib
+from collections import defaultdict
 
-from django.core.files.base import ContentFile
 from django.dispatch import Signal, receiver
 
 from poleno.attachments.models import Attachment
 
+from ...mime import SpooledContent, Base64Decoder, IdentityDecoder
 from ...models import Message, Recipient
 
 
 webhook_event = Signal(providing_args=['event_type', 'data'])
+webhook_events = Signal(providing_args=['events'])
 
-@receiver(webhook_event)
-def message_status_webhook_event(sender, event_type, data, **kwargs):
+def _decode_attachment(content, base64):
+    u"""
+    Decodes attachment content in pieces to ``SpooledContent``, so the decoded content is never
+    held in memory as a whole next to the encoded one.
+    """
+    if isinstance(content, unicode):
+        content = content.encode(u'ascii' if base64 else u'utf-8')
+    res = SpooledContent()
+    decoder = Base64Decoder(res, strict=True) if base64 else IdentityDecoder(res)
+    chunk_size = 64*1024
+    for i in range(0, len(content), chunk_size):
+        decoder.write(content[i:i+chunk_size])
+    decoder.close()
+    return res
+
+def _event_status(event_type):
     if event_type == u'deferral':
-        status = Recipient.STATUSES.QUEUED
+        return Recipient.STATUSES.QUEUED
     elif event_type in [u'soft_bounce', u'hard_bounce', u'spam', u'reject']:
-        status = Recipient.STATUSES.REJECTED
+        return Recipient.STATUSES.REJECTED
     elif event_type == u'send':
-        status = Recipient.STATUSES.SENT
+        return Recipient.STATUSES.SENT
     elif event_type in [u'open', u'click']:
-        status = Recipient.STATUSES.OPENED
+        return Recipient.STATUSES.OPENED
     else:
+        return None
+
+@receiver(webhook_events)
+def message_status_webhook_events(sender, events, **kwargs):
+    u"""
+    Updates recipient statuses for all message status events of the batch. Recipients are looked
+    up with a single query and updated with a single query for every distinct status. If there
+    are more events for the same recipient, the last one wins. Events matching no recipients or
+    more than one recipient are ignored.
+    """
+    changes = {}
+    for event in events:
+        status = _event_status(event.get(u'event'))
+        if status is not None and u'_id' in event:
+            changes[event[u'_id']] = (status, event[u'event'])
+    if not changes:
         return
 
-    try:
-        recipient = Recipient.objects.get(remote_id=data['_id'])
-        recipient.status = status
-        recipient.status_details = event_type
-        recipient.save(update_fields=[u'status', u'status_details'])
-    except (Recipient.DoesNotExist, Recipient.MultipleObjectsReturned):
-        pass
+    recipients = defaultdict(list)
+    for recipient in Recipient.objects.filter(remote_id__in=changes.keys()):
+        recipients[recipient.remote_id].append(recipient)
+
+    groups = defaultdict(list)
+    for remote_id, change in changes.items():
+        if len(recipients[remote_id]) == 1:
+            groups[change].append(recipients[remote_id][0].pk)
+    for (status, event_type), pks in groups.items():
+        Recipient.objects.filter(pk__in=pks).update(status=status, status_details=event_type)
+
+def _inbound_key(msg):
+    # Mandrill posts an event with the same raw message for each of our addresses the message was
+    # sent to, so the address is a part of the digest.
+    # Headers are stored as they are posted, either as a dict or as a sequence of pairs.
+    headers = msg.get(u'headers') or ()
+    if isinstance(headers, dict):
+        headers = headers.items()
+    message_id = next((v for k, v in headers if k.lower() == u'message-id'), None)
+    if not isinstance(message_id, unicode):
+        message_id = u''
+    raw = msg.get(u'raw_msg') or json.dumps(msg, sort_keys=True)
+    if isinstance(raw, unicode):
+        raw = raw.encode(u'utf-8')
+    received_for = (msg.get(u'email') or u'').encode(u'utf-8')
+    digest = hashlib.sha1(received_for + b'\n' + raw).hexdigest()
+    return Message.make_inbound_key(message_id, digest)
 
 @receiver(webhook_event)
 def inbound_email_webhook_event(sender, event_type, data, **kwargs):
     if event_type == u'inbound' and u'msg' in data:
         msg = data[u'msg']
+        inbound_key = _inbound_key(msg)
+        if Message.objects.received(inbound_key).exists():
+            return
+
         headers = msg.get(u'headers', ())
         from_name = msg.get(u'from_name', u'')
         from_mail = msg.get(u'from_email', u'')
@@ -62,11 +119,10 @@ def inbound_email_webhook_event(sender, event_type, data, **kwargs):
         for attch in msg.get(u'attachments', {}).values():
             filename = attch.get(u'name', u'')
             content_type = attch.get(u'type', u'')
-            content = attch.get(u'content', u'')
-            if attch.get(u'base64', False):
-                content = b64decode(content)
+            content = _decode_attachment(attch.get(u'content', u''),
+                    attch.get(u'base64', False))
             attachments.append(Attachment(
-                    file=ContentFile(content),
+                    file=content.file(),
                     name=filename,
                     content_type=content_type,
                     ))
@@ -81,6 +137,7 @@ def inbound_email_webhook_event(sender, event_type, data, **kwargs):
                 text=text,
                 html=html,
                 headers=headers,
+                inbound_key=inbound_key,
                 )
         message.save()
 
@@ -1,29 +1,127 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import sys
 import json
 import base64
 import requests
-from collections import defaultdict
+import functools
+from collections import defaultdict, deque
+from multiprocessing.pool import ThreadPool
 
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 
-from poleno.utils.misc import squeeze
+from poleno.utils.misc import squeeze, random_string
 
+from ...models import Recipient
 from ..base import BaseTransport
 
 
+def _reraise(exc_info):
+    raise exc_info[0], exc_info[1], exc_info[2]
+
+class _AttachmentContent(object):
+    u"""
+    Base64 encoded content of an attachment file. The file is read and encoded in chunks only
+    when the content is iterated. The length of the encoded content is known in advance.
+    """
+    # Multiple of 3, so the encoded chunks may be concatenated.
+    chunk_size = 3*16*1024
+
+    def __init__(self, attachment):
+        self.storage = attachment.file.storage
+        self.name = attachment.file.name
+        self.size = self.storage.size(self.name)
+
+    def __len__(self):
+        return (self.size + 2) // 3 * 4
+
+    def __iter__(self):
+        # Every iteration opens its own file, so concurrent requests do not share file positions.
+        with self.storage.open(self.name, u'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield base64.b64encode(chunk)
+
+class _JsonBody(object):
+    u"""
+    Streaming request body with JSON encoded ``data``. Attachment contents in ``data`` are given
+    as ``_AttachmentContent`` instances and they are encoded only while the body is being sent,
+    so the whole body is never held in memory. ``requests`` sends file-like bodies with known
+    length with "Content-Length" header and ``httplib`` reads them by ``read()`` in blocks.
+    """
+    def __init__(self, data):
+        contents = []
+        marker = u'attachment-content-{}'.format(random_string(20))
+        def default(obj):
+            if not isinstance(obj, _AttachmentContent):
+                raise TypeError(repr(obj) + u' is not JSON serializable')
+            contents.append(obj)
+            return marker
+        pieces = json.dumps(data, default=default).split(marker.encode(u'ascii'))
+        self.parts = [pieces[0]]
+        for content, piece in zip(contents, pieces[1:]):
+            self.parts.extend([content, piece])
+        self.iterator = None
+        self.buffer = b''
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, _AttachmentContent):
+                for chunk in part:
+                    yield chunk
+            else:
+                yield part
+
+    def read(self, size=-1):
+        if self.iterator is None:
+            self.iterator = iter(self)
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.iterator, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            res, self.buffer = self.buffer, b''
+        else:
+            res, self.buffer = self.buffer[:size], self.buffer[size:]
+        return res
+
 class MandrillTransport(BaseTransport):
     def __init__(self, **kwargs):
         super(MandrillTransport, self).__init__(**kwargs)
         self.api_key = getattr(settings, u'MANDRILL_API_KEY', None)
         self.api_url = getattr(settings, u'MANDRILL_API_URL', u'https://mandrillapp.com/api/1.0')
         self.api_send = self.api_url.rstrip(u'/') + u'/messages/send.json'
+        self.concurrency = getattr(settings, u'MANDRILL_CONCURRENCY', 4)
+        self.session = None
+        self.pool = None
 
         if self.api_key is None:
             raise ImproperlyConfigured(u'Setting MANDRILL_API_KEY is not set.')
 
-    def send_message(self, message):
+    def connect(self):
+        # Keep-alive connections are reused by all requests of the session.
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                pool_maxsize=self.concurrency)
+        self.session.mount(u'https://', adapter)
+        self.session.mount(u'http://', adapter)
+        self.pool = ThreadPool(self.concurrency)
+
+    def disconnect(self):
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        self.session.close()
+        self.session = None
+
+    def _prepare(self, message):
         assert message.type == message.TYPES.OUTBOUND
         assert message.processed is None
 
@@ -63,21 +161,31 @@ class MandrillTransport(BaseTransport):
             attch = {}
             attch[u'type'] = attachment.content_type
             attch[u'name'] = attachment.name
-            attch[u'content'] = base64.b64encode(attachment.content)
+            attch[u'content'] = _AttachmentContent(attachment)
             msg[u'attachments'].append(attch)
 
         data = {}
         data[u'key'] = self.api_key
         data[u'message'] = msg
 
-        response = requests.post(self.api_send, data=json.dumps(data))
+        return _JsonBody(data), recipients
+
+    def _post(self, message_pk, data):
+        # Called from pool threads. It must not touch the database.
+        session = self.session or requests
+        response = session.post(self.api_send, data=data)
 
         if response.status_code != 200:
             raise RuntimeError(squeeze(u"""
                     Sending Message(pk={}) failed with status code {}. Mandrill response: {}
-                    """).format(message.pk, response.status_code, response.text))
+                    """).format(message_pk, response.status_code, response.text))
 
-        for rcp in response.json():
+        return response.json()
+
+    def _finish(self, recipients, get_response):
+        response = get_response()
+        changed = []
+        for rcp in response:
             for recipient in recipients[rcp[u'email']]:
                 recipient.remote_id = rcp[u'_id']
 
@@ -93,4 +201,36 @@ class MandrillTransport(BaseTransport):
                 else:
                     recipient.status = recipient.STATUSES.UNDEFINED
 
-                recipient.save(update_fields=[u'remote_id', u'status', u'status_details'])
+                changed.append(recipient)
+        Recipient.save_statuses(changed)
+
+    def send_message(self, message):
+        data, recipients = self._prepare(message)
+        response = self._post(message.pk, data)
+        self._finish(recipients, lambda: response)
+
+    def deliver(self, messages):
+        u"""
+        Posts the messages to Mandrill from a pool of ``MANDRILL_CONCURRENCY`` threads. At most
+        that many messages are in flight at once. Messages are prepared in the calling thread and
+        recipient statuses are saved from ``finish()``, so pool threads don't touch the database.
+        """
+        if self.pool is None:
+            for res in super(MandrillTransport, self).deliver(messages):
+                yield res
+            return
+
+        pending = deque()
+        for message in messages:
+            try:
+                data, recipients = self._prepare(message)
+            except Exception:
+                # Raise it from ``finish()``, so the messages already in flight are finished.
+                pending.append((message, functools.partial(_reraise, sys.exc_info())))
+            else:
+                result = self.pool.apply_async(self._post, (message.pk, data))
+                pending.append((message, functools.partial(self._finish, recipients, result.get)))
+            if len(pending) >= self.concurrency:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
@@ -14,7 +14,7 @@ from django.conf import settings
 
 from poleno.utils.views import secure_required
 
-from .signals import webhook_event
+from ...models import MandrillEventBatch
 
 
 @require_http_methods([u'HEAD', u'GET', u'POST'])
@@ -58,11 +58,17 @@ def webhook(request):
         else:
             raise PermissionDenied(u'Signature does not match')
 
+        # Events are only stored here and processed later by ``webhook`` cron job, so we respond
+        # quickly even to large batches and Mandrill does not retry them.
+        events = request.POST.get(u'mandrill_events')
         try:
-            data = json.loads(request.POST.get(u'mandrill_events'))
+            data = json.loads(events)
         except (TypeError, ValueError):
             raise SuspiciousOperation(u'Request syntax error')
-        for event in data:
-            webhook_event.send(sender=None, event_type=event['event'], data=event)
+        if not isinstance(data, list) or not all(isinstance(e, dict) and u'event' in e
+                for e in data):
+            raise SuspiciousOperation(u'Request syntax error')
+        if data:
+            MandrillEventBatch.objects.create(events=events)
 
     return HttpResponse()
@@ -1,23 +1,129 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import time
+import select
+import socket
+import smtplib
+import threading
+from collections import deque
+
 from django.core.mail import get_connection, EmailMultiAlternatives, EmailMessage
+from django.conf import settings
 
+from ..models import Recipient
 from .base import BaseTransport
 
 
+class SmtpConnectionPool(object):
+    u"""
+    Pool of open SMTP connections kept for the whole life of the process, so consecutive cron runs
+    and mail worker batches reuse the same TCP and TLS session instead of opening a new one for
+    every batch. A connection is checked with NOOP before it is handed out again. Connections
+    idle longer than ``EMAIL_SMTP_POOL_MAX_IDLE`` seconds are closed without checking, as most
+    servers drop idle clients anyway. At most ``EMAIL_SMTP_POOL_SIZE`` idle connections are kept.
+    """
+    backend = u'django.core.mail.backends.smtp.EmailBackend'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = deque() # (key, connection, released) triples
+
+    def _key(self):
+        # Connections opened with different settings must not be mixed, e.g. in tests.
+        return (settings.EMAIL_HOST, settings.EMAIL_PORT, settings.EMAIL_HOST_USER,
+                settings.EMAIL_USE_TLS, getattr(settings, u'EMAIL_USE_SSL', False))
+
+    def _is_healthy(self, connection):
+        if connection.connection is None:
+            return False
+        try:
+            return connection.connection.noop()[0] == 250
+        except Exception:
+            # Whatever went wrong, the connection is not usable.
+            return False
+
+    def is_closed(self, connection):
+        u"""
+        Checks without a round trip to the server whether the server closed ``connection`` or
+        announced it is closing it. There is nothing to read from a connection in use between
+        two commands otherwise.
+        """
+        sock = getattr(connection.connection, u'sock', None)
+        if sock is None:
+            return True
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except Exception:
+            return True
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except (smtplib.SMTPException, socket.error):
+            # The connection is broken already, there is nothing more to close.
+            pass
+
+    def acquire(self):
+        u"""
+        Returns a healthy pooled connection, or opens a new one.
+        """
+        key = self._key()
+        max_idle = getattr(settings, u'EMAIL_SMTP_POOL_MAX_IDLE', 240)
+        while True:
+            with self.lock:
+                found = next((c for c in self.idle if c[0] == key), None)
+                if found is None:
+                    break
+                self.idle.remove(found)
+            _, connection, released = found
+            if time.time() - released < max_idle and self._is_healthy(connection):
+                return connection
+            self._close(connection)
+
+        connection = get_connection(self.backend)
+        connection.open()
+        return connection
+
+    def release(self, connection, broken=False):
+        u"""
+        Returns ``connection`` to the pool. Broken connections and connections exceeding the pool
+        size are closed.
+        """
+        if not broken:
+            with self.lock:
+                if len(self.idle) < getattr(settings, u'EMAIL_SMTP_POOL_SIZE', 2):
+                    self.idle.append((self._key(), connection, time.time()))
+                    return
+        self._close(connection)
+
+    def clear(self):
+        u"""
+        Closes all idle connections. Tests should call it before and after using the pool, so no
+        connections are carried over between them.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, deque()
+        for _, connection, _ in idle:
+            self._close(connection)
+
+pool = SmtpConnectionPool()
+
 class SmtpTransport(BaseTransport):
     def __init__(self, *args, **kwargs):
         super(SmtpTransport, self).__init__(*args, **kwargs)
         self.connection = None
 
     def connect(self):
-        self.connection = get_connection(u'django.core.mail.backends.smtp.EmailBackend')
-        self.connection.open()
+        self.connection = pool.acquire()
 
     def disconnect(self):
-        self.connection.close()
+        pool.release(self.connection)
         self.connection = None
 
+    def reconnect(self):
+        pool.release(self.connection, broken=True)
+        self.connection = pool.acquire()
+
     def send_message(self, message):
         assert message.type == message.TYPES.OUTBOUND
         assert message.processed is None
@@ -29,7 +135,7 @@ class SmtpTransport(BaseTransport):
         kwargs[u'to'] = (r.formatted for r in message.recipients_to)
         kwargs[u'cc'] = (r.formatted for r in message.recipients_cc)
         kwargs[u'bcc'] = (r.formatted for r in message.recipients_bcc)
-        kwargs[u'attachments'] = ((a.name, a.content, a.content_type) for a in message.attachments)
+        kwargs[u'attachments'] = [(a.name, a.content, a.content_type) for a in message.attachments]
         kwargs[u'headers'] = message.headers
 
         if message.text and message.html:
@@ -41,8 +147,14 @@ class SmtpTransport(BaseTransport):
         else:
             msg = EmailMessage(body=message.text, **kwargs)
 
+        # The server may have closed the connection since the previous message. If it fails once
+        # the message is being sent, we can't tell whether the server received the message, so
+        # we don't retry it and leave it for the next run after its claim expires.
+        if pool.is_closed(self.connection):
+            self.reconnect()
+            msg.connection = self.connection
         msg.send()
 
         for recipient in message.recipients:
             recipient.status = recipient.STATUSES.SENT
-            recipient.save(update_fields=[u'status'])
+        Recipient.save_statuses(message.recipients)
@@ -160,3 +160,35 @@ class QuerySet(models.query.QuerySet):
         Applies ``func`` on the queryset.
         """
         return func(self)
+
+    def chunks(self, chunk_size=1000):
+        u"""
+        Iterates over the queryset in chunks of at most ``chunk_size`` instances ordered by
+        primary key. Yields lists of instances. Every chunk is fetched by its own query paginated
+        by the last seen primary key, so ``prefetch_related`` lookups are applied per chunk and
+        every chunk may be garbage collected as soon as it is processed. Any ordering of the
+        queryset is ignored.
+
+        Example:
+            for chunk in Book.objects.prefetch_related(u'author_set').chunks(100):
+                for book in chunk:
+                    ...
+        """
+        queryset = self.order_by(u'pk')
+        while True:
+            chunk = list(queryset[:chunk_size])
+            if not chunk:
+                break
+            yield chunk
+            if len(chunk) < chunk_size:
+                break
+            queryset = self.order_by(u'pk').filter(pk__gt=chunk[-1].pk)
+
+    def chunked(self, chunk_size=1000):
+        u"""
+        Iterates over the queryset instances ordered by primary key fetching them in chunks of
+        ``chunk_size`` instances. See ``chunks()``.
+        """
+        for chunk in self.chunks(chunk_size):
+            for obj in chunk:
+                yield obj
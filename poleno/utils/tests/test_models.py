@@ -324,3 +324,27 @@ class QuerySetTest(TestCase):
         func = lambda q: q.filter(type=TestModelsModel.TYPES.BLACK)
         res = TestModelsModel.objects.apply(func)
         self.assertItemsEqual(res, [self.black1, self.black2])
+
+    def test_chunks(self):
+        res = TestModelsModel.objects.chunks(2)
+        self.assertEqual(list(res), [[self.black1, self.black2], [self.white, self.red], [self.blue]])
+
+    def test_chunks_with_exact_number_of_chunks(self):
+        res = TestModelsModel.objects.exclude(pk=self.blue.pk).chunks(2)
+        self.assertEqual(list(res), [[self.black1, self.black2], [self.white, self.red]])
+
+    def test_chunks_with_empty_queryset(self):
+        res = TestModelsModel.objects.none().chunks(2)
+        self.assertEqual(list(res), [])
+
+    def test_chunks_ignores_ordering_and_keeps_filters(self):
+        res = TestModelsModel.objects.filter(type=TestModelsModel.TYPES.BLACK).order_by(u'-name').chunks(1)
+        self.assertEqual(list(res), [[self.black1], [self.black2]])
+
+    def test_chunks_queries(self):
+        with self.assertNumQueries(3):
+            res = list(TestModelsModel.objects.chunks(2))
+
+    def test_chunked(self):
+        res = TestModelsModel.objects.chunked(2)
+        self.assertEqual(list(res), [self.black1, self.black2, self.white, self.red, self.blue])
@@ -1,12 +1,13 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
 import mock
-from datetime import date
+from datetime import date, timedelta
 
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
-from poleno.workdays.workdays import between, HolidaySet, FixedHoliday, EasterHoliday, SPECIFY_HOLIDAY_SET_ERROR
+from poleno.workdays.workdays import between, advance, HolidaySet, FixedHoliday, EasterHoliday, SPECIFY_HOLIDAY_SET_ERROR
+from poleno.workdays.workdays import WorkdayCalendar, _between, _advance
 
 class WorkdaysTest(TestCase):
     u"""
@@ -185,3 +186,106 @@ class WorkdaysTest(TestCase):
         # 2019-04-22 MON: fixed day holiday
         # 2019-04-23 TUE: easter based holiday
         self.assertEqual(between(date(2019, 4, 20), date(2019, 4, 23), holidays), 0) # SAT -- TUE
+
+    def test_holiday_expansion_cache(self):
+        u"""
+        Checks that holidays and holiday sets expand every year only once and count cache hits and
+        misses.
+        """
+        fixed = FixedHoliday(month=10, day=10)
+        easter = EasterHoliday(days=1, first_year=2010)
+        holidays = HolidaySet(fixed, easter)
+
+        with mock.patch.object(easter, u'for_year', wraps=easter.for_year) as for_year:
+            self.assertEqual(len(holidays.between(date(2009, 1, 1), date(2015, 1, 1))), 11)
+            self.assertEqual(len(holidays.between(date(2009, 1, 1), date(2015, 1, 1))), 11)
+            self.assertEqual(holidays.between(date(2012, 1, 1), date(2012, 12, 31)),
+                    {date(2012, 4, 9), date(2012, 10, 10)})
+            # Years 2010 to 2015 expanded once; Year 2009 is before the holiday took effect.
+            self.assertEqual(for_year.call_count, 6)
+
+        self.assertEqual(holidays.cache_info().misses, 7)
+        self.assertEqual(holidays.cache_info().hits, 8)
+        self.assertEqual(holidays.cache_info().currsize, 7)
+        self.assertEqual(easter.cache_info().misses, 6)
+        self.assertEqual(easter.cache_info().hits, 0)
+
+        holidays.cache_clear()
+        self.assertEqual(holidays.cache_info(), (0, 0, holidays.cache_info().maxsize, 0))
+        self.assertEqual(fixed.cache_info(), (0, 0, fixed.cache_info().maxsize, 0))
+
+    def test_holiday_expansion_cache_is_bounded(self):
+        u"""
+        Checks that the least recently used years are evicted from the holiday expansion cache.
+        """
+        with mock.patch(u'poleno.workdays.workdays.YEAR_CACHE_SIZE', 3):
+            holiday = FixedHoliday(month=10, day=10)
+        for year in [2010, 2011, 2012, 2010, 2013, 2010, 2011]:
+            holiday.in_year(year)
+        self.assertEqual(holiday.cache_info(), (2, 5, 3, 3))
+        self.assertEqual(holiday.between(date(2011, 1, 1), date(2014, 1, 1)),
+                [date(2011, 10, 10), date(2012, 10, 10), date(2013, 10, 10)])
+
+class WorkdayCalendarTest(TestCase):
+    u"""
+    Tests ``WorkdayCalendar`` class and its use by ``between()`` and ``advance()`` functions.
+    """
+
+    def setUp(self):
+        self.holidays = HolidaySet(
+                FixedHoliday(month=10, day=8, first_year=2008),
+                FixedHoliday(month=12, day=31),
+                FixedHoliday(month=1, day=1),
+                EasterHoliday(days=-2),
+                EasterHoliday(days=1),
+                )
+
+    def test_calendar_matches_direct_computation(self):
+        u"""
+        Checks that the calendar gives the same results as the direct computation from the holiday
+        set for intervals across year boundaries and Easter.
+        """
+        calendar = WorkdayCalendar(self.holidays, 2012, 2016)
+        days = [date(2013, 12, 20) + timedelta(days=d) for d in range(20)]
+        days += [date(2014, 4, 14) + timedelta(days=d) for d in range(14)]
+        for a in days:
+            for b in days:
+                self.assertEqual(calendar.between(a, b), _between(a, b, self.holidays))
+            for delta in range(-20, 21):
+                self.assertEqual(calendar.advance(a, delta), _advance(a, delta, self.holidays))
+
+    def test_calendar_window(self):
+        u"""
+        Checks that the calendar refuses to answer for days outside its window.
+        """
+        calendar = WorkdayCalendar(self.holidays, 2012, 2016)
+        self.assertEqual(calendar.between(date(2011, 12, 30), date(2012, 1, 5)), None)
+        self.assertEqual(calendar.between(date(2016, 12, 30), date(2017, 1, 5)), None)
+        self.assertEqual(calendar.advance(date(2011, 12, 30), 3), None)
+        self.assertEqual(calendar.advance(date(2016, 12, 28), 3), None)
+        self.assertEqual(calendar.advance(date(2012, 1, 3), -3), None)
+        self.assertEqual(calendar.advance(date(2016, 12, 28), 1), date(2016, 12, 29))
+        self.assertEqual(calendar.advance(date(2012, 1, 5), -2), date(2012, 1, 3))
+
+    def test_fallback_outside_window(self):
+        u"""
+        Checks that ``between()`` and ``advance()`` fall back to the direct computation for days
+        outside the calendar window.
+        """
+        with mock.patch(u'poleno.workdays.workdays.CALENDAR_WINDOW', 0):
+            holidays = HolidaySet(FixedHoliday(month=10, day=10))
+            self.assertEqual(between(date(1990, 10, 8), date(1990, 10, 12), holidays), 3) # MON -- FRI
+            self.assertEqual(advance(date(1990, 10, 8), 3, holidays), date(1990, 10, 12)) # MON -> FRI
+            self.assertEqual(advance(date(1990, 10, 12), -3, holidays), date(1990, 10, 8)) # FRI -> MON
+
+    def test_advance_invariants(self):
+        u"""
+        Checks ``advance()`` invariants for deadlines of 1 to 60 workdays.
+        """
+        day = date(2014, 12, 15)
+        for delta in range(1, 61):
+            res = advance(day, delta, self.holidays)
+            self.assertEqual(between(day, res, self.holidays), delta)
+            self.assertEqual(advance(res, -delta, self.holidays) <= day, True)
+            self.assertEqual(advance(advance(day, 7, self.holidays), delta, self.holidays),
+                    advance(day, delta + 7, self.holidays))
@@ -1,6 +1,10 @@
 # vim: expandtab
 # -*- coding: utf-8 -*-
+import array
+import bisect
+import collections
 import datetime
+import weakref
 from dateutil.easter import easter
 
 from django.core.exceptions import ImproperlyConfigured
@@ -11,6 +15,12 @@ from poleno.utils.misc import FormatMixin
 
 WEEKEND = [5, 6]
 
+# Number of years before and after the current year covered by precomputed workday calendars.
+CALENDAR_WINDOW = 10
+
+# Maximal number of years with cached holiday expansions kept by every holiday and holiday set.
+YEAR_CACHE_SIZE = 64
+
 SPECIFY_HOLIDAY_SET_ERROR = u'Specify holiday_set or set global setting HOLIDAYS_MODULE_PATH.'
 
 def _holidays():
@@ -22,24 +32,77 @@ def _holidays():
     return module.HOLIDAYS
 
 
+CacheInfo = collections.namedtuple(u'CacheInfo', u'hits misses maxsize currsize')
+
+class YearCache(object):
+    u"""
+    Bounded LRU cache of per-year holiday expansions. Counts cache hits and misses, so we can see
+    how effective the cache is.
+    """
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize or YEAR_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, year, func):
+        u"""
+        Returns cached ``func(year)``. Calls ``func`` only if the year is not cached yet.
+        """
+        try:
+            res = self._data.pop(year)
+        except KeyError:
+            self.misses += 1
+            res = func(year)
+            if len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+        else:
+            self.hits += 1
+        self._data[year] = res
+        return res
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self._data.clear()
+
 class Holiday(object):
     def __init__(self, first_year=None, last_year=None):
         self.first_year = first_year
         self.last_year = last_year
+        self._cache = YearCache()
 
     def between(self, after, before):
         u"""
         List of holidays in interval (after, before]
         """
-        first_year = max(self.first_year, after.year) if self.first_year else after.year
-        last_year = min(self.last_year, before.year) if self.last_year else before.year
-        return [d for y in range(first_year, last_year+1)
-                  for d in self.for_year(y)
+        return [d for y in range(after.year, before.year+1)
+                  for d in self.in_year(y)
                   if after < d <= before]
 
+    def in_year(self, year):
+        u"""
+        Cached list of holidays for ``year``. Empty if the holiday was not in effect in ``year``.
+        The returned list must not be modified.
+        """
+        if self.first_year and year < self.first_year:
+            return []
+        if self.last_year and year > self.last_year:
+            return []
+        return self._cache.get(year, self.for_year)
+
     def for_year(self, year):
         raise NotImplementedError
 
+    def cache_info(self):
+        return self._cache.info()
+
+    def cache_clear(self):
+        self._cache.clear()
+
 class FixedHoliday(FormatMixin, Holiday):
     def __init__(self, **kwargs):
         self.day = kwargs.pop(u'day')
@@ -72,40 +135,108 @@ class HolidaySet(FormatMixin, object):
         Accepts Holiday objects
         """
         self.holidays = args
+        self._cache = YearCache()
 
     def between(self, after, before):
         u"""
         Set of unique holidays in interval (after, before].
         """
-        return set(d for h in self.holidays
-                     for d in h.between(after, before))
+        return set(d for y in range(after.year, before.year+1)
+                     for d in self.in_year(y)
+                     if after < d <= before)
+
+    def in_year(self, year):
+        u"""
+        Cached frozen set of unique holidays for ``year``.
+        """
+        return self._cache.get(year, self.for_year)
+
+    def for_year(self, year):
+        return frozenset(d for h in self.holidays for d in h.in_year(year))
+
+    def cache_info(self):
+        return self._cache.info()
+
+    def cache_clear(self):
+        self._cache.clear()
+        for h in self.holidays:
+            h.cache_clear()
 
     def __unicode__(self):
         return u', '.join(format(h) for h in self.holidays)
 
 
-def between(after, before, holiday_set=None):
+class WorkdayCalendar(object):
     u"""
-    Returns number of working days between ``after`` and ``before`` excluding ``after`` and
-    including ``before``. If ``a`` is the day we submitted something and ``b`` is today, then today
-    is the last full day of a ``d`` days long deadline if: ``between(a, b) == d``, and the deadline
-    is missed if: ``between(a, b) > d``.
+    Precomputed calendar of cumulative workday ordinals for years ``first_year`` to ``last_year``
+    inclusive. The ordinal of a day is the number of workdays since the beginning of the calendar
+    window up to and including the day. Number of workdays between two days within the window is
+    then a difference of their ordinals and advancing a day by some workdays is a binary search
+    for the target ordinal. Both operations return None if the result is not determined by the
+    window, in which case the caller should fall back to the direct computation.
+    """
+    def __init__(self, holiday_set, first_year, last_year):
+        self.first = datetime.date(first_year, 1, 1)
+        self.last = datetime.date(last_year, 12, 31)
+        holidays = holiday_set.between(self.first - datetime.timedelta(days=1), self.last)
+        self.ordinals = array.array(b'l')
+        ordinal = 0
+        for d in range((self.last - self.first).days + 1):
+            day = self.first + datetime.timedelta(days=d)
+            if day.weekday() not in WEEKEND and day not in holidays:
+                ordinal += 1
+            self.ordinals.append(ordinal)
 
-    The following invariants hold:
-        between(a, a) == 0
-        between(a, b) == -between(b, a)
-        between(a, b) == between(a, x) + between(x, b)
-        between(a, a+1) == 1 iff a+1 is workday; 0 otherwise
+    def contains(self, day):
+        return self.first <= day <= self.last
+
+    def between(self, after, before):
+        if not self.contains(after) or not self.contains(before):
+            return None
+        return self.ordinals[(before - self.first).days] - self.ordinals[(after - self.first).days]
+
+    def advance(self, day, delta):
+        if not self.contains(day):
+            return None
+        if delta == 0:
+            return day
+        target = self.ordinals[(day - self.first).days] + delta
+        if delta > 0:
+            # The first day with the target ordinal; It's the workday the ordinal was reached.
+            idx = bisect.bisect_left(self.ordinals, target)
+            if idx >= len(self.ordinals):
+                return None
+        else:
+            # The last day with the target ordinal; It's the day before the next workday.
+            idx = bisect.bisect_right(self.ordinals, target) - 1
+            if idx < 0:
+                return None
+        return self.first + datetime.timedelta(days=idx)
+
+_calendars = weakref.WeakKeyDictionary()
+
+def _calendar(holiday_set):
+    u"""
+    Returns ``WorkdayCalendar`` for ``holiday_set`` covering ``CALENDAR_WINDOW`` years before and
+    after the current year. The calendar is built only once per process for every holiday set.
+    """
+    try:
+        return _calendars[holiday_set]
+    except KeyError:
+        year = datetime.date.today().year
+        calendar = WorkdayCalendar(holiday_set, year - CALENDAR_WINDOW, year + CALENDAR_WINDOW)
+        _calendars[holiday_set] = calendar
+        return calendar
+
+def _between(after, before, holiday_set):
+    u"""
+    Computes ``between()`` directly from the holiday set. Used for days outside the calendar
+    window.
     """
     if after == before:
         return 0
     if after > before:
-        return -between(before, after, holiday_set)
-
-    if not holiday_set:
-        holiday_set = _holidays()
-    if not holiday_set:
-        raise ImproperlyConfigured(SPECIFY_HOLIDAY_SET_ERROR)
+        return -_between(before, after, holiday_set)
 
     # Having: after < before
     days = (before - after).days
@@ -116,11 +247,73 @@ def between(after, before, holiday_set=None):
                   if d.weekday() not in WEEKEND])
     return res
 
+def _advance(day, delta, holiday_set):
+    u"""
+    Computes ``advance()`` directly from the holiday set. Used for days outside the calendar
+    window. The function time complexity is O(d log d), where d is ``delta``.
+    """
+    if delta == 0:
+        return day
+
+    res = day + datetime.timedelta(days=delta)
+    working = _between(day, res, holiday_set)
+    return _advance(res, delta - working, holiday_set)
+
+
+class Workdays(object):
+    u"""
+    Functions ``between()`` and ``advance()`` bound to a holiday set and its precomputed calendar.
+    Use it to evaluate many days at once without looking up the holiday set and its calendar for
+    every single day. If no ``holiday_set`` is given, the holiday set configured in
+    ``settings.HOLIDAYS_MODULE_PATH`` is used.
+    """
+    def __init__(self, holiday_set=None):
+        if not holiday_set:
+            holiday_set = _holidays()
+        if not holiday_set:
+            raise ImproperlyConfigured(SPECIFY_HOLIDAY_SET_ERROR)
+        self.holiday_set = holiday_set
+        self.calendar = _calendar(holiday_set)
+
+    def between(self, after, before):
+        if after == before:
+            return 0
+        res = self.calendar.between(after, before)
+        if res is None:
+            res = _between(after, before, self.holiday_set)
+        return res
+
+    def advance(self, day, delta):
+        if delta == 0:
+            return day
+        res = self.calendar.advance(day, delta)
+        if res is None:
+            res = _advance(day, delta, self.holiday_set)
+        return res
+
+
+def between(after, before, holiday_set=None):
+    u"""
+    Returns number of working days between ``after`` and ``before`` excluding ``after`` and
+    including ``before``. If ``a`` is the day we submitted something and ``b`` is today, then today
+    is the last full day of a ``d`` days long deadline if: ``between(a, b) == d``, and the deadline
+    is missed if: ``between(a, b) > d``.
+
+    The following invariants hold:
+        between(a, a) == 0
+        between(a, b) == -between(b, a)
+        between(a, b) == between(a, x) + between(x, b)
+        between(a, a+1) == 1 iff a+1 is workday; 0 otherwise
+    """
+    if after == before:
+        return 0
+    return Workdays(holiday_set).between(after, before)
+
 def advance(day, delta, holiday_set=None):
     u"""
-    Advances the given ``date`` by ``delta`` working days. The function time complexity is
-    O(d log d), where d is ``delta``. It may be fixed to be O(d), but I'm too lazy to do it now.
-    The complexity may not be better than Ω(d) because there are Ω(d) holidays.
+    Advances the given ``date`` by ``delta`` working days. Within the calendar window the function
+    time complexity is O(log n), where n is the window size in days. Outside the window it falls
+    back to O(d log d), where d is ``delta``.
 
     The following invariants hold:
         advance(a, 0) == a
@@ -130,12 +323,4 @@ def advance(day, delta, holiday_set=None):
     """
     if delta == 0:
         return day
-
-    if not holiday_set:
-        holiday_set = _holidays()
-    if not holiday_set:
-        raise ImproperlyConfigured(SPECIFY_HOLIDAY_SET_ERROR)
-
-    res = day + datetime.timedelta(days=delta)
-    working = between(day, res, holiday_set)
-    return advance(res, delta - working, holiday_set)
+    return Workdays(holiday_set).advance(day, delta)